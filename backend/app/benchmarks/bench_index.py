@@ -0,0 +1,129 @@
+"""
+Recall vs. latency of the Chroma HNSW index for different M / ef_construction / ef_search
+
+Builds one collection per (M, ef_construction) from clustered synthetic vectors,
+then for every ef_search measures single-query latency and recall@k against an
+exact NumPy search. Use it to pick index_config.json settings for a corpus size.
+
+Usage (from backend/app):
+    python benchmarks/bench_index.py --num-vectors 20000 --m 8,16,32 --ef-search 10,50,100,200
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from run_benchmarks import percentile  # noqa: E402
+from utils_vector_index import hnsw_configuration  # noqa: E402
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item]
+
+
+def generate_vectors(num_vectors: int, dimension: int, num_clusters: int, seed: int) -> np.ndarray:
+    """Unit vectors around random cluster centres, closer to real embeddings than uniform noise"""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(num_clusters, dimension))
+    assignments = rng.integers(0, num_clusters, size=num_vectors)
+    vectors = centres[assignments] + rng.normal(scale=0.6, size=(num_vectors, dimension))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype(np.float32)
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Ground-truth neighbours by L2 distance (vectors are unit length, so by dot product)"""
+    scores = queries @ vectors.T
+    top = np.argpartition(-scores, k, axis=1)[:, :k]
+    return top
+
+
+def build_collection(client, name: str, vectors: np.ndarray, settings: Dict[str, int], batch_size: int = 2000):
+    collection = client.create_collection(name, configuration=hnsw_configuration(settings), embedding_function=None)
+    start = time.perf_counter()
+    for offset in range(0, len(vectors), batch_size):
+        batch = vectors[offset:offset + batch_size]
+        collection.add(ids=[str(i) for i in range(offset, offset + len(batch))], embeddings=batch)
+    return collection, time.perf_counter() - start
+
+
+def measure(collection, queries: np.ndarray, truth: np.ndarray, k: int) -> Dict[str, float]:
+    latencies = []
+    hits = 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        result = collection.query(query_embeddings=[query], n_results=k, include=[])
+        latencies.append(time.perf_counter() - start)
+        hits += len(set(int(i) for i in result["ids"][0]) & set(expected.tolist()))
+    return {
+        "recall": hits / (len(queries) * k),
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chroma HNSW recall vs. latency benchmark")
+    parser.add_argument("--num-vectors", type=int, default=20000)
+    parser.add_argument("--dimension", type=int, default=256)
+    parser.add_argument("--clusters", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--m", type=_int_list, default=[8, 16, 32], help="Comma-separated M values")
+    parser.add_argument("--ef-construction", type=_int_list, default=[100, 200])
+    parser.add_argument("--ef-search", type=_int_list, default=[10, 50, 100, 200])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    import chromadb
+    from chromadb.api.shared_system_client import SharedSystemClient
+
+    print("🔍 Chroma HNSW Recall vs. Latency")
+    print("=" * 50)
+    vectors = generate_vectors(args.num_vectors, args.dimension, args.clusters, args.seed)
+    # Queries are perturbed corpus vectors, like questions close to some chunk
+    rng = np.random.default_rng(args.seed + 1)
+    queries = vectors[rng.integers(0, len(vectors), size=args.queries)]
+    queries = queries + rng.normal(scale=0.05, size=queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    truth = exact_top_k(vectors, queries, args.k)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="infopop-index-") as work_dir:
+        client = chromadb.PersistentClient(path=work_dir)
+        for m in args.m:
+            for ef_construction in args.ef_construction:
+                settings = {"space": "l2", "M": m, "ef_construction": ef_construction, "ef_search": args.ef_search[0]}
+                name = f"bench-m{m}-efc{ef_construction}"
+                collection, build_seconds = build_collection(client, name, vectors, settings)
+                print(f"📦 M={m} ef_construction={ef_construction}: built {len(vectors)} vectors in {build_seconds:.1f}s")
+                for ef_search in args.ef_search:
+                    collection.modify(configuration={"hnsw": {"ef_search": ef_search}})
+                    # A loaded HNSW segment keeps its ef_search; reopen to pick up the new value
+                    SharedSystemClient.clear_system_cache()
+                    client = chromadb.PersistentClient(path=work_dir)
+                    collection = client.get_collection(name)
+                    row = {"M": m, "ef_construction": ef_construction, "ef_search": ef_search,
+                           "build_seconds": build_seconds, **measure(collection, queries, truth, args.k)}
+                    results.append(row)
+                    print(f"   ef_search={ef_search:<4} recall@{args.k} {row['recall']:.3f}  "
+                          f"p50 {row['p50_ms']:.2f} ms  p95 {row['p95_ms']:.2f} ms")
+                client.delete_collection(name)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"num_vectors": args.num_vectors, "dimension": args.dimension, "k": args.k,
+                       "results": results}, f, indent=2)
+        print(f"📝 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
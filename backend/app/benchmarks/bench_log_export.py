@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Usage reports and log export: materialized ORM scan vs. rollups and streaming
+
+Fills application_logs with synthetic rows (several models over a range of
+days) and compares:
+
+- report: per-model, per-day totals computed from every row loaded as ORM
+  objects (what a report over get_recent_logs-style queries costs) vs. a read
+  of the incrementally maintained rollups
+- export: all rows loaded as ORM objects and serialized vs. the streaming
+  NDJSON export (plain and zstd), with the peak traced memory of each
+- insert: the cost the rollup upsert adds to each log insert
+
+Usage (from backend/app):
+    python benchmarks/bench_log_export.py --rows 200000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Callable, Dict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from run_benchmarks import configure_environment  # noqa: E402
+
+MODELS = ("gpt-3.5-turbo", "gpt-4", "gpt-4.1")
+
+
+def measure(fn: Callable[[], object]) -> Dict[str, float]:
+    """Wall time and peak traced memory of fn()"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"seconds": seconds, "peak_mb": peak / 1e6, "result": result}
+
+
+def fill_logs(rows: int, days: int, seed: int):
+    from sqlalchemy import insert
+
+    from database import engine
+    from utils_db import ApplicationLog, rebuild_log_rollups
+
+    rng = random.Random(seed)
+    words = [f"word{i}" for i in range(2000)]
+    start = datetime(2026, 1, 1)
+    batch = []
+    with engine.begin() as connection:
+        for i in range(rows):
+            batch.append({
+                "session_id": f"session-{rng.randrange(rows // 10 + 1)}",
+                "user_query": " ".join(rng.choices(words, k=rng.randint(5, 30))),
+                "gpt_response": " ".join(rng.choices(words, k=rng.randint(50, 300))),
+                "model": rng.choice(MODELS),
+                "created_at": start + timedelta(seconds=i * days * 86400 / rows),
+                "latency_ms": rng.uniform(200, 3000),
+            })
+            if len(batch) == 5000:
+                connection.execute(insert(ApplicationLog), batch)
+                batch = []
+        if batch:
+            connection.execute(insert(ApplicationLog), batch)
+    rebuild_log_rollups()
+
+
+def report_from_orm():
+    from sqlmodel import Session, select
+
+    from database import engine
+    from utils_db import ApplicationLog
+
+    totals = defaultdict(lambda: [0, 0, 0.0])
+    with Session(engine) as session:
+        for log in session.exec(select(ApplicationLog)).all():
+            row = totals[(log.created_at.date().isoformat(), log.model)]
+            row[0] += 1
+            row[1] += len(log.gpt_response)
+            row[2] += log.latency_ms or 0.0
+    return len(totals)
+
+
+def export_from_orm():
+    from sqlmodel import Session, select
+
+    from database import engine
+    from utils_db import ApplicationLog
+
+    with Session(engine) as session:
+        logs = session.exec(select(ApplicationLog).order_by(ApplicationLog.created_at)).all()
+        return sum(len((json.dumps(log.model_dump(mode="json"), ensure_ascii=False) + "\n").encode("utf-8"))
+                   for log in logs)
+
+
+def insert_cost(count: int, with_rollup: bool) -> float:
+    from sqlmodel import Session
+
+    from database import engine
+    from utils_db import ApplicationLog, insert_application_logs
+
+    start = time.perf_counter()
+    for i in range(count):
+        if with_rollup:
+            insert_application_logs("bench", f"question {i}", "answer " * 50, "gpt-4", latency_ms=500.0)
+        else:
+            with Session(engine) as session:
+                # The insert as it was before rollups
+                log = ApplicationLog(session_id="bench", user_query=f"question {i}",
+                                     gpt_response="answer " * 50, model="gpt-4", latency_ms=500.0)
+                session.add(log)
+                session.commit()
+                session.refresh(log)
+    return (time.perf_counter() - start) / count * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Log export and usage rollup benchmark")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--inserts", type=int, default=500, help="Inserts timed with and without the rollup")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="infopop-logs-") as work_dir:
+        configure_environment(work_dir)
+        import database
+        import utils_db  # noqa: F401
+
+        database.engine.echo = False
+        database.create_db_and_tables()
+        from utils_db import get_log_rollups
+        from utils_log_export import export_logs
+
+        start = time.perf_counter()
+        fill_logs(args.rows, args.days, args.seed)
+        fill_seconds = time.perf_counter() - start
+
+        results = {
+            "report_orm": measure(report_from_orm),
+            "report_rollups": measure(lambda: len(get_log_rollups())),
+            "export_orm": measure(export_from_orm),
+            "export_ndjson": measure(lambda: sum(len(chunk) for chunk in export_logs())),
+            "export_zstd": measure(lambda: sum(len(chunk) for chunk in export_logs("zstd"))),
+        }
+        insert_plain_ms = insert_cost(args.inserts, with_rollup=False)
+        insert_rollup_ms = insert_cost(args.inserts, with_rollup=True)
+
+    print("📊 Log Export / Rollup Benchmark")
+    print("=" * 50)
+    print(f"📄 {args.rows} logs over {args.days} days, {len(MODELS)} models (filled in {fill_seconds:.1f}s)")
+    for name, row in results.items():
+        print(f"   {name:<16} {row['seconds'] * 1000:9.1f} ms  peak traced {row['peak_mb']:8.1f} MB  "
+              f"→ {row['result']}{' bytes' if name.startswith('export') else ' rows'}")
+    print(f"   insert           {insert_plain_ms:.2f} ms plain, {insert_rollup_ms:.2f} ms with the rollup upsert")
+
+    if args.output:
+        results["insert"] = {"plain_ms": insert_plain_ms, "with_rollup_ms": insert_rollup_ms}
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+        print(f"📝 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Memory / recall trade-off of the compact embedding dtypes
+
+For each dtype of utils_embedding_codec: bytes per vector and compression
+against float32, recall@k of the coarse (quantized only) search and of the
+two-stage search (coarse candidates rescored with float32) at several
+oversampling factors, and single-query latency of the NumPy vector store.
+
+Usage (from backend/app):
+    python benchmarks/bench_quantization.py --num-vectors 100000 --oversample 2,5,10,20
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bench_index import _int_list, exact_top_k, generate_vectors  # noqa: E402
+from run_benchmarks import percentile  # noqa: E402
+import utils_numpy_store  # noqa: E402
+from utils_embedding_codec import DTYPES, encode_embedding  # noqa: E402
+
+ADD_BATCH = 5000
+
+
+def measure(store, queries: np.ndarray, truth: np.ndarray, k: int) -> Dict[str, float]:
+    latencies = []
+    hits = 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        docs = store.similarity_search_by_vector(query, k=k)
+        latencies.append(time.perf_counter() - start)
+        hits += len({int(doc.id) for doc in docs} & set(expected.tolist()))
+    return {
+        "recall": hits / (len(queries) * k),
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+    }
+
+
+def bench_dtype(dtype: str, work_dir: str, vectors: np.ndarray, queries: np.ndarray, truth: np.ndarray,
+                k: int, oversample: List[int]) -> List[Dict[str, float]]:
+    store = utils_numpy_store.NumpyVectorStore(os.path.join(work_dir, dtype), dtype=dtype, rescore=dtype != "float32")
+    for offset in range(0, len(vectors), ADD_BATCH):
+        batch = vectors[offset:offset + ADD_BATCH]
+        ids = [str(i) for i in range(offset, offset + len(batch))]
+        store.add_embeddings(batch, ["" for _ in ids], [{} for _ in ids], ids)
+    footprint = store.memory_footprint()
+    base = {
+        "dtype": dtype,
+        "blob_bytes": len(encode_embedding(vectors[0], dtype)),
+        "index_bytes_per_vector": footprint["resident_bytes"] / len(vectors),
+        "compression": vectors[0].nbytes * len(vectors) / footprint["resident_bytes"],
+    }
+
+    rows = []
+    if store.rescore:
+        store.rescore = False
+        rows.append({**base, "oversample": 0, **measure(store, queries, truth, k)})
+        store.rescore = True
+        for factor in oversample:
+            utils_numpy_store.NUMPY_INDEX_OVERSAMPLE = factor
+            rows.append({**base, "oversample": factor, **measure(store, queries, truth, k)})
+    else:
+        rows.append({**base, "oversample": 0, **measure(store, queries, truth, k)})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding quantization memory vs. recall benchmark")
+    parser.add_argument("--num-vectors", type=int, default=50000)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=250)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--dtypes", default=",".join(DTYPES), help=f"Comma-separated, among {', '.join(DTYPES)}")
+    parser.add_argument("--oversample", type=_int_list, default=[2, 5, 10, 20],
+                        help="Comma-separated rescoring candidate factors (candidates = k * factor)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+    dtypes = [name for name in args.dtypes.split(",") if name]
+    for name in dtypes:
+        if name not in DTYPES:
+            parser.error(f"Unknown dtype: {name}")
+
+    print("🔍 Embedding Quantization Benchmark")
+    print("=" * 50)
+    vectors = generate_vectors(args.num_vectors, args.dimension, args.clusters, args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    queries = vectors[rng.integers(0, len(vectors), size=args.queries)]
+    queries = queries + rng.normal(scale=0.05, size=queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    truth = exact_top_k(vectors, queries, args.k)
+    print(f"📦 {args.num_vectors} vectors x {args.dimension} dimensions, recall@{args.k}")
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="infopop-quant-") as work_dir:
+        for dtype in dtypes:
+            rows = bench_dtype(dtype, work_dir, vectors, queries, truth, args.k, args.oversample)
+            results.extend(rows)
+            first = rows[0]
+            print(f"   {dtype:<8} {first['index_bytes_per_vector']:7.1f} B/vector in RAM "
+                  f"({first['compression']:4.1f}x), blob {first['blob_bytes']} B")
+            for row in rows:
+                label = "coarse only" if not row["oversample"] else f"rescore x{row['oversample']}"
+                print(f"      {label:<13} recall {row['recall']:.3f}  "
+                      f"p50 {row['p50_ms']:6.2f} ms  p95 {row['p95_ms']:6.2f} ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"num_vectors": args.num_vectors, "dimension": args.dimension, "k": args.k,
+                       "results": results}, f, indent=2)
+        print(f"📝 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Sequential vs. speculative retrieval for follow-up questions
+
+Runs the RAG chain of utils_langchain on follow-up turns (with chat history)
+in both retrieval modes and reports end-to-end latency, the speculative hit
+rate and the latency saved per request. The rewriter is a fake model that
+leaves a configurable share of questions unchanged (see
+fakes.FakeRewritingChatModel); embeddings are fake with configurable latency.
+
+Usage (from backend/app):
+    python benchmarks/bench_speculative.py --requests 200 --unchanged-ratio 0.7
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from corpus import generate_paragraphs, generate_questions  # noqa: E402
+from fakes import FakeEmbeddings, FakeRewritingChatModel  # noqa: E402
+from run_benchmarks import configure_environment, percentile  # noqa: E402
+
+
+async def bench_mode(mode: str, llm, questions: List[str], concurrency: int) -> Dict[str, float]:
+    from utils_langchain import get_rag_chain
+    from utils_metrics import cache_requests, speculative_retrieval_saved
+
+    chain = get_rag_chain(llm=llm, retrieval_mode=mode)
+    hits_before = cache_requests.get(cache="speculative_retrieval", result="hit")
+    misses_before = cache_requests.get(cache="speculative_retrieval", result="miss")
+    saved_before = sum(speculative_retrieval_saved.get_sum(result=r) for r in ("hit", "miss"))
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def ask(index: int):
+        previous = questions[index - 1]
+        async with semaphore:
+            start = time.perf_counter()
+            await chain.ainvoke({
+                "input": questions[index],
+                "chat_history": [("human", previous), ("ai", "...")],
+            })
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(ask(i) for i in range(1, len(questions))))
+    hits = cache_requests.get(cache="speculative_retrieval", result="hit") - hits_before
+    misses = cache_requests.get(cache="speculative_retrieval", result="miss") - misses_before
+    saved = sum(speculative_retrieval_saved.get_sum(result=r) for r in ("hit", "miss")) - saved_before
+    return {
+        "mode": mode,
+        "requests": len(latencies),
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        "saved_ms_per_request": saved / len(latencies) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Speculative retrieval benchmark")
+    parser.add_argument("--requests", type=int, default=100, help="Follow-up questions per mode")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--unchanged-ratio", type=float, default=0.7, help="Share of questions the rewrite keeps")
+    parser.add_argument("--rewrite-latency", type=float, default=0.05)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Latency of the answer LLM call")
+    parser.add_argument("--embedding-latency", type=float, default=0.02)
+    parser.add_argument("--embedding-dim", type=int, default=256)
+    parser.add_argument("--words", type=int, default=50000, help="Words of synthetic corpus to index")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="infopop-speculative-") as work_dir:
+        configure_environment(work_dir)
+        import utils_chroma
+
+        embeddings = FakeEmbeddings(dimension=args.embedding_dim, latency=0.0)
+        utils_chroma.set_embedding_model(embeddings)
+        paragraphs = generate_paragraphs(random.Random(args.seed), args.words)
+        utils_chroma.get_vector_store().add_texts(paragraphs, metadatas=[{"file_id": 0} for _ in paragraphs])
+        # Indexing is not measured; queries pay the embedding latency
+        embeddings.latency = args.embedding_latency
+
+        llm = FakeRewritingChatModel(
+            latency=args.llm_latency, rewrite_latency=args.rewrite_latency, unchanged_ratio=args.unchanged_ratio
+        )
+        questions = generate_questions(args.requests + 1, args.seed)
+
+        print("🔍 Speculative Retrieval Benchmark")
+        print("=" * 50)
+        print(f"📄 {len(paragraphs)} chunks, {args.requests} follow-up questions, "
+              f"{args.unchanged_ratio:.0%} unchanged by the rewrite")
+        results = []
+        for mode in ("sequential", "speculative"):
+            row = asyncio.run(bench_mode(mode, llm, questions, args.concurrency))
+            results.append(row)
+            line = f"   {mode:<12} p50 {row['p50_ms']:7.1f} ms  p95 {row['p95_ms']:7.1f} ms"
+            if mode == "speculative":
+                line += f"  hit rate {row['hit_rate']:.0%}  saved {row['saved_ms_per_request']:.1f} ms/request"
+            print(line)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"requests": args.requests, "unchanged_ratio": args.unchanged_ratio,
+                       "results": results}, f, indent=2)
+        print(f"📝 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark: import time per module and time to first request
+
+Usage (from backend/app):
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --serve --output startup.json
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Our own modules, always reported even when they are cheap
+APP_MODULES = [
+    "main", "services_LLM", "models_pydantic", "utils_startup",
+    "utils_metrics", "database", "utils_db", "prompt_loader", "utils_langchain", "utils_chroma",
+]
+
+
+def measure_import_wall_time(module: str = "main", repeat: int = 5) -> dict:
+    """Wall-clock time of `import <module>` in fresh interpreters"""
+    code = (
+        "import time; t = time.perf_counter(); "
+        f"import {module}; print(time.perf_counter() - t)"
+    )
+    samples = []
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-c", code], cwd=APP_DIR,
+            capture_output=True, text=True, check=True
+        )
+        samples.append(float(result.stdout.strip().splitlines()[-1]))
+    return {
+        "module": module,
+        "repeat": repeat,
+        "min_seconds": min(samples),
+        "median_seconds": statistics.median(samples),
+        "max_seconds": max(samples),
+    }
+
+
+def measure_import_time_per_module(module: str = "main", top: int = 20) -> dict:
+    """Parse `python -X importtime` output into per-module timings"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=APP_DIR, capture_output=True, text=True, check=True
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        # "import time:   self_us |   cumulative_us |   <indent>package"
+        self_us, cumulative_us, name = line.split(":", 1)[1].split("|")
+        name = name[1:]
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append({
+            "module": name.strip(),
+            "depth": depth,
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cumulative_us) / 1000,
+        })
+
+    top_level = [m for m in modules if m["depth"] == 0]
+    return {
+        "total_ms": sum(m["cumulative_ms"] for m in top_level),
+        "top_cumulative": sorted(modules, key=lambda m: m["cumulative_ms"], reverse=True)[:top],
+        "app_modules": [m for m in modules if m["module"] in APP_MODULES],
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for(url: str, deadline: float, expect_status: int = 200) -> float:
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == expect_status:
+                    return time.perf_counter()
+        except (urllib.error.URLError, ConnectionError):
+            pass
+        time.sleep(0.01)
+    raise TimeoutError(f"Timed out waiting for {url}")
+
+
+def measure_time_to_first_request(timeout: float = 60.0) -> dict:
+    """Start uvicorn and time the first /health and the first 200 from /ready"""
+    port = _free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=APP_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        deadline = start + timeout
+        health_at = _wait_for(f"http://127.0.0.1:{port}/health", deadline)
+        ready_at = _wait_for(f"http://127.0.0.1:{port}/ready", deadline)
+        return {
+            "first_request_seconds": health_at - start,
+            "ready_seconds": ready_at - start,
+        }
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="InfoPop backend startup benchmark")
+    parser.add_argument("--module", default="main", help="Module to import")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters for wall time")
+    parser.add_argument("--top", type=int, default=20, help="Number of slowest modules to show")
+    parser.add_argument("--serve", action="store_true", help="Also time uvicorn to first request")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    print("🔍 InfoPop Startup Benchmark")
+    print("=" * 50)
+
+    results = {
+        "import_wall_time": measure_import_wall_time(args.module, args.repeat),
+        "import_time": measure_import_time_per_module(args.module, args.top),
+    }
+    wall = results["import_wall_time"]
+    print(f"import {args.module}: median {wall['median_seconds'] * 1000:.1f} ms "
+          f"(min {wall['min_seconds'] * 1000:.1f} ms, max {wall['max_seconds'] * 1000:.1f} ms)")
+
+    print(f"\nSlowest modules (cumulative):")
+    for entry in results["import_time"]["top_cumulative"]:
+        print(f"   {entry['cumulative_ms']:9.1f} ms  {entry['module']}")
+
+    print(f"\nApplication modules:")
+    for entry in results["import_time"]["app_modules"]:
+        print(f"   {entry['cumulative_ms']:9.1f} ms  {entry['module']}")
+
+    if args.serve:
+        results["serve"] = measure_time_to_first_request()
+        print(f"\nFirst request after {results['serve']['first_request_seconds'] * 1000:.1f} ms, "
+              f"ready after {results['serve']['ready_seconds'] * 1000:.1f} ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
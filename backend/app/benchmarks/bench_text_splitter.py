@@ -0,0 +1,96 @@
+"""
+Text splitter throughput and chunk consistency: TokenTextSplitter vs. the
+character-based RecursiveCharacterTextSplitter
+
+For Chinese, English and mixed synthetic text, and Chinese text without line
+breaks: split throughput in MB/s, the token count spread of the chunks (mean,
+min, max, coefficient of variation) and the share of chunks that end on a
+sentence boundary. Token counts use the configured tiktoken encoding, or the
+estimate when it cannot be loaded (see utils_text_splitter).
+
+Usage (from backend/app):
+    python benchmarks/bench_text_splitter.py --words 200000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from corpus import generate_paragraphs  # noqa: E402
+from utils_text_splitter import (CHUNK_OVERLAP_TOKENS, CHUNK_TOKENS, TokenTextSplitter, count_tokens,  # noqa: E402
+                                 create_text_splitter)
+
+# (share of Chinese sentences, paragraph separator); "flat" is text without
+# line breaks, as extracted from many PDF / DOCX files
+CORPORA = {
+    "chinese": (1.0, "\n\n"),
+    "mixed": (0.5, "\n\n"),
+    "english": (0.0, "\n\n"),
+    "chinese-flat": (1.0, ""),
+}
+SENTENCE_ENDINGS = tuple("。！？!?；;….\"”’」』）)")
+
+
+def bench_splitter(splitter, text: str, counter: TokenTextSplitter, repeat: int) -> Dict[str, float]:
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = splitter.split_text(text)
+        seconds.append(time.perf_counter() - start)
+    tokens = count_tokens(chunks, counter.encoding_name)
+    mean = statistics.mean(tokens)
+    return {
+        "mb_per_second": len(text.encode("utf-8")) / 1024 / 1024 / min(seconds),
+        "chunks": len(chunks),
+        "tokens_mean": mean,
+        "tokens_min": min(tokens),
+        "tokens_max": max(tokens),
+        "tokens_cv": statistics.pstdev(tokens) / mean if mean else 0.0,
+        "sentence_boundary": sum(chunk.endswith(SENTENCE_ENDINGS) for chunk in chunks) / len(chunks),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Text splitter throughput and chunk size benchmark")
+    parser.add_argument("--words", type=int, default=100000, help="Words of synthetic text per language")
+    parser.add_argument("--chunk-tokens", type=int, default=CHUNK_TOKENS)
+    parser.add_argument("--overlap-tokens", type=int, default=CHUNK_OVERLAP_TOKENS)
+    parser.add_argument("--chunk-chars", type=int, default=1000, help="Chunk size of the character-based splitter")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    splitters = {
+        "recursive": create_text_splitter("recursive", args.chunk_chars),
+        "token": create_text_splitter("token", args.chunk_tokens, args.overlap_tokens),
+    }
+    counter = splitters["token"]
+
+    print("🔍 Text Splitter Benchmark")
+    print("=" * 50)
+    results: List[Dict] = []
+    for corpus_name, (chinese_ratio, separator) in CORPORA.items():
+        text = separator.join(generate_paragraphs(random.Random(args.seed), args.words, chinese_ratio))
+        print(f"📄 {corpus_name}: {len(text.encode('utf-8')) / 1024 / 1024:.1f} MB")
+        for name, splitter in splitters.items():
+            row = {"corpus": corpus_name, "splitter": name, **bench_splitter(splitter, text, counter, args.repeat)}
+            results.append(row)
+            print(f"   {name:<10} {row['mb_per_second']:6.2f} MB/s  {row['chunks']:6d} chunks  "
+                  f"tokens {row['tokens_mean']:6.1f} (min {row['tokens_min']}, max {row['tokens_max']}, "
+                  f"cv {row['tokens_cv']:.2f})  sentence ends {row['sentence_boundary']:.0%}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"words": args.words, "chunk_tokens": args.chunk_tokens, "results": results}, f, indent=2)
+        print(f"📝 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Flat vs. two-level (document index first) retrieval
+
+Builds a synthetic corpus of topical documents: every document draws most of
+its words from its own small topic vocabulary and the rest from a shared
+one. Queries are made of topic words of one target document. Reports the
+search latency and precision (share of the returned chunks that come from
+the target document) of a flat search over all chunks and of the two-level
+search of utils_doc_index, for the chosen vector backend.
+
+Usage (from backend/app):
+    python benchmarks/bench_two_level.py --documents 1000 --chunks-per-document 20
+    python benchmarks/bench_two_level.py --backend numpy --top-m 4
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fakes import FakeEmbeddings  # noqa: E402
+from run_benchmarks import configure_environment, percentile  # noqa: E402
+
+SHARED_WORDS = 2000
+TOPIC_WORDS = 12
+
+
+def build_corpus(rng: random.Random, documents: int, chunks_per_document: int, words_per_chunk: int,
+                 topic_ratio: float):
+    vocabulary = [f"w{i}" for i in range(SHARED_WORDS)]
+    topics = [rng.sample(vocabulary, TOPIC_WORDS) for _ in range(documents)]
+    corpus = []
+    for file_id, topic in enumerate(topics):
+        chunks = []
+        for _ in range(chunks_per_document):
+            words = [rng.choice(topic) if rng.random() < topic_ratio else rng.choice(vocabulary)
+                     for _ in range(words_per_chunk)]
+            chunks.append(" ".join(words) + ".")
+        corpus.append((file_id, chunks))
+    return topics, corpus
+
+
+def bench_search(search, queries: List[List[float]], targets: List[int], k: int) -> Dict[str, float]:
+    latencies = []
+    precisions = []
+    for embedding, target in zip(queries, targets):
+        start = time.perf_counter()
+        documents = search(embedding)
+        latencies.append(time.perf_counter() - start)
+        precisions.append(sum(doc.metadata["file_id"] == target for doc in documents) / k)
+    return {
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "precision": statistics.mean(precisions),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Two-level retrieval benchmark")
+    parser.add_argument("--backend", choices=("chroma", "numpy"), default="chroma")
+    parser.add_argument("--documents", type=int, default=500)
+    parser.add_argument("--chunks-per-document", type=int, default=20)
+    parser.add_argument("--words-per-chunk", type=int, default=60)
+    parser.add_argument("--topic-ratio", type=float, default=0.3, help="Share of chunk words from the topic")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=2)
+    parser.add_argument("--top-m", type=int, default=8)
+    parser.add_argument("--embedding-dim", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="infopop-two-level-") as work_dir:
+        configure_environment(work_dir)
+        os.environ["VECTOR_BACKEND"] = args.backend
+        os.environ["NUMPY_INDEX_DIR"] = os.path.join(work_dir, "numpy_index")
+        import utils_chroma
+        from langchain_core.documents import Document
+        from utils_doc_index import build_profile, save_profile, two_level_search
+
+        embeddings = FakeEmbeddings(dimension=args.embedding_dim, latency=0.0)
+        utils_chroma.set_embedding_model(embeddings)
+        vector_store = utils_chroma.get_vector_store()
+        doc_index = utils_chroma.get_document_index()
+
+        rng = random.Random(args.seed)
+        topics, corpus = build_corpus(rng, args.documents, args.chunks_per_document, args.words_per_chunk,
+                                      args.topic_ratio)
+        start = time.perf_counter()
+        for file_id, chunks in corpus:
+            vectors = embeddings.embed_documents(chunks)
+            documents = [Document(page_content=text, metadata={"file_id": file_id}) for text in chunks]
+            chunk_ids = vector_store.add_texts(chunks, metadatas=[doc.metadata for doc in documents])
+            save_profile(doc_index, file_id, build_profile(documents, vectors), chunk_ids)
+        index_seconds = time.perf_counter() - start
+
+        targets = [rng.randrange(args.documents) for _ in range(args.queries)]
+        queries = [embeddings.embed_query(" ".join(rng.sample(topics[target], 4))) for target in targets]
+
+        print("🔍 Two-Level Retrieval Benchmark")
+        print("=" * 50)
+        print(f"📄 {args.documents} documents × {args.chunks_per_document} chunks ({args.backend}), "
+              f"indexed in {index_seconds:.1f}s; k={args.k}, top-M={args.top_m}")
+        results = {
+            "flat": bench_search(lambda e: vector_store.similarity_search_by_vector(e, k=args.k),
+                                 queries, targets, args.k),
+            "two_level": bench_search(lambda e: two_level_search(vector_store, doc_index, e, args.k, args.top_m),
+                                      queries, targets, args.k),
+        }
+        for mode, row in results.items():
+            print(f"   {mode:<10} p50 {row['p50_ms']:6.2f} ms  p95 {row['p95_ms']:6.2f} ms  "
+                  f"precision {row['precision']:.3f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+        print(f"📝 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
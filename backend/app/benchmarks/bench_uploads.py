@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Large-file upload: one multipart request vs. resumable chunked parts
+
+Starts uvicorn with the fake models (see fake_app.py) and uploads a file of
+random bytes both ways, measuring the transfer only (the file is not
+indexed: the multipart upload uses an unsupported extension, which is
+rejected after the form is received, and the chunked upload is aborted
+instead of completed). Reports the time and the peak RSS growth of the
+server, then interrupts a chunked upload halfway and resumes it from the
+parts the server reports, counting the bytes sent again.
+
+Usage (from backend/app):
+    python benchmarks/bench_uploads.py --mb 200 --parallel 4
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from bench_startup import _free_port  # noqa: E402
+
+
+def rss_bytes(pid: int) -> int:
+    with open(f"/proc/{pid}/status", "r", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+class PeakRss:
+    """Samples the RSS of a process in a thread; `growth` is the peak over the starting value"""
+
+    def __init__(self, pid: int, interval: float = 0.01):
+        self.pid = pid
+        self.interval = interval
+        self.start = self.peak = rss_bytes(pid)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, rss_bytes(self.pid))
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    @property
+    def growth(self) -> int:
+        return self.peak - self.start
+
+
+async def upload_parts(client, path: str, upload_id: str, part_size: int, parts: List[int], parallel: int) -> int:
+    """PUT the given parts with `parallel` in flight; returns the bytes sent"""
+    queue = list(parts)
+    sent = 0
+
+    async def worker():
+        nonlocal sent
+        while queue:
+            part = queue.pop(0)
+            with open(path, "rb") as f:
+                f.seek(part * part_size)
+                data = f.read(part_size)
+            response = await client.put(f"/uploads/{upload_id}/parts/{part}", content=data,
+                                        headers={"X-Part-SHA256": hashlib.sha256(data).hexdigest()})
+            response.raise_for_status()
+            sent += len(data)
+
+    await asyncio.gather(*(worker() for _ in range(parallel)))
+    return sent
+
+
+async def run(args, path: str, pid: int, port: int) -> Dict[str, Dict[str, float]]:
+    import httpx
+
+    size = os.path.getsize(path)
+    results = {}
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=600) as client:
+        with PeakRss(pid) as rss:
+            start = time.perf_counter()
+            with open(path, "rb") as f:
+                response = await client.post("/upload-documents", files={"file": ("big.bin", f)})
+            assert response.status_code == 400, response.text
+            results["multipart"] = {"seconds": time.perf_counter() - start, "peak_rss_growth_mb": 0.0}
+        results["multipart"]["peak_rss_growth_mb"] = rss.growth / 1024 ** 2
+
+        with PeakRss(pid) as rss:
+            start = time.perf_counter()
+            session = (await client.post("/uploads", json={
+                "filename": "big.txt", "size": size, "part_size": args.part_mb * 1024 ** 2
+            })).json()
+            await upload_parts(client, path, session["upload_id"], session["part_size"],
+                               list(range(session["parts"])), args.parallel)
+            received = (await client.get(f"/uploads/{session['upload_id']}")).json()["received"]
+            assert len(received) == session["parts"]
+            results["chunked"] = {"seconds": time.perf_counter() - start, "peak_rss_growth_mb": 0.0}
+            await client.delete(f"/uploads/{session['upload_id']}")
+        results["chunked"]["peak_rss_growth_mb"] = rss.growth / 1024 ** 2
+
+        # Interrupted after half the parts: a new client resumes from the server's list
+        session = (await client.post("/uploads", json={
+            "filename": "big.txt", "size": size, "part_size": args.part_mb * 1024 ** 2
+        })).json()
+        half = list(range(session["parts"] // 2))
+        sent = await upload_parts(client, path, session["upload_id"], session["part_size"], half, args.parallel)
+        received = set((await client.get(f"/uploads/{session['upload_id']}")).json()["received"])
+        missing = [part for part in range(session["parts"]) if part not in received]
+        sent += await upload_parts(client, path, session["upload_id"], session["part_size"], missing, args.parallel)
+        await client.delete(f"/uploads/{session['upload_id']}")
+        results["resumed"] = {"bytes_sent_ratio": sent / size}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multipart vs. chunked upload benchmark")
+    parser.add_argument("--mb", type=int, default=200, help="File size in MB")
+    parser.add_argument("--part-mb", type=int, default=8)
+    parser.add_argument("--parallel", type=int, default=4, help="Parts in flight")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="infopop-uploads-") as work_dir:
+        path = os.path.join(work_dir, "big.bin")
+        with open(path, "wb") as f:
+            for _ in range(args.mb):
+                f.write(os.urandom(1024 ** 2))
+        server_dir = os.path.join(work_dir, "server")
+        os.makedirs(server_dir)
+        port = _free_port()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "fake_app:app", "--app-dir", "benchmarks",
+             "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+            cwd=APP_DIR, env=dict(os.environ, INFOPOP_BENCH_DIR=server_dir),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            import httpx
+
+            deadline = time.perf_counter() + 120
+            while True:
+                try:
+                    if httpx.get(f"http://127.0.0.1:{port}/ready").status_code == 200:
+                        break
+                except httpx.HTTPError:
+                    pass
+                if time.perf_counter() > deadline:
+                    raise TimeoutError("Server did not become ready")
+                time.sleep(0.1)
+            results = asyncio.run(run(args, path, server.pid, port))
+        finally:
+            server.terminate()
+            server.wait()
+
+    print("📤 Upload Benchmark")
+    print("=" * 50)
+    print(f"📄 {args.mb} MB file, {args.part_mb} MB parts, {args.parallel} in flight")
+    for mode in ("multipart", "chunked"):
+        row = results[mode]
+        print(f"   {mode:<10} {row['seconds']:6.2f}s  {args.mb / row['seconds']:7.1f} MB/s  "
+              f"server peak RSS +{row['peak_rss_growth_mb']:.1f} MB")
+    print(f"   resumed after half the parts: {results['resumed']['bytes_sent_ratio']:.2f}× the file size sent")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+        print(f"📝 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
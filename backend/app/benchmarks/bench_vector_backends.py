@@ -0,0 +1,155 @@
+"""
+NumPy vector backend (float32 / int8) vs. Chroma at growing corpus sizes
+
+For each size: add time, open time of an existing index, single-query p50/p95,
+recall@k against an exact search and disk footprint. Vectors are synthetic
+(see bench_index.generate_vectors), so no embedding model is involved.
+
+Usage (from backend/app):
+    python benchmarks/bench_vector_backends.py --sizes 10000,100000,1000000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bench_index import _int_list, exact_top_k, generate_vectors  # noqa: E402
+from run_benchmarks import percentile  # noqa: E402
+
+BACKENDS = ("numpy-float32", "numpy-int8", "chroma")
+ADD_BATCH = 5000
+
+
+def directory_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names
+    )
+
+
+class NumpyBackend:
+    def __init__(self, directory: str, dtype: str):
+        self.directory = directory
+        self.dtype = dtype
+
+    def open(self):
+        from utils_numpy_store import NumpyVectorStore
+        self.store = NumpyVectorStore(self.directory, dtype=self.dtype)
+
+    def add(self, ids: List[str], vectors: np.ndarray):
+        texts = [f"chunk {i}" for i in ids]
+        metadatas = [{"file_id": int(i) % 100} for i in ids]
+        self.store.add_embeddings(vectors, texts, metadatas, ids)
+
+    def query(self, vector: np.ndarray, k: int) -> List[str]:
+        return [doc.id for doc in self.store.similarity_search_by_vector(vector, k=k)]
+
+
+class ChromaBackend:
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def open(self):
+        import chromadb
+        from chromadb.api.shared_system_client import SharedSystemClient
+        SharedSystemClient.clear_system_cache()
+        client = chromadb.PersistentClient(path=self.directory)
+        self.collection = client.get_or_create_collection("documents", embedding_function=None)
+
+    def add(self, ids: List[str], vectors: np.ndarray):
+        metadatas = [{"file_id": int(i) % 100} for i in ids]
+        self.collection.add(ids=ids, embeddings=vectors, documents=[f"chunk {i}" for i in ids], metadatas=metadatas)
+
+    def query(self, vector: np.ndarray, k: int) -> List[str]:
+        return self.collection.query(query_embeddings=[vector], n_results=k, include=["documents", "metadatas"])["ids"][0]
+
+
+def make_backend(name: str, directory: str):
+    if name == "chroma":
+        return ChromaBackend(directory)
+    return NumpyBackend(directory, name.split("-", 1)[1])
+
+
+def bench_backend(name: str, work_dir: str, vectors: np.ndarray, queries: np.ndarray,
+                  truth: np.ndarray, k: int) -> Dict[str, float]:
+    directory = os.path.join(work_dir, name)
+    backend = make_backend(name, directory)
+    backend.open()
+    start = time.perf_counter()
+    for offset in range(0, len(vectors), ADD_BATCH):
+        batch = vectors[offset:offset + ADD_BATCH]
+        backend.add([str(i) for i in range(offset, offset + len(batch))], batch)
+    add_seconds = time.perf_counter() - start
+
+    # Reopen to measure the cold start of an existing index
+    del backend
+    backend = make_backend(name, directory)
+    start = time.perf_counter()
+    backend.open()
+    open_seconds = time.perf_counter() - start
+
+    latencies = []
+    hits = 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        ids = backend.query(query, k)
+        latencies.append(time.perf_counter() - start)
+        hits += len({int(i) for i in ids} & set(expected.tolist()))
+    return {
+        "add_seconds": add_seconds,
+        "open_seconds": open_seconds,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "recall": hits / (len(queries) * k),
+        "disk_mb": directory_size(directory) / 1024 / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NumPy vs. Chroma vector backend benchmark")
+    parser.add_argument("--sizes", type=_int_list, default=[10000, 100000], help="Comma-separated corpus sizes")
+    parser.add_argument("--dimension", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--backends", default=",".join(BACKENDS), help=f"Comma-separated, among {', '.join(BACKENDS)}")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+    backends = [name for name in args.backends.split(",") if name]
+    for name in backends:
+        if name not in BACKENDS:
+            parser.error(f"Unknown backend: {name}")
+
+    print("🔍 Vector Backend Benchmark")
+    print("=" * 50)
+    results = []
+    for size in args.sizes:
+        vectors = generate_vectors(size, args.dimension, max(size // 200, 10), args.seed)
+        rng = np.random.default_rng(args.seed + 1)
+        queries = vectors[rng.integers(0, size, size=args.queries)]
+        queries = queries + rng.normal(scale=0.05, size=queries.shape).astype(np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+        truth = exact_top_k(vectors, queries, args.k)
+        print(f"📦 {size} chunks x {args.dimension} dimensions")
+        for name in backends:
+            with tempfile.TemporaryDirectory(prefix="infopop-backend-") as work_dir:
+                row = {"backend": name, "size": size, **bench_backend(name, work_dir, vectors, queries, truth, args.k)}
+            results.append(row)
+            print(f"   {name:<14} add {row['add_seconds']:7.1f}s  open {row['open_seconds'] * 1000:8.1f} ms  "
+                  f"p50 {row['p50_ms']:7.2f} ms  p95 {row['p95_ms']:7.2f} ms  "
+                  f"recall@{args.k} {row['recall']:.3f}  disk {row['disk_mb']:8.1f} MB")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"dimension": args.dimension, "k": args.k, "results": results}, f, indent=2)
+        print(f"📝 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
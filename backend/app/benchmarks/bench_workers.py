@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Multi-worker load test: /chat throughput as a function of the worker count
+
+Starts uvicorn with the fake models (see fake_app.py) for each worker count,
+in shared-state mode, and drives it with concurrent HTTP clients for a fixed
+duration. All runs share one scratch directory, so the corpus is ingested once.
+
+Usage (from backend/app):
+    python benchmarks/bench_workers.py --workers 1,2,4 --clients 32 --duration 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from bench_startup import _free_port  # noqa: E402
+from corpus import generate_corpus, generate_questions  # noqa: E402
+from run_benchmarks import percentile  # noqa: E402
+
+
+def start_server(work_dir: str, workers: int, port: int, llm_latency: float) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        INFOPOP_BENCH_DIR=work_dir,
+        INFOPOP_BENCH_LLM_LATENCY=str(llm_latency),
+        INFOPOP_SHARED_STATE="1",
+    )
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "fake_app:app", "--app-dir", "benchmarks",
+         "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers),
+         "--log-level", "warning"],
+        cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+async def wait_until_ready(client, workers: int, timeout: float = 120.0):
+    """Poll /ready until enough consecutive successes that every worker is likely warm"""
+    deadline = time.perf_counter() + timeout
+    consecutive = 0
+    while consecutive < workers * 5:
+        if time.perf_counter() > deadline:
+            raise TimeoutError("Server did not become ready")
+        try:
+            response = await client.get("/ready")
+            consecutive = consecutive + 1 if response.status_code == 200 else 0
+        except Exception:
+            consecutive = 0
+        await asyncio.sleep(0.05)
+
+
+async def ingest(client, paths: List[str]):
+    for path in paths:
+        with open(path, "rb") as f:
+            response = await client.post("/upload-documents", files={"file": (os.path.basename(path), f.read())})
+        if response.status_code != 200:
+            print(f"   ❌ {os.path.basename(path)}: {response.status_code} {response.text[:200]}")
+
+
+async def load(client, questions: List[str], clients: int, duration: float) -> Dict:
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+
+    async def run_client(client_index: int):
+        nonlocal errors
+        i = 0
+        while time.perf_counter() < deadline:
+            question = questions[(client_index + i * clients) % len(questions)]
+            start = time.perf_counter()
+            response = await client.post("/chat", json={
+                "message": question,
+                "conversation_id": f"load-{client_index}-{i // 5}",
+            })
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+            i += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run_client(i) for i in range(clients)))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+    }
+
+
+async def run(args, work_dir: str) -> List[Dict]:
+    import httpx
+
+    corpus_paths = generate_corpus(os.path.join(work_dir, "corpus"), args.files, 1000, seed=args.seed)
+    questions = generate_questions(500, args.seed)
+    results = []
+    ingested = False
+    for workers in [int(value) for value in args.workers.split(",")]:
+        port = _free_port()
+        server = start_server(work_dir, workers, port, args.llm_latency)
+        try:
+            limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=60, limits=limits) as client:
+                await wait_until_ready(client, workers)
+                if not ingested:
+                    print(f"📁 Ingesting {len(corpus_paths)} files...")
+                    await ingest(client, corpus_paths)
+                    ingested = True
+                print(f"💬 {workers} worker(s): {args.clients} clients for {args.duration:.0f}s...")
+                result = {"workers": workers, **await load(client, questions, args.clients, args.duration)}
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+        results.append(result)
+        print(f"   {result['throughput_rps']:.1f} req/s, p50 {result['p50_ms']:.1f} ms, "
+              f"p95 {result['p95_ms']:.1f} ms ({result['errors']} errors)")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="InfoPop multi-worker load test")
+    parser.add_argument("--workers", default="1,2,4", help="Comma-separated worker counts")
+    parser.add_argument("--clients", type=int, default=32, help="Concurrent HTTP clients")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of load per worker count")
+    parser.add_argument("--files", type=int, default=12, help="Number of corpus files")
+    parser.add_argument("--llm-latency", type=float, default=0.005, help="Fake chat model latency (s)")
+    parser.add_argument("--seed", type=int, default=0, help="Corpus and question seed")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    print("🔍 InfoPop Multi-Worker Load Test")
+    print("=" * 50)
+    work_dir = tempfile.mkdtemp(prefix="infopop-workers-")
+    try:
+        results = asyncio.run(run(args, work_dir))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    baseline = results[0]["throughput_rps"] or 1.0
+    print("\n📊 Scaling")
+    for result in results:
+        print(f"   {result['workers']:2d} worker(s): {result['throughput_rps']:8.1f} req/s "
+              f"({result['throughput_rps'] / baseline:.2f}x)")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
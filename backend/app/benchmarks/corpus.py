@@ -0,0 +1,172 @@
+"""
+Synthetic corpus generator: txt, pdf and docx files of configurable size
+
+PDF and DOCX files are written by hand (no extra dependencies) in the minimal
+form the LangChain loaders can read.
+"""
+import os
+import random
+import zipfile
+from typing import List, Sequence
+from xml.sax.saxutils import escape
+
+ENGLISH_WORDS = (
+    "revenue profit margin quarter forecast budget invoice asset liability equity "
+    "portfolio dividend interest loan credit risk audit compliance report meeting "
+    "schedule task deadline project client contract policy analysis market growth "
+    "strategy investment fund bond stock index inflation currency exchange tax"
+).split()
+
+# Common Chinese words, since Chinese is the primary language of the knowledge base
+CHINESE_WORDS = (
+    "收入 利润 季度 预算 发票 资产 负债 股权 投资 组合 股息 利息 贷款 信用 风险 审计 "
+    "合规 报告 会议 日程 任务 截止 项目 客户 合同 政策 分析 市场 增长 战略 基金 债券 "
+    "股票 指数 通胀 货币 汇率 税务 知识 管理"
+).split()
+
+LINES_PER_PDF_PAGE = 45
+WORDS_PER_LINE = 12
+
+
+def generate_paragraphs(rng: random.Random, num_words: int, chinese_ratio: float = 0.5) -> List[str]:
+    """Generate paragraphs of roughly num_words words mixing English and Chinese sentences"""
+    paragraphs = []
+    remaining = num_words
+    while remaining > 0:
+        sentences = []
+        for _ in range(rng.randint(3, 6)):
+            length = min(rng.randint(8, 20), max(remaining, 1))
+            remaining -= length
+            if rng.random() < chinese_ratio:
+                sentences.append("".join(rng.choices(CHINESE_WORDS, k=length)) + "。")
+            else:
+                sentence = " ".join(rng.choices(ENGLISH_WORDS, k=length))
+                sentences.append(sentence.capitalize() + ".")
+            if remaining <= 0:
+                break
+        paragraphs.append(" ".join(sentences))
+    return paragraphs
+
+
+def write_txt(path: str, paragraphs: Sequence[str]):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n\n".join(paragraphs))
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: str, paragraphs: Sequence[str]):
+    """Write a minimal multi-page PDF with Helvetica text (latin-1 only)"""
+    words = " ".join(paragraphs).encode("latin-1", "ignore").decode("latin-1").split()
+    lines = [" ".join(words[i:i + WORDS_PER_LINE]) for i in range(0, len(words), WORDS_PER_LINE)] or [""]
+    pages = [lines[i:i + LINES_PER_PDF_PAGE] for i in range(0, len(lines), LINES_PER_PDF_PAGE)]
+
+    # Object numbers: 1 catalog, 2 pages, 3 font, then (page, content) pairs
+    objects = []
+    page_refs = " ".join(f"{4 + 2 * i} 0 R" for i in range(len(pages)))
+    objects.append("<< /Type /Catalog /Pages 2 0 R >>")
+    objects.append(f"<< /Type /Pages /Kids [{page_refs}] /Count {len(pages)} >>")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for i, page_lines in enumerate(pages):
+        content_ref = 5 + 2 * i
+        objects.append(
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_ref} 0 R >>"
+        )
+        text_ops = " T* ".join(f"({_pdf_escape(line)}) Tj" for line in page_lines)
+        stream = f"BT /F1 10 Tf 14 TL 50 760 Td {text_ops} ET"
+        objects.append(f"<< /Length {len(stream.encode('latin-1'))} >>\nstream\n{stream}\nendstream")
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref_offset = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    for offset in offsets:
+        output += f"{offset:010d} 00000 n \n".encode("latin-1")
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode("latin-1")
+
+    with open(path, "wb") as f:
+        f.write(output)
+
+
+_DOCX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>'
+)
+
+_DOCX_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/>'
+    '</Relationships>'
+)
+
+
+def write_docx(path: str, paragraphs: Sequence[str]):
+    """Write a minimal DOCX with one Word paragraph per paragraph"""
+    body = "".join(f"<w:p><w:r><w:t>{escape(paragraph)}</w:t></w:r></w:p>" for paragraph in paragraphs)
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f"<w:body>{body}</w:body></w:document>"
+    )
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as docx:
+        docx.writestr("[Content_Types].xml", _DOCX_CONTENT_TYPES)
+        docx.writestr("_rels/.rels", _DOCX_RELS)
+        docx.writestr("word/document.xml", document)
+
+
+WRITERS = {"txt": write_txt, "pdf": write_pdf, "docx": write_docx}
+
+
+def generate_corpus(directory: str, num_files: int, words_per_file: int,
+                    formats: Sequence[str] = ("txt", "pdf", "docx"), seed: int = 0) -> List[str]:
+    """
+    Generate a synthetic corpus
+
+    Args:
+        directory: Output directory, created if needed
+        num_files: Number of files, formats are used round-robin
+        words_per_file: Approximate number of words per file
+        formats: File formats among txt, pdf and docx
+        seed: Random seed, the same seed always yields the same corpus
+
+    Returns:
+        Paths of the generated files
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for i in range(num_files):
+        file_format = formats[i % len(formats)]
+        # PDFs use Helvetica, so keep them English-only
+        chinese_ratio = 0.0 if file_format == "pdf" else 0.5
+        paragraphs = generate_paragraphs(rng, words_per_file, chinese_ratio)
+        path = os.path.join(directory, f"synthetic_{i:05d}.{file_format}")
+        WRITERS[file_format](path, paragraphs)
+        paths.append(path)
+    return paths
+
+
+def generate_questions(num_questions: int, seed: int = 0) -> List[str]:
+    """Generate questions that reuse the corpus vocabulary"""
+    rng = random.Random(seed + 1)
+    questions = []
+    for _ in range(num_questions):
+        if rng.random() < 0.5:
+            questions.append("".join(rng.choices(CHINESE_WORDS, k=4)) + "是什么？")
+        else:
+            questions.append("What about " + " ".join(rng.choices(ENGLISH_WORDS, k=4)) + "?")
+    return questions
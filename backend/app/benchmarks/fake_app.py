@@ -0,0 +1,30 @@
+"""
+ASGI entry point serving the real app with the fake models, for load tests
+against a real uvicorn server (including multi-worker mode)
+
+Usage (from backend/app):
+    INFOPOP_BENCH_DIR=/tmp/infopop-bench uvicorn fake_app:app --app-dir benchmarks --workers 4
+
+Fake model latency is configured through INFOPOP_BENCH_LLM_LATENCY,
+INFOPOP_BENCH_EMBEDDING_LATENCY and INFOPOP_BENCH_EMBEDDING_DIM.
+"""
+import os
+import sys
+from types import SimpleNamespace
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from run_benchmarks import configure_environment, load_app  # noqa: E402
+
+# Must run before main is imported
+configure_environment(os.environ["INFOPOP_BENCH_DIR"])
+
+main = load_app(SimpleNamespace(
+    llm_latency=float(os.getenv("INFOPOP_BENCH_LLM_LATENCY", "0.005")),
+    embedding_dim=int(os.getenv("INFOPOP_BENCH_EMBEDDING_DIM", "256")),
+    embedding_latency=float(os.getenv("INFOPOP_BENCH_EMBEDDING_LATENCY", "0.001")),
+    embedding_latency_per_text=0.0,
+))
+app = main.app
@@ -0,0 +1,143 @@
+"""
+Deterministic fake chat and embedding models with configurable latency
+
+They stand in for the OpenAI models so benchmarks run offline and reproducibly.
+"""
+import asyncio
+import hashlib
+import math
+import re
+import time
+from typing import Any, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+_TOKEN_PATTERN = re.compile(r"[一-鿿]|[A-Za-z0-9]+")
+
+
+def _tokens(text: str) -> List[str]:
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+def _stable_hash(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model that answers after a fixed latency with a deterministic reply"""
+
+    latency: float = 0.05
+    response_words: int = 40
+    model_name: str = "fake-chat"
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _reply(self, messages: List[BaseMessage]) -> ChatResult:
+        prompt = "\n".join(str(message.content) for message in messages)
+        seed = _stable_hash(prompt)
+        words = [f"word{(seed >> (i % 48)) % 997}" for i in range(self.response_words)]
+        prompt_tokens = len(_tokens(prompt))
+        message = AIMessage(
+            content=" ".join(words),
+            usage_metadata={
+                "input_tokens": prompt_tokens,
+                "output_tokens": self.response_words,
+                "total_tokens": prompt_tokens + self.response_words,
+            },
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency)
+        return self._reply(messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return self._reply(messages)
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Hashed bag-of-words embeddings with configurable latency
+
+    Texts sharing words get similar vectors, so retrieval results are meaningful.
+    Latency is `latency` per call plus `latency_per_text` per embedded text.
+    """
+
+    def __init__(self, dimension: int = 256, latency: float = 0.01, latency_per_text: float = 0.0):
+        self.dimension = dimension
+        self.latency = latency
+        self.latency_per_text = latency_per_text
+        self.calls = 0
+        self.texts_embedded = 0
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimension
+        for token in _tokens(text):
+            token_hash = _stable_hash(token)
+            vector[token_hash % self.dimension] += 1.0 if (token_hash >> 32) & 1 else -1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def _delay(self, count: int) -> float:
+        self.calls += 1
+        self.texts_embedded += count
+        return self.latency + self.latency_per_text * count
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self._delay(len(texts)))
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self._delay(1))
+        return self._embed(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        await asyncio.sleep(self._delay(len(texts)))
+        return [self._embed(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        await asyncio.sleep(self._delay(1))
+        return self._embed(text)
+
+
+class FakeRewritingChatModel(FakeChatModel):
+    """
+    FakeChatModel that also plays the question rewriter of the RAG chain
+
+    Rewrite calls (recognized by the contextualize-question system prompt)
+    return the question unchanged for a deterministic `unchanged_ratio` share
+    of questions, and otherwise add the previous question's words to it.
+    They take `rewrite_latency` instead of `latency`.
+    """
+
+    rewrite_latency: float = 0.05
+    unchanged_ratio: float = 0.7
+
+    @staticmethod
+    def _is_rewrite(messages: List[BaseMessage]) -> bool:
+        return str(messages[0].content).startswith("Given a chat history")
+
+    def _rewrite(self, messages: List[BaseMessage]) -> ChatResult:
+        question = str(messages[-1].content)
+        if _stable_hash(question) % 1000 < self.unchanged_ratio * 1000:
+            rewritten = question
+        else:
+            previous = next((str(m.content) for m in messages[1:-1] if m.type == "human"), "")
+            rewritten = f"{question} ({previous})"
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=rewritten))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        if self._is_rewrite(messages):
+            await asyncio.sleep(self.rewrite_latency)
+            return self._rewrite(messages)
+        return await super()._agenerate(messages, stop, run_manager, **kwargs)
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark suite
+
+Boots the FastAPI app in-process with fake chat and embedding models, ingests a
+synthetic corpus through /upload-documents and drives /chat with concurrent
+clients. Measures ingest throughput, chat latency percentiles, memory growth
+and startup time, and saves the results as JSON for regression comparison.
+
+Usage (from backend/app):
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/run_benchmarks.py --baseline results.json --max-regression 0.2
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from corpus import generate_corpus, generate_questions  # noqa: E402
+from fakes import FakeChatModel, FakeEmbeddings  # noqa: E402
+
+# (dotted result key, True if higher is better)
+REGRESSION_METRICS: List[Tuple[str, bool]] = [
+    ("startup.median_seconds", False),
+    ("ingest.mb_per_second", True),
+    ("ingest.chunks_per_second", True),
+    ("chat.p50_ms", False),
+    ("chat.p95_ms", False),
+    ("chat.throughput_rps", True),
+    ("memory.rss_growth_mb", False),
+]
+
+
+def configure_environment(work_dir: str):
+    """Point the database, Chroma and uploads at a scratch directory; must run before importing main"""
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(work_dir, 'database.db')}"
+    os.environ["CHROMA_PERSIST_DIR"] = os.path.join(work_dir, "chroma_db")
+    os.environ["UPLOAD_DIR"] = os.path.join(work_dir, "uploads")
+    # Keep langsmith and friends from reaching out to the network
+    os.environ["LANGCHAIN_TRACING_V2"] = "false"
+    os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+    # All benchmark clients share one address; measure throughput, not the rate limits
+    os.environ.setdefault("RATE_LIMIT_CLIENT_PER_MINUTE", "0")
+    os.environ.setdefault("RATE_LIMIT_CONVERSATION_PER_MINUTE", "0")
+    # No background model probes competing with the measured requests
+    os.environ.setdefault("MODEL_HEALTH_INTERVAL", "0")
+    # SQL echo (on by default) would flood the output and slow every query down
+    os.environ["SQL_ECHO"] = "0"
+
+
+def load_app(args):
+    """
+    Import the app and swap in the fake models
+
+    `args` needs llm_latency, embedding_dim, embedding_latency and
+    embedding_latency_per_text, as parsed by main() below.
+    """
+    import database
+    import main
+    import utils_chroma
+
+    database.engine.echo = False
+    database.async_engine.echo = False
+    utils_chroma.set_embedding_model(FakeEmbeddings(
+        dimension=args.embedding_dim,
+        latency=args.embedding_latency,
+        latency_per_text=args.embedding_latency_per_text,
+    ))
+    main.ai_service.get_chat_model = lambda model_name: FakeChatModel(
+        latency=args.llm_latency, model_name=model_name
+    )
+    return main
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(math.ceil(p / 100 * len(ordered)) - 1, 0)
+    return ordered[index]
+
+
+def rss_bytes() -> int:
+    """Current resident set size"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        import resource
+        # ru_maxrss is the peak, in KB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+async def bench_ingest(client, paths: List[str], concurrency: int) -> Dict:
+    from utils_metrics import ingest_items
+
+    before = {kind: ingest_items.get(kind=kind) for kind in ("pages", "chunks", "embeddings")}
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def upload(path: str):
+        nonlocal errors
+        async with semaphore:
+            with open(path, "rb") as f:
+                content = f.read()
+            start = time.perf_counter()
+            response = await client.post(
+                "/upload-documents", files={"file": (os.path.basename(path), content)}
+            )
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+                print(f"   ❌ {os.path.basename(path)}: {response.status_code} {response.text[:200]}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(upload(path) for path in paths))
+    elapsed = time.perf_counter() - start
+
+    total_bytes = sum(os.path.getsize(path) for path in paths)
+    counts = {kind: ingest_items.get(kind=kind) - value for kind, value in before.items()}
+    return {
+        "files": len(paths),
+        "errors": errors,
+        "bytes": total_bytes,
+        "seconds": elapsed,
+        "files_per_second": len(paths) / elapsed,
+        "mb_per_second": total_bytes / elapsed / 1e6,
+        "pages": counts["pages"],
+        "chunks": counts["chunks"],
+        "embeddings": counts["embeddings"],
+        "pages_per_second": counts["pages"] / elapsed,
+        "chunks_per_second": counts["chunks"] / elapsed,
+        "embeddings_per_second": counts["embeddings"] / elapsed,
+        "upload_p50_ms": percentile(latencies, 50) * 1000,
+        "upload_p95_ms": percentile(latencies, 95) * 1000,
+    }
+
+
+async def bench_chat(client, questions: List[str], clients: int, requests_per_client: int) -> Dict:
+    latencies, errors = [], 0
+
+    async def run_client(client_index: int):
+        nonlocal errors
+        conversation_id = f"bench-{client_index}"
+        for i in range(requests_per_client):
+            question = questions[(client_index * requests_per_client + i) % len(questions)]
+            start = time.perf_counter()
+            response = await client.post("/chat", json={
+                "message": question,
+                "conversation_id": conversation_id,
+            })
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+                if errors <= 3:
+                    print(f"   ❌ /chat: {response.status_code} {response.text[:200]}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run_client(i) for i in range(clients)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "clients": clients,
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": elapsed,
+        "throughput_rps": len(latencies) / elapsed,
+        "mean_ms": statistics.mean(latencies) * 1000 if latencies else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+async def run_in_process(args, corpus_paths: List[str]) -> Dict:
+    import httpx
+
+    main = load_app(args)
+    results = {}
+    async with main.app.router.lifespan_context(main.app):
+        start = time.perf_counter()
+        await main.readiness.wait_ready(timeout=120)
+        results["warmup_seconds"] = time.perf_counter() - start
+
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            print(f"📁 Ingesting {len(corpus_paths)} files...")
+            results["ingest"] = await bench_ingest(client, corpus_paths, args.ingest_concurrency)
+
+            questions = generate_questions(max(args.clients * args.requests_per_client, 1), args.seed)
+            # Warm up the chain and connections before measuring
+            await bench_chat(client, questions, 1, 1)
+
+            if args.tracemalloc:
+                tracemalloc.start()
+            rss_before = rss_bytes()
+            print(f"💬 Chat: {args.clients} clients x {args.requests_per_client} requests...")
+            results["chat"] = await bench_chat(client, questions, args.clients, args.requests_per_client)
+            rss_after = rss_bytes()
+
+            memory = {
+                "rss_before_mb": rss_before / 1e6,
+                "rss_after_mb": rss_after / 1e6,
+                "rss_growth_mb": (rss_after - rss_before) / 1e6,
+            }
+            if args.tracemalloc:
+                current, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                memory["traced_current_mb"] = current / 1e6
+                memory["traced_peak_mb"] = peak / 1e6
+            results["memory"] = memory
+    return results
+
+
+def measure_startup(repeat: int) -> Dict:
+    from bench_startup import measure_import_wall_time
+    return measure_import_wall_time("main", repeat)
+
+
+def _get(results: Dict, dotted_key: str) -> Optional[float]:
+    value = results
+    for part in dotted_key.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def compare_results(baseline: Dict, results: Dict, max_regression: float) -> List[str]:
+    """Print the change of each tracked metric and return those that regressed beyond max_regression"""
+    regressions = []
+    print(f"\n📊 Comparison with baseline ({baseline.get('meta', {}).get('git_commit', 'unknown')})")
+    if baseline.get("meta", {}).get("parameters") != results["meta"]["parameters"]:
+        print("   ⚠️  Benchmark parameters differ from the baseline, results are not directly comparable")
+    for key, higher_is_better in REGRESSION_METRICS:
+        old, new = _get(baseline, key), _get(results, key)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old if old else 0.0
+        worse = -change if higher_is_better else change
+        marker = "❌" if worse > max_regression else "✅"
+        print(f"   {marker} {key:28s} {old:12.3f} -> {new:12.3f} ({change:+.1%})")
+        if worse > max_regression:
+            regressions.append(key)
+    return regressions
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="InfoPop offline benchmark suite")
+    parser.add_argument("--files", type=int, default=30, help="Number of corpus files")
+    parser.add_argument("--words-per-file", type=int, default=2000, help="Approximate words per file")
+    parser.add_argument("--formats", default="txt,pdf,docx", help="Comma-separated corpus formats")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent chat clients")
+    parser.add_argument("--requests-per-client", type=int, default=10, help="Chat requests per client")
+    parser.add_argument("--ingest-concurrency", type=int, default=1, help="Concurrent uploads")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Fake chat model latency (s)")
+    parser.add_argument("--embedding-latency", type=float, default=0.01, help="Fake embedding call latency (s)")
+    parser.add_argument("--embedding-latency-per-text", type=float, default=0.0005,
+                        help="Fake embedding latency per text (s)")
+    parser.add_argument("--embedding-dim", type=int, default=256, help="Fake embedding dimension")
+    parser.add_argument("--startup-repeat", type=int, default=3, help="Fresh interpreters for startup time (0 to skip)")
+    parser.add_argument("--tracemalloc", action="store_true", help="Also trace Python allocations during chat")
+    parser.add_argument("--seed", type=int, default=0, help="Corpus and question seed")
+    parser.add_argument("--work-dir", help="Scratch directory (default: a temporary directory)")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="Compare with a previous results JSON file")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="Allowed relative regression per metric when comparing")
+    args = parser.parse_args()
+
+    print("🔍 InfoPop Offline Benchmark")
+    print("=" * 50)
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="infopop-bench-")
+    configure_environment(work_dir)
+    try:
+        corpus_paths = generate_corpus(
+            os.path.join(work_dir, "corpus"), args.files, args.words_per_file,
+            formats=args.formats.split(","), seed=args.seed
+        )
+
+        results = {
+            "meta": {
+                "timestamp": datetime.now().isoformat(),
+                "git_commit": _git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "parameters": {key: value for key, value in vars(args).items()
+                               if key not in ("output", "baseline", "work_dir")},
+            }
+        }
+        if args.startup_repeat > 0:
+            print("🚀 Measuring startup time...")
+            results["startup"] = measure_startup(args.startup_repeat)
+        results.update(asyncio.run(run_in_process(args, corpus_paths)))
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    ingest, chat = results["ingest"], results["chat"]
+    print(f"\n✅ Ingest: {ingest['files_per_second']:.2f} files/s, {ingest['mb_per_second']:.2f} MB/s, "
+          f"{ingest['chunks_per_second']:.1f} chunks/s ({ingest['errors']} errors)")
+    print(f"✅ Chat: p50 {chat['p50_ms']:.1f} ms, p95 {chat['p95_ms']:.1f} ms, "
+          f"{chat['throughput_rps']:.1f} req/s ({chat['errors']} errors)")
+    print(f"✅ Memory: RSS growth {results['memory']['rss_growth_mb']:.1f} MB during chat")
+    if "startup" in results:
+        print(f"✅ Startup: import main {results['startup']['median_seconds'] * 1000:.1f} ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_results(baseline, results, args.max_regression)
+        if regressions:
+            print(f"\n❌ Regressions beyond {args.max_regression:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
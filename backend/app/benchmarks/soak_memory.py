@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Memory soak test
+
+Boots the app in-process with the fake models (see run_benchmarks.py),
+ingests a small corpus and drives synthetic /chat traffic in rounds: every
+round opens new conversations and continues some of the previous ones, the
+way real users do. RSS is sampled after each round (after a full garbage
+collection); the rounds before --warmup-rounds only fill caches and pools.
+Exits with status 1 when RSS grew more than --max-rss-growth-mb over the
+measured rounds, so it can gate a CI job.
+
+With --tracemalloc, memory diagnostics are enabled (MEMORY_DIAGNOSTICS=1,
+see utils_memory) and the allocation sites that grew the most between the
+first and the last measured round are printed.
+
+Usage (from backend/app):
+    python benchmarks/soak_memory.py --rounds 20 --requests-per-round 200
+    python benchmarks/soak_memory.py --rounds 10 --tracemalloc --max-rss-growth-mb 20
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from corpus import generate_corpus, generate_questions  # noqa: E402
+from run_benchmarks import bench_ingest, configure_environment, load_app, rss_bytes  # noqa: E402
+
+
+async def chat_round(client, questions: List[str], round_index: int, requests: int, clients: int) -> int:
+    """`requests` chat requests, half in new conversations; returns the number of errors"""
+    errors = 0
+    queue = list(range(requests))
+
+    async def worker():
+        nonlocal errors
+        while queue:
+            i = queue.pop()
+            # Every other request continues a conversation of the previous round
+            conversation_round = round_index - (i % 2) if round_index else 0
+            response = await client.post("/chat", json={
+                "message": questions[(round_index * requests + i) % len(questions)],
+                "conversation_id": f"soak-{conversation_round}-{i // 2}",
+            })
+            if response.status_code != 200:
+                errors += 1
+                if errors <= 3:
+                    print(f"   ❌ /chat: {response.status_code} {response.text[:200]}")
+
+    await asyncio.gather(*(worker() for _ in range(clients)))
+    return errors
+
+
+async def run(args, corpus_paths: List[str]) -> Dict:
+    import httpx
+
+    main = load_app(args)
+    from utils_memory import memory_diagnostics
+
+    samples = []
+    errors = 0
+    async with main.app.router.lifespan_context(main.app):
+        await main.readiness.wait_ready(timeout=120)
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://soak", timeout=None) as client:
+            await bench_ingest(client, corpus_paths, 1)
+            questions = generate_questions(max(args.requests_per_round, 1) * 4, args.seed)
+            snapshots = []
+            for round_index in range(args.warmup_rounds + args.rounds):
+                start = time.perf_counter()
+                errors += await chat_round(client, questions, round_index, args.requests_per_round, args.clients)
+                gc.collect()
+                seconds = time.perf_counter() - start
+                # A snapshot holds every trace in memory: take the first before sampling, so it is in every sample
+                if args.tracemalloc and round_index == args.warmup_rounds:
+                    snapshots.append(memory_diagnostics.take_snapshot()["id"])
+                sample = {"round": round_index, "seconds": seconds, "rss_mb": rss_bytes() / 1e6,
+                          "objects": memory_diagnostics.object_counts()}
+                samples.append(sample)
+                if args.tracemalloc and round_index == args.warmup_rounds + args.rounds - 1:
+                    snapshots.append(memory_diagnostics.take_snapshot()["id"])
+                marker = "  (warmup)" if round_index < args.warmup_rounds else ""
+                print(f"   round {round_index:>3}: RSS {sample['rss_mb']:7.1f} MB, "
+                      f"{sample['objects'].get('conversations', 0)} conversations{marker}")
+            diff = memory_diagnostics.diff(*snapshots, limit=args.top) if len(snapshots) == 2 else None
+
+    measured = samples[args.warmup_rounds:]
+    growth = measured[-1]["rss_mb"] - measured[0]["rss_mb"]
+    requests = args.requests_per_round * (len(measured) - 1)
+    return {
+        "errors": errors,
+        "rss_start_mb": measured[0]["rss_mb"],
+        "rss_end_mb": measured[-1]["rss_mb"],
+        "rss_growth_mb": growth,
+        "rss_growth_mb_per_1000_requests": growth / requests * 1000 if requests else 0.0,
+        "samples": samples,
+        "tracemalloc_diff": diff,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory soak test with synthetic chat traffic")
+    parser.add_argument("--rounds", type=int, default=10, help="Measured rounds")
+    parser.add_argument("--warmup-rounds", type=int, default=2, help="Rounds before the first RSS sample")
+    parser.add_argument("--requests-per-round", type=int, default=100)
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent chat clients")
+    parser.add_argument("--files", type=int, default=6, help="Number of corpus files")
+    parser.add_argument("--words-per-file", type=int, default=1000)
+    parser.add_argument("--max-rss-growth-mb", type=float, default=50.0,
+                        help="Fail when RSS grows more than this over the measured rounds")
+    parser.add_argument("--tracemalloc", action="store_true", help="Trace allocations and print the top growth")
+    parser.add_argument("--top", type=int, default=10, help="Allocation sites printed with --tracemalloc")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Fake chat model latency (s)")
+    parser.add_argument("--embedding-latency", type=float, default=0.0)
+    parser.add_argument("--embedding-latency-per-text", type=float, default=0.0)
+    parser.add_argument("--embedding-dim", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+    if args.rounds < 2:
+        parser.error("--rounds must be at least 2")
+
+    print("🧪 InfoPop Memory Soak Test")
+    print("=" * 50)
+    work_dir = tempfile.mkdtemp(prefix="infopop-soak-")
+    configure_environment(work_dir)
+    if args.tracemalloc:
+        os.environ["MEMORY_DIAGNOSTICS"] = "1"
+    try:
+        corpus_paths = generate_corpus(os.path.join(work_dir, "corpus"), args.files, args.words_per_file,
+                                       formats=["txt"], seed=args.seed)
+        results = asyncio.run(run(args, corpus_paths))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"\n📈 RSS {results['rss_start_mb']:.1f} → {results['rss_end_mb']:.1f} MB "
+          f"({results['rss_growth_mb']:+.1f} MB, {results['rss_growth_mb_per_1000_requests']:+.2f} MB per 1000 requests, "
+          f"{results['errors']} errors)")
+    diff = results["tracemalloc_diff"]
+    if diff:
+        print(f"🔬 Traced growth {diff['traced_growth_bytes'] / 1e6:+.2f} MB, top allocation sites:")
+        for stat in diff["top"]:
+            print(f"   {stat['size_diff_bytes'] / 1024:+10.1f} KB {stat['count_diff']:+8d}  {stat['location']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+        print(f"📝 Results written to {args.output}")
+
+    if results["errors"] or results["rss_growth_mb"] > args.max_rss_growth_mb:
+        print(f"❌ Soak failed: RSS growth limit {args.max_rss_growth_mb:.1f} MB, {results['errors']} errors")
+        sys.exit(1)
+    print("✅ Soak passed")
+
+
+if __name__ == "__main__":
+    main()
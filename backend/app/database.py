@@ -1,17 +1,94 @@
+import os
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlmodel import SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 # 数据库连接配置
 sqlite_file_name = "database.db"
 sqlite_file_path = "../data"
-sqlite_url = f"sqlite:///{sqlite_file_path}/{sqlite_file_name}"
+sqlite_url = os.getenv("DATABASE_URL", f"sqlite:///{sqlite_file_path}/{sqlite_file_name}")
+
+SQL_ECHO = os.getenv("SQL_ECHO", "1") == "1"
+# Compiled SQL per statement shape (SQLAlchemy) and prepared statements per
+# connection (sqlite3)
+STATEMENT_CACHE_SIZE = int(os.getenv("STATEMENT_CACHE_SIZE", "500"))
+# Connections of the async pool; SQLite still runs one writer at a time
+ASYNC_POOL_SIZE = int(os.getenv("ASYNC_POOL_SIZE", "5"))
+
+def async_database_url(url: str) -> str:
+    """The async driver URL for a sync one: sqlite:// -> sqlite+aiosqlite://"""
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    return url
+
+engine = create_engine(
+    sqlite_url, echo=SQL_ECHO, query_cache_size=STATEMENT_CACHE_SIZE,
+    connect_args={"check_same_thread": False}
+)
+
+# Async engine for the FastAPI handlers (see utils_db_async); one engine and
+# connection pool per process. aiosqlite runs each connection in its own
+# thread, so queries no longer block the event loop.
+async_engine = create_async_engine(
+    os.getenv("ASYNC_DATABASE_URL", async_database_url(sqlite_url)),
+    echo=SQL_ECHO,
+    query_cache_size=STATEMENT_CACHE_SIZE,
+    pool_size=ASYNC_POOL_SIZE,
+    connect_args={"cached_statements": STATEMENT_CACHE_SIZE},
+)
+async_session = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
 
-engine = create_engine(sqlite_url, echo=True, connect_args={"check_same_thread": False})
+@event.listens_for(engine, "connect")
+@event.listens_for(async_engine.sync_engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers proceed while another worker process writes, and the
+    # busy timeout makes concurrent writers wait instead of failing
+    if engine.dialect.name == "sqlite":
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+def upgrade_existing_tables(existing_tables: set):
+    """
+    Add the nullable columns and the indexes that create_all skips on tables that already exist
+
+    existing_tables are the tables there were before create_all. Only additive
+    changes; anything else still needs a migration tool. When the log rollups
+    table is new on a database that already has logs, it is filled from them
+    once.
+    """
+    from sqlalchemy import inspect
+
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in SQLModel.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable and not column.primary_key:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    connection.exec_driver_sql(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}')
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+    if "application_logs" in existing_tables and "application_log_rollups" not in existing_tables:
+        from utils_db import rebuild_log_rollups
+        print(f"📊 Log rollups backfilled: {rebuild_log_rollups()} rows")
 
 def create_db_and_tables():
+    from sqlalchemy import inspect
+
+    existing_tables = set(inspect(engine).get_table_names())
     SQLModel.metadata.create_all(engine)
     # 这个方法会根据你定义的 SQLModel 类自动在数据库中创建表。
     # 它只会创建不存在的表，不会删除或修改已存在的表结构（比如不会自动新增字段、删除字段等）。
     # 只有当你修改了 SQLModel 类（比如新增了一个表或字段）
     # 并且希望数据库同步这些变化时，才需要重新执行一次。
     # 但注意：create_all 只会创建新表或新字段，不会自动删除旧字段或修改字段类型。
-    # 如果需要复杂的结构变更，推荐用 Alembic 这类数据库迁移工具。
\ No newline at end of file
+    # 如果需要复杂的结构变更，推荐用 Alembic 这类数据库迁移工具。
+    # 新增的可空字段和索引由 upgrade_existing_tables 补到已存在的表上
+    upgrade_existing_tables(existing_tables)
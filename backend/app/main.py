@@ -1,24 +1,40 @@
+import asyncio
 import os
+import time
 import uuid
-from typing import List, Dict, Any, Optional
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from datetime import datetime, timezone
 
 from dotenv import load_dotenv # environment variables
-from fastapi import FastAPI, File, HTTPException, Body, Query, UploadFile
+# Opt-in memory diagnostics (MEMORY_DIAGNOSTICS=1); imported first so tracemalloc sees startup allocations
+from utils_memory import memory_diagnostics
+from fastapi import FastAPI, File, Form, HTTPException, Body, Header, Query, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, Field
 
-from langchain_core.messages import HumanMessage, AIMessage
-
 # Import our new AI service
-from services_LLM import AIService, ModelConfig
+from services_LLM import AIService, ModelHealthMonitor, ModelInfo
 # Import Pydantic models
-from models_pydantic import ChatMessage, ChatRequest, ChatResponse
-# Import database and utils
-from database import create_db_and_tables
-from utils_db import insert_application_logs, get_chat_history
-from utils_chroma import index_document_to_chroma, delete_doc_from_chroma, get_vector_store
-from utils_langchain import get_rag_chain
+from models_pydantic import (
+    BatchChatRequest, BatchChatResult, BatchQuestion, ChatMessage, ChatRequest, ChatResponse, LogRollup, PromptInfo,
+    PromptDetail, PromptUsage, UploadInitRequest, UploadSession
+)
+# Startup readiness; the database, LangChain and Chroma modules are imported
+# by the warmup task or on first use, keeping cold start fast
+from utils_startup import readiness, warmup
+# State shared between worker processes in multi-worker mode
+from utils_shared_state import SHARED_STATE, SQLiteConversationHistory
+# Request tracing and Prometheus metrics
+from utils_metrics import http_request_duration, metrics_registry, record_token_usage, stage, start_trace
+# Admission control: priority queue for LLM and ingestion work, token bucket rate limits
+from utils_admission import (
+    PRIORITY_BATCH, PRIORITY_CHAT, PRIORITY_INGEST, admission, client_key, client_rate_limiter,
+    conversation_rate_limiter
+)
 
 # Load environment variables from parent directory
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), "..", ".env"))
@@ -28,33 +44,84 @@ MODEL_CONFIG_FILE = os.path.join(os.path.dirname(__file__), "..", "model_config.
 
 # Initialize AI service
 ai_service = AIService(MODEL_CONFIG_FILE)
+# Last-known model status and latency, probed in the background
+model_health = ModelHealthMonitor(ai_service)
+
+# /chat/batch limits
+BATCH_CHAT_MAX_QUESTIONS = int(os.getenv("BATCH_CHAT_MAX_QUESTIONS", "1000"))
+BATCH_CHAT_MAX_CONCURRENCY = int(os.getenv("BATCH_CHAT_MAX_CONCURRENCY", "8"))
 
-# Initialize database tables
-create_db_and_tables()
+# Conversation history limits: least recently used in-memory conversations are
+# dropped beyond the first; only the newest messages up to the second are kept
+# in memory and read back from SQLite in multi-worker mode
+CONVERSATION_HISTORY_MAX_CONVERSATIONS = int(os.getenv("CONVERSATION_HISTORY_MAX_CONVERSATIONS", "10000"))
+CONVERSATION_HISTORY_MAX_MESSAGES = int(os.getenv("CONVERSATION_HISTORY_MAX_MESSAGES", "200"))
 
 class ConversationHistory:
-    def __init__(self):
-        self.conversations: Dict[str, List[ChatMessage]] = {}
+    def __init__(self, max_conversations: int = CONVERSATION_HISTORY_MAX_CONVERSATIONS,
+                 max_messages: int = CONVERSATION_HISTORY_MAX_MESSAGES):
+        self.conversations: "OrderedDict[str, List[ChatMessage]]" = OrderedDict()
+        self.max_conversations = max_conversations
+        self.max_messages = max_messages
     
     def add_message(self, conversation_id: str, message: ChatMessage):
         if conversation_id not in self.conversations:
             self.conversations[conversation_id] = []
-        self.conversations[conversation_id].append(message)
+            while len(self.conversations) > self.max_conversations:
+                self.conversations.popitem(last=False)
+        self.conversations.move_to_end(conversation_id)
+        messages = self.conversations[conversation_id]
+        messages.append(message)
+        if len(messages) > self.max_messages:
+            del messages[:len(messages) - self.max_messages]
     
     def get_messages(self, conversation_id: str) -> List[ChatMessage]:
         return self.conversations.get(conversation_id, [])
+
+    def message_count(self) -> int:
+        return sum(len(messages) for messages in self.conversations.values())
     
     def clear_conversation(self, conversation_id: str):
         if conversation_id in self.conversations:
             del self.conversations[conversation_id]
 
-# Global conversation history
-conversation_history = ConversationHistory()
+    # Same interface as SQLiteConversationHistory; in memory nothing blocks
+
+    async def aadd_message(self, conversation_id: str, message: ChatMessage):
+        self.add_message(conversation_id, message)
+
+    async def aget_messages(self, conversation_id: str) -> List[ChatMessage]:
+        return self.get_messages(conversation_id)
+
+    async def aclear_conversation(self, conversation_id: str):
+        self.clear_conversation(conversation_id)
+
+# Global conversation history; in multi-worker mode it lives in SQLite so that
+# every worker sees the same conversations
+conversation_history = (SQLiteConversationHistory(max_messages=CONVERSATION_HISTORY_MAX_MESSAGES) if SHARED_STATE
+                        else ConversationHistory())
+if not SHARED_STATE:
+    memory_diagnostics.register_count("conversations", lambda: len(conversation_history.conversations))
+    memory_diagnostics.register_count("conversation_messages", conversation_history.message_count)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Database tables, the default prompt and heavy modules are initialized in
+    # the background so the server accepts connections immediately
+    warmup_task = asyncio.create_task(warmup())
+    model_health.start()
+    yield
+    warmup_task.cancel()
+    await model_health.stop()
+    # Close the async database pool (its aiosqlite connection threads)
+    from database import async_engine
+    await async_engine.dispose()
 
 app = FastAPI(
     title="LangChain Chat - InfoPoP",
     description="A simple API for interacting with LangChain chat models.",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -65,35 +132,81 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    traced_before = memory_diagnostics.traced_memory() if memory_diagnostics.enabled else 0
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Use the route template so path parameters don't explode label cardinality
+        route = request.scope.get("route")
+        route_path = route.path if route is not None else "unmatched"
+        http_request_duration.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=route_path,
+            status=status
+        )
+        if memory_diagnostics.enabled:
+            memory_diagnostics.record_request(route_path, memory_diagnostics.traced_memory() - traced_before)
+
 @app.get("/")
 async def read_root():
     return {"message": "Welcome to the InfoPoP Chat API!"}
 
-@app.get("/models", response_model=List[ModelConfig])
+@app.get("/models", response_model=List[ModelInfo])
 async def get_available_models():
-    """Get list of available AI models"""
-    return ai_service.load_model_configs()
+    """Get list of available AI models with their last-known status and latency"""
+    return await model_health.model_infos()
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat_with_ai(request: ChatRequest):
-    """Send a message to AI and get response"""
+@app.get("/prompts", response_model=List[PromptInfo])
+async def get_available_prompts():
+    """List prompt configurations with their token counts per model (served from the prompt cache)"""
+    from prompt_loader import prompt_registry
+    model_names = [config.name for config in ai_service.load_model_configs()]
+    return [prompt.to_dict(model_names) for prompt in prompt_registry.list_prompts()]
+
+@app.get("/prompts/{prompt_name}", response_model=PromptDetail)
+async def get_prompt(prompt_name: str):
+    """Get a single compiled prompt, including the formatted system prompt"""
+    from prompt_loader import get_compiled_prompt
     try:
-        # Generate conversation ID if not provided
-        conversation_id = request.conversation_id or str(uuid.uuid4())
-        
-        # Get the chat model
-        chat_model = ai_service.get_chat_model(request.model_name or "gpt-3.5-turbo")
-        
+        prompt = get_compiled_prompt(prompt_name)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Prompt not found: {prompt_name}")
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    model_names = [config.name for config in ai_service.load_model_configs()]
+    return {**prompt.to_dict(model_names), "system_prompt": prompt.system_prompt}
+
+async def answer_question(conversation_id: str, message: str, model_name: str, prompt_name: Optional[str],
+                          build_chain: Callable[[], Any], priority: int = PRIORITY_CHAT,
+                          knowledge_base: Optional[str] = None) -> Tuple[str, Dict[str, int]]:
+    """
+    Answer one question in a conversation: history, RAG generation, logging
+
+    `build_chain` returns the RAG chain and is only called by the request that
+    actually runs the generation. Returns the answer and its token usage.
+    """
+    from utils_db_async import insert_application_logs
+    from utils_langchain import answer_flight, PromptUsageCallbackHandler, StageTimingCallbackHandler
+
+    start = time.perf_counter()
+    with stage("history"):
         # Add user message to history
         user_message = ChatMessage(
-            content=request.message,
+            content=message,
             from_user=True,
             timestamp=datetime.now()
         )
-        conversation_history.add_message(conversation_id, user_message)
+        await conversation_history.aadd_message(conversation_id, user_message)
         
         # Get conversation history for context
-        messages = conversation_history.get_messages(conversation_id)
+        messages = await conversation_history.aget_messages(conversation_id)
         
         # Convert to LangChain chat history format
         chat_history = []
@@ -102,143 +215,454 @@ async def chat_with_ai(request: ChatRequest):
                 chat_history.append(("human", msg.content))
             else:
                 chat_history.append(("ai", msg.content))
-        
-        # Get AI response using RAG chain
-        try:
-            rag_chain = get_rag_chain(request.model_name or "gpt-3.5-turbo")
+    
+    async def generate_answer():
+        # Only the request that actually runs the generation takes an admission slot
+        async with admission.slot(priority):
+            with stage("build_chain"):
+                rag_chain = build_chain()
+            usage_handler = PromptUsageCallbackHandler()
             response = await rag_chain.ainvoke({
-                "input": request.message,
+                "input": message,
                 "chat_history": chat_history
-            })
-            ai_response_content = response["answer"]
-        except Exception as model_error:
-            # Use AI service error handler
-            raise ai_service.handle_ai_error(model_error, request.model_name or "gpt-3.5-turbo")
-        
-        if not ai_response_content:
-            raise HTTPException(
-                status_code=500, 
-                detail="AI model returned empty response"
-            )
-        
-        # Add AI message to history
-        ai_message = ChatMessage(
-            content=ai_response_content,
-            from_user=False,
-            timestamp=datetime.now()
+            }, config={"callbacks": [usage_handler, StageTimingCallbackHandler()]})
+        usage = usage_handler.summary()
+        # Recorded once per generation, not once per waiting request
+        record_token_usage(model_name, usage)
+        return response["answer"], usage
+
+    # Get AI response using RAG chain; identical concurrent questions
+    # (same model, prompt, scope and history) share one generation
+    try:
+        answer_key = (model_name, prompt_name, knowledge_base, message, tuple(chat_history))
+        ai_response_content, usage = await answer_flight.do(answer_key, generate_answer)
+    except HTTPException:
+        raise
+    except Exception as model_error:
+        # Use AI service error handler
+        raise ai_service.handle_ai_error(model_error, model_name)
+    
+    if not ai_response_content:
+        raise HTTPException(
+            status_code=500, 
+            detail="AI model returned empty response"
         )
-        conversation_history.add_message(conversation_id, ai_message)
-        
-        # Log to database
-        insert_application_logs(
+    
+    # Add AI message to history
+    ai_message = ChatMessage(
+        content=ai_response_content,
+        from_user=False,
+        timestamp=datetime.now()
+    )
+    await conversation_history.aadd_message(conversation_id, ai_message)
+    
+    # Log to database
+    with stage("db_log"):
+        await insert_application_logs(
             session_id=conversation_id,
-            user_query=request.message,
+            user_query=message,
             gpt_response=ai_response_content,
-            model=request.model_name or "gpt-3.5-turbo"
-        )
-        
-        return ChatResponse(
-            message=ai_response_content,
-            conversation_id=conversation_id,
-            model_used=request.model_name or "gpt-3.5-turbo",
-            timestamp=datetime.now()
+            model=model_name,
+            latency_ms=round((time.perf_counter() - start) * 1000, 1)
         )
+    return ai_response_content, usage
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat_with_ai(request: ChatRequest, http_request: Request):
+    """Send a message to AI and get response"""
+    # Rate limits are checked before any work is done
+    client_rate_limiter.check(client_key(http_request), PRIORITY_CHAT)
+    conversation_rate_limiter.check(request.conversation_id, PRIORITY_CHAT)
+    await readiness.wait_ready()
+    try:
+        from utils_langchain import get_rag_chain
+        from prompt_loader import get_compiled_prompt
+
+        with start_trace() as trace:
+            # Generate conversation ID if not provided
+            conversation_id = request.conversation_id or str(uuid.uuid4())
+            model_name = request.model_name or "gpt-3.5-turbo"
+            
+            # Get the chat model
+            chat_model = ai_service.get_chat_model(model_name)
+
+            # Validate the requested prompt before touching the conversation
+            if request.prompt_name:
+                try:
+                    get_compiled_prompt(request.prompt_name)
+                except FileNotFoundError:
+                    raise HTTPException(status_code=404, detail=f"Prompt not found: {request.prompt_name}")
+
+            ai_response_content, usage = await answer_question(
+                conversation_id, request.message, model_name, request.prompt_name,
+                lambda: get_rag_chain(model_name, request.prompt_name, llm=chat_model)
+            )
+
+            return ChatResponse(
+                message=ai_response_content,
+                conversation_id=conversation_id,
+                model_used=model_name,
+                timestamp=datetime.now(),
+                usage=usage,
+                timings=trace.timings_ms() if request.include_timings else None
+            )
         
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
+@app.post("/chat/batch")
+async def chat_batch(request: BatchChatRequest, http_request: Request):
+    """
+    Answer many questions in one request, streaming NDJSON results as they finish
+
+    Questions run BATCH_CHAT_MAX_CONCURRENCY at a time (or request.concurrency
+    if lower) behind interactive chat in the admission queue; those sharing a
+    conversation_id run in order. The RAG chain is built once per knowledge
+    base, the distinct questions are embedded up front in batched calls, and
+    identical (rewritten) queries share one retrieval. Each line is a
+    BatchChatResult; failed questions carry error and status_code.
+    """
+    client_rate_limiter.check(client_key(http_request), PRIORITY_BATCH)
+    if len(request.questions) > BATCH_CHAT_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many questions: {len(request.questions)}. At most {BATCH_CHAT_MAX_QUESTIONS} per batch"
+        )
+    await readiness.wait_ready()
+    from utils_langchain import RetrievalMemo, get_rag_chain, retrieval_memo
+    from prompt_loader import get_compiled_prompt
+
+    model_name = request.model_name or "gpt-3.5-turbo"
+    chat_model = ai_service.get_chat_model(model_name)
+    if request.prompt_name:
+        try:
+            get_compiled_prompt(request.prompt_name)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail=f"Prompt not found: {request.prompt_name}")
+
+    chains: Dict[Optional[str], Any] = {}
+
+    def build_chain(knowledge_base: Optional[str]):
+        if knowledge_base not in chains:
+            chains[knowledge_base] = get_rag_chain(
+                model_name, request.prompt_name, llm=chat_model, knowledge_base=knowledge_base
+            )
+        return chains[knowledge_base]
+
+    # Questions of one conversation run in order; questions without one are independent
+    groups: Dict[str, List[Tuple[int, BatchQuestion]]] = {}
+    for index, question in enumerate(request.questions):
+        groups.setdefault(question.conversation_id or str(uuid.uuid4()), []).append((index, question))
+
+    semaphore = asyncio.Semaphore(min(request.concurrency or BATCH_CHAT_MAX_CONCURRENCY, BATCH_CHAT_MAX_CONCURRENCY))
+    results: asyncio.Queue = asyncio.Queue()
+    memo = RetrievalMemo()
+
+    async def run_group(conversation_id: str, questions: List[Tuple[int, BatchQuestion]]):
+        # Every group task sees the same memo
+        retrieval_memo.set(memo)
+        for index, question in questions:
+            start = time.perf_counter()
+            result = BatchChatResult(index=index, conversation_id=conversation_id, seconds=0.0)
+            try:
+                async with semaphore:
+                    result.message, usage = await answer_question(
+                        conversation_id, question.message, model_name, request.prompt_name,
+                        lambda: build_chain(question.knowledge_base), PRIORITY_BATCH, question.knowledge_base
+                    )
+                result.usage = PromptUsage(**usage)
+            except HTTPException as e:
+                result.error, result.status_code = str(e.detail), e.status_code
+            except Exception as e:
+                result.error, result.status_code = f"Unexpected error: {str(e)}", 500
+            result.seconds = time.perf_counter() - start
+            await results.put(result)
+
+    async def stream_results():
+        try:
+            await memo.prefetch_embeddings([question.message for question in request.questions])
+        except Exception as e:
+            # Not fatal: the questions embed their queries on their own
+            print(f"Error prefetching batch query embeddings: {e}")
+        tasks = [asyncio.create_task(run_group(conversation_id, questions))
+                 for conversation_id, questions in groups.items()]
+        try:
+            for _ in range(len(request.questions)):
+                result = await results.get()
+                yield result.model_dump_json(exclude_none=True) + "\n"
+        finally:
+            # The client went away: stop the questions still running
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
 @app.get("/conversation/{conversation_id}", response_model=List[ChatMessage])
 async def get_conversation_history(conversation_id: str):
     """Get conversation history"""
-    return conversation_history.get_messages(conversation_id)
+    return await conversation_history.aget_messages(conversation_id)
 
 @app.delete("/conversation/{conversation_id}")
 async def clear_conversation(conversation_id: str):
     """Clear conversation history"""
-    conversation_history.clear_conversation(conversation_id)
+    await conversation_history.aclear_conversation(conversation_id)
     return {"message": "Conversation cleared successfully"}
 
+@app.get("/logs/export")
+async def export_logs(
+    start: Optional[datetime] = Query(None, description="From this time (inclusive), ISO 8601"),
+    end: Optional[datetime] = Query(None, description="Until this time (exclusive), ISO 8601"),
+    model: Optional[str] = Query(None),
+    session_id: Optional[str] = Query(None),
+    compression: Optional[str] = Query(None, pattern="^zstd$", description="zstd to compress the output"),
+):
+    """Stream the application logs as NDJSON, oldest first (see utils_log_export)"""
+    from utils_log_export import export_logs as stream_logs
+
+    filename = "application_logs.ndjson" + (".zst" if compression else "")
+    # A sync iterator: Starlette pulls it in a worker thread, so the database reads don't block the event loop
+    return StreamingResponse(
+        stream_logs(compression, start=start, end=end, model=model, session_id=session_id),
+        media_type="application/zstd" if compression else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@app.get("/logs/rollups", response_model=List[LogRollup])
+async def get_log_rollups(
+    start: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}-\d{2}$", description="First day, YYYY-MM-DD"),
+    end: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}-\d{2}$", description="Last day, YYYY-MM-DD (inclusive)"),
+    model: Optional[str] = Query(None),
+):
+    """Per-model, per-day request counts, response lengths and latency, maintained on insert"""
+    from utils_db_async import get_log_rollups as load_rollups
+    from utils_log_export import rollup_to_dict
+
+    return [rollup_to_dict(rollup) for rollup in await load_rollups(start, end, model)]
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "timestamp": datetime.now()}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus metrics: request and pipeline stage latency, tokens, cache hits and ingest throughput"""
+    if memory_diagnostics.enabled:
+        memory_diagnostics.object_counts()
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+def require_memory_diagnostics():
+    if not memory_diagnostics.enabled:
+        raise HTTPException(status_code=404, detail="Memory diagnostics are disabled; set MEMORY_DIAGNOSTICS=1")
+
+@app.get("/debug/memory")
+async def get_memory_status(gc: bool = Query(False, description="Also count live objects by type (walks the heap)")):
+    """RSS, traced memory, object counts and memory retained per route (MEMORY_DIAGNOSTICS=1)"""
+    require_memory_diagnostics()
+    return memory_diagnostics.status(include_gc=gc)
+
+@app.post("/debug/memory/snapshots")
+async def take_memory_snapshot():
+    """Take a tracemalloc snapshot to diff against a later one"""
+    require_memory_diagnostics()
+    return await asyncio.to_thread(memory_diagnostics.take_snapshot)
+
+@app.get("/debug/memory/snapshots/{first}/diff/{second}")
+async def diff_memory_snapshots(first: int, second: int, limit: int = Query(20, ge=1, le=500)):
+    """The allocation sites that grew the most between two snapshots"""
+    require_memory_diagnostics()
+    try:
+        return await asyncio.to_thread(memory_diagnostics.diff, first, second, limit)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness endpoint: 503 until the deferred warmup has finished"""
+    return JSONResponse(
+        status_code=200 if readiness.is_ready else 503,
+        content=jsonable_encoder(readiness.to_dict())
+    )
+
 @app.get("/test-model/{model_name}")
-async def test_model(model_name: str):
-    """Test if a specific model is working"""
-    return await ai_service.test_model(model_name)
+async def test_model(model_name: str, refresh: bool = Query(False, description="Probe the model now instead of returning the last result")):
+    """Test if a specific model is working (served from the background probes, see ModelHealthMonitor)"""
+    if ai_service.catalog.get(model_name) is None:
+        raise HTTPException(status_code=404, detail=f"Model not found: {model_name}")
+    return await model_health.test(model_name, refresh)
+
+ALLOWED_UPLOAD_EXTENSIONS = {".txt", ".pdf", ".docx", ".xlsx"}
+
+def check_upload_extension(filename: str):
+    file_extension = os.path.splitext(filename)[1].lower()
+    if file_extension not in ALLOWED_UPLOAD_EXTENSIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported file type: {file_extension}. Allowed types: {', '.join(ALLOWED_UPLOAD_EXTENSIONS)}"
+        )
+
+async def index_stored_upload(filename: str, stored, knowledge_base: Optional[str] = None) -> Dict[str, Any]:
+    """Record a file committed to the content store and index it into Chroma"""
+    from utils_chroma import index_document_to_chroma
+    from utils_content_store import release_content
+
+    # Insert document record into database
+    from utils_db_async import delete_document_record, insert_document_content, insert_document_record
+    file_id = await insert_document_record(filename)
+    await insert_document_content(file_id, stored.sha256, stored.size, stored.path)
+
+    # Index document to Chroma vector store; ingestion waits behind chat
+    # requests for an admission slot and runs off the event loop. Content
+    # seen before reuses its cached chunks and embeddings
+    try:
+        async with admission.slot(PRIORITY_INGEST):
+            success = await asyncio.to_thread(
+                index_document_to_chroma, stored.path, file_id, knowledge_base, stored.sha256
+            )
+    except HTTPException:
+        await delete_document_record(file_id)
+        await asyncio.to_thread(release_content, file_id)
+        raise
+
+    if success:
+        return {
+            "message": f"File '{filename}' uploaded and indexed successfully",
+            "file_id": file_id,
+            "filename": filename,
+            "size": stored.size,
+            "sha256": stored.sha256
+        }
+    else:
+        # Clean up if indexing failed
+        await delete_document_record(file_id)
+        await asyncio.to_thread(release_content, file_id)
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to index document to vector store"
+        )
 
 @app.post("/upload-documents")
-async def upload_and_index_documents(file: UploadFile = File(...)):
+async def upload_and_index_documents(request: Request, file: UploadFile = File(...),
+                                     knowledge_base: Optional[str] = Form(None)):
     """Endpoint to handle file uploads and index them into Chroma"""
+    client_rate_limiter.check(client_key(request), PRIORITY_INGEST)
+    await readiness.wait_ready()
     try:
         # Validate file type
-        allowed_extensions = {".txt", ".pdf", ".docx", ".xlsx"}
-        file_extension = os.path.splitext(file.filename)[1].lower()
-        if file_extension not in allowed_extensions:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Unsupported file type: {file_extension}. Allowed types: {', '.join(allowed_extensions)}"
-            )
-        
-        # Create uploads directory if it doesn't exist
-        upload_dir = os.path.join(os.path.dirname(__file__), "..", "data", "uploads")
-        os.makedirs(upload_dir, exist_ok=True)
+        check_upload_extension(file.filename)
         
-        # Save uploaded file
-        file_path = os.path.join(upload_dir, file.filename)
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-        
-        # Insert document record into database
-        from utils_db import insert_document_record
-        file_id = insert_document_record(file.filename)
-        
-        # Index document to Chroma vector store
-        success = index_document_to_chroma(file_path, file_id)
-        
-        if success:
-            return {
-                "message": f"File '{file.filename}' uploaded and indexed successfully",
-                "file_id": file_id,
-                "filename": file.filename,
-                "size": len(content)
-            }
-        else:
-            # Clean up if indexing failed
-            os.remove(file_path)
-            from utils_db import delete_document_record
-            delete_document_record(file_id)
-            raise HTTPException(
-                status_code=500,
-                detail="Failed to index document to vector store"
-            )
+        # Stream the upload into the content-addressed store, hashing it on the way
+        from utils_content_store import save_upload
+        stored = await save_upload(file)
+        return await index_stored_upload(file.filename, stored, knowledge_base)
             
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error processing file upload: {str(e)}"
         )
 
+def _upload_session(upload_id: str) -> Dict[str, Any]:
+    from utils_chunked_upload import load_session
+    session = load_session(upload_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Upload not found: {upload_id}")
+    return session
+
+@app.post("/uploads", response_model=UploadSession)
+async def create_upload(request: Request, upload: UploadInitRequest):
+    """Start a resumable chunked upload; parts go to PUT /uploads/{upload_id}/parts/{part}"""
+    client_rate_limiter.check(client_key(request), PRIORITY_INGEST)
+    check_upload_extension(upload.filename)
+    from utils_chunked_upload import create_session
+    try:
+        session = await asyncio.to_thread(
+            create_session, upload.filename, upload.size, upload.part_size, upload.knowledge_base
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except OSError as e:
+        raise HTTPException(status_code=507, detail=f"Cannot allocate the upload: {e}")
+    return UploadSession(**session)
+
+@app.get("/uploads/{upload_id}", response_model=UploadSession)
+async def get_upload(upload_id: str):
+    """State of an upload: the parts received so far, to resume an interrupted one"""
+    from utils_chunked_upload import received_parts
+    session = _upload_session(upload_id)
+    return UploadSession(**session, received=received_parts(upload_id))
+
+@app.put("/uploads/{upload_id}/parts/{part}")
+async def upload_part(upload_id: str, part: int, request: Request,
+                      x_part_sha256: Optional[str] = Header(None)):
+    """Write one part (0-based) of an upload; the body is the raw bytes, streamed to disk"""
+    from utils_chunked_upload import write_part
+    session = _upload_session(upload_id)
+    try:
+        sha256 = await write_part(session, part, request.stream(), x_part_sha256)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError:
+        # Aborted or completed while this part was in flight
+        raise HTTPException(status_code=404, detail=f"Upload not found: {upload_id}")
+    return {"upload_id": upload_id, "part": part, "sha256": sha256}
+
+@app.post("/uploads/{upload_id}/complete")
+async def complete_upload(upload_id: str):
+    """Finish an upload: hash the file, move it into the content store (a rename) and index it"""
+    await readiness.wait_ready()
+    from utils_chunked_upload import complete_upload as commit_upload
+    session = _upload_session(upload_id)
+    try:
+        stored = await asyncio.to_thread(commit_upload, upload_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Upload not found: {upload_id}")
+    try:
+        return await index_stored_upload(session["filename"], stored, session["knowledge_base"])
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error processing file upload: {str(e)}"
+        )
+
+@app.delete("/uploads/{upload_id}")
+async def abort_upload(upload_id: str):
+    """Abort an upload and delete its parts"""
+    from utils_chunked_upload import abort_upload as remove_upload
+    if not await asyncio.to_thread(remove_upload, upload_id):
+        raise HTTPException(status_code=404, detail=f"Upload not found: {upload_id}")
+    return {"message": f"Upload {upload_id} aborted"}
+
 @app.get("/documents")
 async def get_uploaded_documents():
     """Get list of all uploaded documents"""
-    from utils_db import get_all_documents
-    return get_all_documents()
+    await readiness.wait_ready()
+    from utils_db_async import get_all_documents
+    return await get_all_documents()
 
 @app.delete("/documents/{file_id}")
 async def delete_document(file_id: int):
     """Delete a document from both database and vector store"""
+    await readiness.wait_ready()
     try:
-        # Delete from Chroma vector store
-        chroma_success = delete_doc_from_chroma(file_id)
+        from utils_chroma import delete_doc_from_chroma
+
+        # Delete from Chroma vector store (SQLite as well, so off the event loop)
+        chroma_success = await asyncio.to_thread(delete_doc_from_chroma, file_id)
         
-        # Delete from database
-        from utils_db import delete_document_record
-        db_success = delete_document_record(file_id)
+        # Delete from database; the stored file goes with its last document
+        from utils_db_async import delete_document_record
+        db_success = await delete_document_record(file_id)
+        from utils_content_store import release_content
+        await asyncio.to_thread(release_content, file_id)
         
         if chroma_success and db_success:
             return {"message": f"Document {file_id} deleted successfully"}
@@ -251,8 +675,43 @@ async def delete_document(file_id: int):
             detail=f"Error deleting document: {str(e)}"
         )
 
+@app.get("/documents/{file_id}/tables")
+async def get_document_tables(file_id: int):
+    """List the numeric sheets of a spreadsheet in the table store (XLSX_COLUMNAR=1)"""
+    await readiness.wait_ready()
+    from utils_spreadsheet import list_tables
+    return await asyncio.to_thread(list_tables, file_id)
+
+@app.get("/documents/{file_id}/tables/{sheet}")
+async def get_document_table_rows(file_id: int, sheet: str, column: Optional[str] = None,
+                                  value: Optional[str] = None, limit: int = 100):
+    """Exact lookup in a stored sheet: all rows, or the rows where `column` equals `value`"""
+    await readiness.wait_ready()
+    from utils_spreadsheet import lookup_table_rows
+    try:
+        rows = await asyncio.to_thread(lookup_table_rows, file_id, sheet, column, value, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if rows is None:
+        raise HTTPException(status_code=404, detail=f"No stored table for sheet '{sheet}' of document {file_id}")
+    return {"sheet": sheet, "rows": rows}
+
 
 
 if __name__ == "__main__":
+    import argparse
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
+
+    parser = argparse.ArgumentParser(description="InfoPoP Chat API server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("INFOPOP_WORKERS", "1")),
+                        help="Number of worker processes; more than one enables shared state")
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        # Worker processes inherit the environment and switch to shared state
+        os.environ["INFOPOP_SHARED_STATE"] = "1"
+        uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers)
+    else:
+        uvicorn.run(app, host=args.host, port=args.port)
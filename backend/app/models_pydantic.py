@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 from pydantic import BaseModel, Field
 
@@ -12,9 +12,83 @@ class ChatRequest(BaseModel):
     message: str
     conversation_id: Optional[str] = None
     model_name: Optional[str] = "gpt-3.5-turbo"
+    prompt_name: Optional[str] = None
+    include_timings: bool = False
+
+class PromptUsage(BaseModel):
+    llm_calls: int = 0
+    prompt_tokens: int = 0
+    cached_prompt_tokens: int = 0
+    uncached_prompt_tokens: int = 0
+    completion_tokens: int = 0
 
 class ChatResponse(BaseModel):
     message: str
     conversation_id: str
     model_used: str
     timestamp: datetime
+    usage: Optional[PromptUsage] = None
+    timings: Optional[Dict[str, float]] = None
+
+class BatchQuestion(BaseModel):
+    message: str
+    # Questions sharing a conversation_id run in order, each seeing the previous answers
+    conversation_id: Optional[str] = None
+    # Restrict retrieval to one knowledge base
+    knowledge_base: Optional[str] = None
+
+class BatchChatRequest(BaseModel):
+    questions: List[BatchQuestion]
+    model_name: Optional[str] = "gpt-3.5-turbo"
+    prompt_name: Optional[str] = None
+    # Questions answered at once; capped by BATCH_CHAT_MAX_CONCURRENCY
+    concurrency: Optional[int] = Field(default=None, ge=1)
+
+class BatchChatResult(BaseModel):
+    # Position of the question in the request; results arrive in completion order
+    index: int
+    conversation_id: str
+    message: Optional[str] = None
+    usage: Optional[PromptUsage] = None
+    seconds: float
+    error: Optional[str] = None
+    status_code: int = 200
+
+class UploadInitRequest(BaseModel):
+    filename: str
+    size: int = Field(ge=0)
+    # Bytes per part (clamped by the server); the last part may be shorter
+    part_size: Optional[int] = Field(default=None, ge=1)
+    knowledge_base: Optional[str] = None
+
+class UploadSession(BaseModel):
+    upload_id: str
+    filename: str
+    size: int
+    part_size: int
+    parts: int
+    # Numbers of the parts received and verified so far
+    received: List[int] = []
+
+class PromptInfo(BaseModel):
+    name: str
+    title: str
+    version: Optional[str] = None
+    language: Optional[str] = None
+    sha256: str
+    modified: datetime
+    token_counts: Dict[str, Optional[int]] = {}
+
+class PromptDetail(PromptInfo):
+    system_prompt: str
+
+class LogRollup(BaseModel):
+    day: str                          # YYYY-MM-DD
+    model: str
+    requests: int
+    query_chars: int
+    response_chars: int
+    avg_query_chars: float
+    avg_response_chars: float
+    latency_samples: int              # Requests with a recorded latency
+    avg_latency_ms: Optional[float] = None
@@ -52,7 +52,7 @@ class KnowledgeBase(SQLModel, table=True):
     content: str = Field(description="条目内容")
     start_pos: int | None = Field(default=None, description="在文档中的起始位置/章节 - 可选")
     end_pos: int | None = Field(default=None, description="结束位置/章节 - 可选")
-    embedding: bytes | None = Field(default=None)
+    embedding: bytes | None = Field(default=None, description="向量，格式见 utils_embedding_codec")
     create_time: datetime | None = Field(default_factory=datetime.now)
     update_time: datetime | None = Field(default_factory=datetime.now)
     # history_ref: int | None = Field(default=None, foreign_key="history.id")  # Commented out - history table doesn't exist yet
@@ -1,6 +1,14 @@
+import hashlib
 import json
 import os
-from typing import Dict, Any
+import threading
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils_metrics import cache_requests
+
+PROMPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "prompts")
 
 def load_prompt_config(prompt_name: str = "AI_Agent_Prompt") -> Dict[str, Any]:
     """
@@ -12,9 +20,7 @@ def load_prompt_config(prompt_name: str = "AI_Agent_Prompt") -> Dict[str, Any]:
     Returns:
         Dictionary containing prompt configuration
     """
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    prompts_dir = os.path.join(os.path.dirname(current_dir), "prompts")
-    prompt_file = os.path.join(prompts_dir, f"{prompt_name}.json")
+    prompt_file = os.path.join(PROMPTS_DIR, f"{prompt_name}.json")
     
     try:
         with open(prompt_file, 'r', encoding='utf-8') as f:
@@ -89,18 +95,180 @@ def format_system_prompt(prompt_config: Dict[str, Any]) -> str:
     
     return "\n".join(prompt_parts)
 
+@lru_cache(maxsize=None)
+def _get_encoding(model: str):
+    import tiktoken
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+def count_prompt_tokens(text: str, model: str) -> Optional[int]:
+    """
+    Count the tokens of a prompt string for a model using tiktoken
+    
+    Args:
+        text: Prompt string
+        model: Model name, unknown models fall back to the cl100k_base encoding
+        
+    Returns:
+        Number of tokens, or None if tiktoken is not available
+    """
+    try:
+        return len(_get_encoding(model).encode(text))
+    except Exception as e:
+        print(f"Error counting prompt tokens for {model}: {e}")
+        return None
+
+class CompiledPrompt:
+    """A prompt file compiled once: config, formatted system prompt and templates"""
+
+    def __init__(self, name: str, path: str, raw: bytes, mtime_ns: int, size: int):
+        self.name = name
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.sha256 = hashlib.sha256(raw).hexdigest()
+        try:
+            self.config: Dict[str, Any] = json.loads(raw.decode("utf-8"))
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON in prompt file: {e}")
+        try:
+            self.system_prompt = format_system_prompt(self.config)
+        except KeyError as e:
+            raise ValueError(f"Missing key in prompt config: {e}")
+        self.token_counts: Dict[str, Optional[int]] = {}
+        self._templates: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def get_template(self, key: str, factory: Callable[[str], Any]) -> Any:
+        """Memoize a template built from the system prompt, e.g. a ChatPromptTemplate"""
+        template = self._templates.get(key)
+        if template is None:
+            with self._lock:
+                template = self._templates.get(key)
+                if template is None:
+                    template = factory(self.system_prompt)
+                    self._templates[key] = template
+        return template
+
+    def get_token_count(self, model: str) -> Optional[int]:
+        if model not in self.token_counts:
+            self.token_counts[model] = count_prompt_tokens(self.system_prompt, model)
+        return self.token_counts[model]
+
+    def to_dict(self, models: Optional[List[str]] = None) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "title": self.config.get("name", self.name),
+            "version": self.config.get("version"),
+            "language": self.config.get("language"),
+            "sha256": self.sha256,
+            "modified": datetime.fromtimestamp(self.mtime_ns / 1e9),
+            "token_counts": {model: self.get_token_count(model) for model in models or []},
+        }
+
+class PromptRegistry:
+    """
+    Cache of compiled prompts keyed by prompt name
+    
+    Each lookup only stats the prompt file. The file is re-read when its mtime
+    or size changes, and recompiled only when the content hash changed too.
+    """
+
+    def __init__(self, prompts_dir: str = PROMPTS_DIR):
+        self.prompts_dir = prompts_dir
+        self._prompts: Dict[str, CompiledPrompt] = {}
+        self._names: List[str] = []
+        self._dir_mtime_ns: Optional[int] = None
+        # Prompt name -> (mtime_ns, size) of the broken file last reported by list_prompts
+        self._reported: Dict[str, Optional[Tuple[int, int]]] = {}
+        self._lock = threading.Lock()
+
+    def _prompt_path(self, prompt_name: str) -> str:
+        if not prompt_name or os.path.basename(prompt_name) != prompt_name:
+            raise FileNotFoundError(f"Invalid prompt name: {prompt_name}")
+        return os.path.join(self.prompts_dir, f"{prompt_name}.json")
+
+    def get(self, prompt_name: str) -> CompiledPrompt:
+        """Get the compiled prompt, recompiling it if the file changed on disk"""
+        prompt_file = self._prompt_path(prompt_name)
+        try:
+            stat = os.stat(prompt_file)
+        except FileNotFoundError:
+            self._prompts.pop(prompt_name, None)
+            raise FileNotFoundError(f"Prompt file not found: {prompt_file}")
+
+        cached = self._prompts.get(prompt_name)
+        if cached and cached.mtime_ns == stat.st_mtime_ns and cached.size == stat.st_size:
+            cache_requests.inc(cache="prompt", result="hit")
+            return cached
+
+        with self._lock:
+            cache_requests.inc(cache="prompt", result="miss")
+            with open(prompt_file, "rb") as f:
+                raw = f.read()
+            if cached and cached.sha256 == hashlib.sha256(raw).hexdigest():
+                # Touched but unchanged: keep the compiled templates
+                cached.mtime_ns, cached.size = stat.st_mtime_ns, stat.st_size
+                return cached
+            compiled = CompiledPrompt(prompt_name, prompt_file, raw, stat.st_mtime_ns, stat.st_size)
+            self._prompts[prompt_name] = compiled
+            return compiled
+
+    def list_names(self) -> List[str]:
+        """Prompt names available on disk, rescanning only when the directory changed"""
+        dir_mtime_ns = os.stat(self.prompts_dir).st_mtime_ns
+        if dir_mtime_ns != self._dir_mtime_ns:
+            self._names = sorted(
+                os.path.splitext(entry)[0]
+                for entry in os.listdir(self.prompts_dir)
+                if entry.endswith(".json")
+            )
+            self._dir_mtime_ns = dir_mtime_ns
+        return self._names
+
+    def list_prompts(self) -> List[CompiledPrompt]:
+        prompts = []
+        for prompt_name in self.list_names():
+            try:
+                prompts.append(self.get(prompt_name))
+                self._reported.pop(prompt_name, None)
+            except (FileNotFoundError, KeyError, ValueError) as e:
+                # Skipped on every listing, but reported once per version of the file
+                try:
+                    stat = os.stat(self._prompt_path(prompt_name))
+                    version = (stat.st_mtime_ns, stat.st_size)
+                except FileNotFoundError:
+                    version = None
+                if prompt_name not in self._reported or self._reported[prompt_name] != version:
+                    self._reported[prompt_name] = version
+                    print(f"Error loading prompt {prompt_name}: {e}")
+        return prompts
+
+    def __len__(self) -> int:
+        return len(self._prompts)
+
+# Global prompt registry
+prompt_registry = PromptRegistry()
+
+def get_compiled_prompt(prompt_name: str = "AI_Agent_Prompt") -> CompiledPrompt:
+    """Get the cached compiled prompt for the specified prompt configuration"""
+    return prompt_registry.get(prompt_name)
+
 def get_system_prompt(prompt_name: str = "AI_Agent_Prompt") -> str:
     """
     Get formatted system prompt for the specified prompt configuration
     
+    The formatted string is cached and only rebuilt when the file changes.
+    
     Args:
         prompt_name: Name of the prompt file (without .json extension)
         
     Returns:
         Formatted system prompt string
     """
-    prompt_config = load_prompt_config(prompt_name)
-    return format_system_prompt(prompt_config)
+    return prompt_registry.get(prompt_name).system_prompt
 
 # For backward compatibility and easy access
 def get_default_system_prompt() -> str:
@@ -1,14 +1,28 @@
+import asyncio
 import os
 import json
-from typing import List, Optional
+import random
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 from fastapi import HTTPException
 from pydantic import BaseModel
 
-from langchain_core.language_models.chat_models import BaseChatModel
-from langchain_core.messages import HumanMessage
-from langchain_openai import ChatOpenAI
 from datetime import datetime
 
+from utils_metrics import cache_requests, model_probe_latency, model_up
+from utils_shared_state import shared_cache
+from utils_singleflight import SingleFlight
+
+if TYPE_CHECKING:
+    from langchain_core.language_models.chat_models import BaseChatModel
+
+# Background model health probing: every model is probed each interval
+# (seconds, ± MODEL_HEALTH_JITTER); 0 disables it and /test-model calls the model live
+MODEL_HEALTH_INTERVAL = float(os.getenv("MODEL_HEALTH_INTERVAL", "300"))
+MODEL_HEALTH_TIMEOUT = float(os.getenv("MODEL_HEALTH_TIMEOUT", "20"))
+MODEL_HEALTH_JITTER = 0.1
+
 class ModelConfig(BaseModel):
     name: str
     display_name: str
@@ -16,44 +30,100 @@ class ModelConfig(BaseModel):
     base_url: Optional[str] = None
     model_type: str = "openai"
 
+class ModelInfo(ModelConfig):
+    """A configured model with the result of its last health probe"""
+    status: str = "unknown"                # success / error / unknown (never probed)
+    latency_ms: Optional[float] = None
+    checked_at: Optional[datetime] = None
+    error: Optional[str] = None
+
+def default_model_configs() -> List[ModelConfig]:
+    """Configurations used when model_config.json doesn't exist"""
+    return [
+        ModelConfig(
+            name="gpt-3.5-turbo",
+            display_name="GPT-3.5 Turbo",
+            api_key_env="OPENAI_API_KEY",
+            model_type="openai"
+        ),
+        ModelConfig(
+            name="gpt-4",
+            display_name="GPT-4",
+            api_key_env="OPENAI_API_KEY",
+            model_type="openai"
+        )
+    ]
+
+class ModelCatalog:
+    """
+    Model configurations indexed by name
+
+    The configuration file is parsed once; each lookup only stats it and
+    reloads it when its mtime or size changed. A file that fails to parse
+    (e.g. saved halfway through an edit) keeps the last good catalog.
+    """
+
+    def __init__(self, model_config_file: str):
+        self.model_config_file = model_config_file
+        self._configs: Dict[str, ModelConfig] = {}
+        # (mtime_ns, size) of the loaded file, None when it doesn't exist
+        self._signature: Optional[Tuple[int, int]] = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.model_config_file)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _read(self) -> Optional[Dict[str, ModelConfig]]:
+        try:
+            with open(self.model_config_file, 'r', encoding='utf-8') as f:
+                return {config.name: config for config in (ModelConfig(**config) for config in json.load(f))}
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Error loading model configurations from {self.model_config_file}: {e}")
+            return None
+
+    def configs(self) -> Dict[str, ModelConfig]:
+        """The configurations by name, reloaded if the file changed on disk"""
+        signature = self._stat()
+        if self._loaded and signature == self._signature:
+            cache_requests.inc(cache="model_catalog", result="hit")
+            return self._configs
+        with self._lock:
+            if not (self._loaded and signature == self._signature):
+                cache_requests.inc(cache="model_catalog", result="miss")
+                configs = self._read() if signature is not None else None
+                if configs is None:
+                    keep = self._loaded and signature is not None
+                    configs = self._configs if keep else {config.name: config for config in default_model_configs()}
+                self._configs, self._signature, self._loaded = configs, signature, True
+            return self._configs
+
+    def list(self) -> List[ModelConfig]:
+        return list(self.configs().values())
+
+    def get(self, model_name: str) -> Optional[ModelConfig]:
+        return self.configs().get(model_name)
+
 class AIService:
     def __init__(self, model_config_file: str):
         self.model_config_file = model_config_file
+        self.catalog = ModelCatalog(model_config_file)
     
     def load_model_configs(self) -> List[ModelConfig]:
-        """Load model configurations from JSON file"""
-        try:
-            if os.path.exists(self.model_config_file):
-                with open(self.model_config_file, 'r', encoding='utf-8') as f:
-                    configs = json.load(f)
-                    return [ModelConfig(**config) for config in configs]
-        except Exception as e:
-            pass
-        
-        # Default configurations if file doesn't exist
-        return [
-            ModelConfig(
-                name="gpt-3.5-turbo",
-                display_name="GPT-3.5 Turbo",
-                api_key_env="OPENAI_API_KEY",
-                model_type="openai"
-            ),
-            ModelConfig(
-                name="gpt-4",
-                display_name="GPT-4",
-                api_key_env="OPENAI_API_KEY",
-                model_type="openai"
-            )
-        ]
+        """Model configurations from the JSON file (cached, see ModelCatalog)"""
+        return self.catalog.list()
     
     def get_model_config(self, model_name: str) -> ModelConfig:
         """Get model configuration by name"""
-        configs = self.load_model_configs()
-        
-        # Find the model config
-        for config in configs:
-            if config.name == model_name:
-                return config
+        config = self.catalog.get(model_name)
+        if config is not None:
+            return config
         
         # Default to gpt-3.5-turbo if model not found
         return ModelConfig(
@@ -63,7 +133,7 @@ class AIService:
             model_type="openai"
         )
     
-    def get_chat_model(self, model_name: str) -> BaseChatModel:
+    def get_chat_model(self, model_name: str) -> "BaseChatModel":
         """Get the appropriate chat model based on configuration"""
         model_config = self.get_model_config(model_name)
         
@@ -77,6 +147,8 @@ class AIService:
         
         # Create the model instance
         if model_config.model_type == "openai":
+            from langchain_openai import ChatOpenAI
+
             model_kwargs = {
                 "model": model_config.name,
                 "api_key": api_key,
@@ -124,8 +196,11 @@ class AIService:
                 detail=f"AI模型调用失败: {error_str}"
             )
     
-    async def test_model(self, model_name: str) -> dict:
-        """Test if a specific model is working"""
+    async def test_model(self, model_name: str, timeout: Optional[float] = None) -> dict:
+        """Test if a specific model is working, giving up after `timeout` seconds"""
+        from langchain_core.messages import HumanMessage
+
+        start = time.perf_counter()
         try:
             # Get the chat model
             chat_model = self.get_chat_model(model_name)
@@ -134,19 +209,147 @@ class AIService:
             test_message = [HumanMessage(content="Say 'Hello' in response")]
             
             # Get AI response
-            ai_response = await chat_model.ainvoke(test_message)
+            ai_response = await asyncio.wait_for(chat_model.ainvoke(test_message), timeout)
             
             return {
                 "status": "success",
                 "model": model_name,
                 "response": ai_response.content,
-                "timestamp": datetime.now()
+                "timestamp": datetime.now(),
+                "latency_ms": round((time.perf_counter() - start) * 1000, 1)
             }
             
         except Exception as e:
+            if isinstance(e, asyncio.TimeoutError) and timeout is not None:
+                e = TimeoutError(f"No response within {timeout:g}s")
             return {
                 "status": "error",
                 "model": model_name,
                 "error": str(e),
-                "timestamp": datetime.now()
+                "timestamp": datetime.now(),
+                "latency_ms": round((time.perf_counter() - start) * 1000, 1)
             }
+
+class ModelHealthMonitor:
+    """
+    Last-known status and latency of every configured model
+
+    A background task (start / stop, from the app lifespan) probes each model
+    every `interval` seconds with test_model, bounded by `timeout`. Results
+    are kept in utils_shared_state.shared_cache under model_health:<name>, so
+    in multi-worker mode a model probed by one worker is skipped by the
+    others until the result ages out. /models and /test-model are served from
+    these results; dashboards polling them no longer cost LLM calls.
+    """
+
+    def __init__(self, ai_service: AIService, interval: float = MODEL_HEALTH_INTERVAL,
+                 timeout: float = MODEL_HEALTH_TIMEOUT):
+        self.ai_service = ai_service
+        self.interval = interval
+        self.timeout = timeout
+        self._task: Optional[asyncio.Task] = None
+        # A probe already running for a model is awaited, not repeated
+        self._probes = SingleFlight("model_probe")
+
+    @staticmethod
+    def _key(model_name: str) -> str:
+        return f"model_health:{model_name}"
+
+    async def result(self, model_name: str) -> Optional[dict]:
+        """The last probe of a model by any worker: status, response or error, latency_ms, checked_at (epoch)"""
+        return await shared_cache.aget(self._key(model_name))
+
+    async def probe(self, model_name: str) -> dict:
+        return await self._probes.do(model_name, lambda: self._probe(model_name))
+
+    async def _probe(self, model_name: str) -> dict:
+        tested = await self.ai_service.test_model(model_name, timeout=self.timeout)
+        result = {
+            "status": tested["status"],
+            "response": tested.get("response"),
+            "error": tested.get("error"),
+            "latency_ms": tested["latency_ms"],
+            "checked_at": time.time(),
+        }
+        model_up.set(1.0 if result["status"] == "success" else 0.0, model=model_name)
+        model_probe_latency.set(result["latency_ms"] / 1000, model=model_name)
+        await shared_cache.aset(self._key(model_name), result)
+        return result
+
+    async def probe_due(self) -> int:
+        """Probe, concurrently, the models without a result from the current interval; returns how many"""
+        # Part of the jitter window counts as fresh, so staggered workers skip what another just probed
+        fresh_for = self.interval * (1 - MODEL_HEALTH_JITTER)
+        now = time.time()
+        due = [
+            model_name for model_name, result in (await self.results()).items()
+            if result is None or now - result["checked_at"] >= fresh_for
+        ]
+        await asyncio.gather(*(self.probe(model_name) for model_name in due))
+        return len(due)
+
+    async def _run(self):
+        # Workers started together would otherwise probe in lockstep
+        await asyncio.sleep(random.uniform(0, MODEL_HEALTH_JITTER) * self.interval)
+        while True:
+            try:
+                await self.probe_due()
+            except Exception as e:
+                print(f"Model health probe failed: {e}")
+            await asyncio.sleep(self.interval * random.uniform(1 - MODEL_HEALTH_JITTER, 1 + MODEL_HEALTH_JITTER))
+
+    def start(self):
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def results(self) -> Dict[str, Optional[dict]]:
+        """The last probe of every configured model, read concurrently"""
+        names = [config.name for config in self.ai_service.load_model_configs()]
+        return dict(zip(names, await asyncio.gather(*(self.result(name) for name in names))))
+
+    async def model_infos(self) -> List[ModelInfo]:
+        """Every configured model with its last-known status"""
+        results = await self.results()
+        infos = []
+        for config in self.ai_service.load_model_configs():
+            result = results.get(config.name) or {}
+            checked_at = result.get("checked_at")
+            infos.append(ModelInfo(
+                **config.model_dump(),
+                status=result.get("status", "unknown"),
+                latency_ms=result.get("latency_ms"),
+                checked_at=datetime.fromtimestamp(checked_at) if checked_at is not None else None,
+                error=result.get("error"),
+            ))
+        return infos
+
+    async def test(self, model_name: str, refresh: bool = False) -> dict:
+        """
+        /test-model: the last probe result while background probing is on,
+        a live probe when the model was never probed, on refresh, or with
+        probing disabled
+        """
+        result = None if refresh or self.interval <= 0 else await self.result(model_name)
+        cached = result is not None
+        if result is None:
+            result = await self.probe(model_name)
+        response = {"status": result["status"], "model": model_name}
+        if result["status"] == "success":
+            response["response"] = result["response"]
+        else:
+            response["error"] = result["error"]
+        response.update(
+            timestamp=datetime.fromtimestamp(result["checked_at"]),
+            latency_ms=result["latency_ms"],
+            cached=cached,
+        )
+        return response
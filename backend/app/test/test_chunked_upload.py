@@ -0,0 +1,151 @@
+"""
+Chunked upload sessions against a temporary incoming directory
+
+Run from backend/app: python -m pytest test/test_chunked_upload.py
+"""
+import asyncio
+import hashlib
+import os
+import threading
+import time
+
+import pytest
+
+import utils_chunked_upload
+import utils_content_store
+from utils_chunked_upload import (complete_upload, create_session, load_session, purge_expired, received_parts,
+                                  write_part)
+
+PART_SIZE = utils_chunked_upload.UPLOAD_MIN_PART_BYTES
+
+
+@pytest.fixture(autouse=True)
+def upload_dir(tmp_path, monkeypatch):
+    incoming = str(tmp_path / ".incoming")
+    monkeypatch.setattr(utils_content_store, "INCOMING_DIR", incoming)
+    monkeypatch.setattr(utils_content_store, "BLOB_DIR", str(tmp_path / "blobs"))
+    monkeypatch.setattr(utils_chunked_upload, "INCOMING_DIR", incoming)
+    return incoming
+
+
+def _data(size: int, seed: int = 0) -> bytes:
+    return bytes((i * 7 + seed) % 251 for i in range(size))
+
+
+async def _chunks(data: bytes, size: int = 64 * 1024):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def _put(session, part: int, data: bytes, sha256: str = None) -> str:
+    return asyncio.run(write_part(session, part, _chunks(data), sha256))
+
+
+def _part(data: bytes, part: int) -> bytes:
+    return data[part * PART_SIZE:(part + 1) * PART_SIZE]
+
+
+def test_resent_part_replaces_the_received_one():
+    data = _data(2 * PART_SIZE + 100)
+    session = create_session("a.bin", len(data), PART_SIZE)
+    upload_id = session["upload_id"]
+
+    _put(session, 0, _data(PART_SIZE, seed=1))
+    assert received_parts(upload_id) == [0]
+    # Sent again after its marker exists: the new bytes win
+    digest = _put(session, 0, _part(data, 0), hashlib.sha256(_part(data, 0)).hexdigest())
+    assert received_parts(upload_id) == [0]
+    with open(os.path.join(utils_chunked_upload.INCOMING_DIR, f"{upload_id}.parts", "part-0")) as f:
+        assert f.read() == digest
+
+    _put(session, 1, _part(data, 1))
+    _put(session, 2, _part(data, 2))
+    stored = complete_upload(upload_id)
+    assert stored.sha256 == hashlib.sha256(data).hexdigest()
+    with open(stored.path, "rb") as f:
+        assert f.read() == data
+
+
+def test_checksum_mismatch_is_not_received():
+    data = _data(PART_SIZE + 10)
+    session = create_session("a.bin", len(data), PART_SIZE)
+    _put(session, 0, _part(data, 0))
+
+    with pytest.raises(ValueError, match="Checksum mismatch"):
+        _put(session, 0, _part(data, 0), "0" * 64)
+    # The failed resend dropped the earlier marker, since its bytes were overwritten
+    assert received_parts(session["upload_id"]) == []
+    with pytest.raises(ValueError, match="Checksum mismatch"):
+        _put(session, 1, _part(data, 1), hashlib.sha256(b"other").hexdigest())
+    with pytest.raises(ValueError, match="have not been received"):
+        complete_upload(session["upload_id"])
+
+
+def test_part_after_claim_is_rejected():
+    data = _data(PART_SIZE + 10)
+    session = create_session("a.bin", len(data), PART_SIZE)
+    upload_id = session["upload_id"]
+    _put(session, 0, _part(data, 0))
+    _put(session, 1, _part(data, 1))
+
+    # complete_upload holds the whole-file lock when it claims the session;
+    # a part waiting for the lock must see the claim once it gets in
+    errors = []
+    data_path = os.path.join(utils_chunked_upload.INCOMING_DIR, upload_id)
+    session_dir = os.path.join(utils_chunked_upload.INCOMING_DIR, f"{upload_id}.parts")
+    with open(data_path, "rb") as f, utils_chunked_upload._file_lock(f, 0, len(data), exclusive=True):
+        def late_part():
+            try:
+                _put(session, 1, _part(data, 1))
+            except Exception as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=late_part)
+        thread.start()
+        time.sleep(0.2)
+        os.rename(session_dir, f"{session_dir}.complete")
+    thread.join(10)
+    assert len(errors) == 1 and isinstance(errors[0], FileNotFoundError)
+
+    os.rename(f"{session_dir}.complete", session_dir)
+    complete_upload(upload_id)
+    # After completing, the session and its file are gone
+    assert load_session(upload_id) is None
+    with pytest.raises(FileNotFoundError):
+        _put(session, 0, _part(data, 0))
+    with pytest.raises(FileNotFoundError):
+        complete_upload(upload_id)
+
+
+def test_purge_keeps_a_session_with_a_part_in_flight():
+    data = _data(PART_SIZE + 10)
+    idle = create_session("idle.bin", len(data), PART_SIZE)
+    busy = create_session("busy.bin", len(data), PART_SIZE)
+    past = time.time() - 3600
+    for session in (idle, busy):
+        os.utime(os.path.join(utils_chunked_upload.INCOMING_DIR, f"{session['upload_id']}.parts"), (past, past))
+
+    # A part of the busy session is being streamed while sessions are purged
+    started = threading.Event()
+    proceed = threading.Event()
+
+    async def slow_chunks():
+        started.set()
+        await asyncio.to_thread(proceed.wait, 10)
+        async for chunk in _chunks(_part(data, 0)):
+            yield chunk
+
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(
+        digest=asyncio.run(write_part(busy, 0, slow_chunks()))))
+    thread.start()
+    assert started.wait(10)
+    assert purge_expired(ttl=60) == 1
+    proceed.set()
+    thread.join(10)
+
+    assert load_session(idle["upload_id"]) is None
+    assert not os.path.exists(os.path.join(utils_chunked_upload.INCOMING_DIR, idle["upload_id"]))
+    assert load_session(busy["upload_id"]) is not None
+    assert result["digest"] == hashlib.sha256(_part(data, 0)).hexdigest()
+    assert received_parts(busy["upload_id"]) == [0]
@@ -0,0 +1,217 @@
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+
+from utils_metrics import get_current_trace, metrics_registry
+
+# Admission control: at most ADMISSION_MAX_CONCURRENT chat generations and
+# ingestions run at once; the rest wait in a bounded priority queue where
+# interactive chat goes ahead of bulk ingestion. Requests that cannot be queued,
+# wait too long, or exceed their token bucket get 429 with Retry-After.
+# Limits are per worker process.
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "8"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30"))
+
+# Token buckets, in requests per minute; 0 disables the limit
+RATE_LIMIT_CLIENT_PER_MINUTE = float(os.getenv("RATE_LIMIT_CLIENT_PER_MINUTE", "120"))
+RATE_LIMIT_CONVERSATION_PER_MINUTE = float(os.getenv("RATE_LIMIT_CONVERSATION_PER_MINUTE", "30"))
+# Only trust X-Forwarded-For behind a reverse proxy that sets it
+TRUST_PROXY_HEADERS = os.getenv("TRUST_PROXY_HEADERS", "0") == "1"
+
+PRIORITY_CHAT = 0
+PRIORITY_INGEST = 1
+# Questions of /chat/batch: bulk work, behind interactive chat and ingestion
+PRIORITY_BATCH = 2
+PRIORITY_NAMES = {PRIORITY_CHAT: "chat", PRIORITY_INGEST: "ingest", PRIORITY_BATCH: "batch"}
+
+admission_queue_depth = metrics_registry.gauge(
+    "infopop_admission_queue_depth", "Requests waiting for an admission slot", ("priority",)
+)
+admission_in_flight = metrics_registry.gauge(
+    "infopop_admission_in_flight", "Requests holding an admission slot"
+)
+admission_wait = metrics_registry.histogram(
+    "infopop_admission_wait_seconds", "Time spent waiting for an admission slot", ("priority",)
+)
+admission_rejected = metrics_registry.counter(
+    "infopop_admission_rejected_total", "Requests rejected with 429 by reason", ("priority", "reason")
+)
+
+
+def too_many_requests(detail: str, retry_after: float) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holding at most `capacity`"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def try_acquire(self, tokens: float = 1.0) -> Tuple[bool, float]:
+        """Take tokens if available; otherwise return the seconds until they will be"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True, 0.0
+        return False, (tokens - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """One token bucket per key (client, conversation), least recently used keys are dropped"""
+
+    def __init__(self, name: str, per_minute: float, burst: Optional[float] = None, max_keys: int = 10000):
+        self.name = name
+        self.rate = per_minute / 60
+        self.capacity = burst if burst is not None else max(1.0, per_minute / 6)
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def check(self, key: Optional[str], priority: int = PRIORITY_CHAT):
+        """Consume one token for key, raising 429 with Retry-After when the bucket is empty"""
+        if not self.enabled or not key:
+            return
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.capacity)
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            allowed, retry_after = bucket.try_acquire()
+        if not allowed:
+            admission_rejected.inc(priority=PRIORITY_NAMES[priority], reason=f"rate_limit_{self.name}")
+            raise too_many_requests(f"Rate limit exceeded for {self.name}, please retry later", retry_after)
+
+
+class AdmissionController:
+    """
+    Bounded priority queue in front of a fixed number of slots
+
+    Lower priority values are served first, FIFO within a priority. Ingestion
+    and batch questions may only fill half of the queue so chat requests
+    always find room.
+    """
+
+    def __init__(self, max_concurrent: int = ADMISSION_MAX_CONCURRENT, max_queue: int = ADMISSION_MAX_QUEUE,
+                 queue_timeout: float = ADMISSION_QUEUE_TIMEOUT):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters = []  # heap of (priority, sequence, future)
+        self._sequence = itertools.count()
+        # Moving average of how long a slot is held, for Retry-After estimates
+        self._average_hold = 1.0
+
+    def queue_depth(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    def _queue_limit(self, priority: int) -> int:
+        return self.max_queue if priority == PRIORITY_CHAT else self.max_queue // 2
+
+    def _retry_after(self) -> float:
+        return self._average_hold * (self.queue_depth() + 1) / max(self.max_concurrent, 1)
+
+    def _reject(self, priority: int, reason: str):
+        admission_rejected.inc(priority=PRIORITY_NAMES[priority], reason=reason)
+        raise too_many_requests("Server is busy, please retry later", self._retry_after())
+
+    async def _acquire(self, priority: int):
+        if self.in_flight < self.max_concurrent and not self.queue_depth():
+            self.in_flight += 1
+            return
+        if self.queue_depth() >= self._queue_limit(priority):
+            self._reject(priority, "queue_full")
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        admission_queue_depth.inc(priority=PRIORITY_NAMES[priority])
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not future.done():
+                future.cancel()
+                self._reject(priority, "queue_timeout")
+        except asyncio.CancelledError:
+            if not future.cancel():
+                # The slot was handed over just as we were cancelled; pass it on
+                self._release()
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            admission_queue_depth.dec(priority=PRIORITY_NAMES[priority])
+            admission_wait.observe(waited, priority=PRIORITY_NAMES[priority])
+            trace = get_current_trace()
+            if trace is not None:
+                trace.add_span("admission", start, waited)
+
+    def _release(self):
+        # Hand the slot directly to the next live waiter, keeping in_flight unchanged
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_CHAT) -> AsyncIterator[None]:
+        """Hold one admission slot for the duration of the block"""
+        await self._acquire(priority)
+        admission_in_flight.set(self.in_flight)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._average_hold = 0.8 * self._average_hold + 0.2 * (time.perf_counter() - start)
+            self._release()
+            admission_in_flight.set(self.in_flight)
+
+    def to_dict(self) -> Dict[str, int]:
+        return {
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth(),
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+        }
+
+
+# Global admission controller and rate limiters
+admission = AdmissionController()
+client_rate_limiter = RateLimiter("client", RATE_LIMIT_CLIENT_PER_MINUTE)
+conversation_rate_limiter = RateLimiter("conversation", RATE_LIMIT_CONVERSATION_PER_MINUTE)
+
+
+def client_key(request) -> Optional[str]:
+    """Identify the client by its peer address, or the first X-Forwarded-For address behind a proxy"""
+    forwarded = request.headers.get("x-forwarded-for") if TRUST_PROXY_HEADERS else None
+    if forwarded:
+        return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else None
@@ -0,0 +1,100 @@
+"""
+Command-line client for the /chat/batch endpoint
+
+Reads questions from a file and streams the answers back as NDJSON, one
+BatchChatResult per line, in completion order (use "index" to match them to
+the input). A .jsonl input holds one BatchQuestion object per line
+({"message", "conversation_id", "knowledge_base"}); any other file holds one
+question per line. Inputs larger than --batch-size are sent as several
+consecutive requests.
+
+    python utils_batch_chat.py questions.txt --output answers.ndjson
+    python utils_batch_chat.py questions.jsonl --url http://localhost:8001 --model gpt-4o-mini --concurrency 4
+"""
+import argparse
+import json
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Optional, TextIO
+
+
+def read_questions(path: str, knowledge_base: Optional[str] = None) -> List[Dict[str, Any]]:
+    """BatchQuestion dicts of an input file; knowledge_base is the default scope"""
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            question = json.loads(line) if path.endswith(".jsonl") else {"message": line}
+            if knowledge_base and not question.get("knowledge_base"):
+                question["knowledge_base"] = knowledge_base
+            questions.append(question)
+    return questions
+
+
+def stream_batch(url: str, questions: List[Dict[str, Any]], model_name: Optional[str] = None,
+                 prompt_name: Optional[str] = None, concurrency: Optional[int] = None,
+                 timeout: float = 600.0) -> Iterator[Dict[str, Any]]:
+    """Post one batch and yield its results as they arrive"""
+    import httpx
+
+    payload: Dict[str, Any] = {"questions": questions}
+    if model_name:
+        payload["model_name"] = model_name
+    if prompt_name:
+        payload["prompt_name"] = prompt_name
+    if concurrency:
+        payload["concurrency"] = concurrency
+    with httpx.stream("POST", url.rstrip("/") + "/chat/batch", json=payload, timeout=timeout) as response:
+        if response.status_code != 200:
+            response.read()
+            raise RuntimeError(f"/chat/batch failed: {response.status_code} {response.text}")
+        for line in response.iter_lines():
+            if line:
+                yield json.loads(line)
+
+
+def run(args, output: TextIO) -> Dict[str, int]:
+    questions = read_questions(args.input, args.knowledge_base)
+    counts = {"questions": len(questions), "answered": 0, "failed": 0}
+    for offset in range(0, len(questions), args.batch_size):
+        batch = questions[offset:offset + args.batch_size]
+        for result in stream_batch(args.url, batch, args.model, args.prompt, args.concurrency, args.timeout):
+            # Indexes refer to the whole input file
+            result["index"] += offset
+            output.write(json.dumps(result, ensure_ascii=False) + "\n")
+            output.flush()
+            counts["failed" if result.get("error") else "answered"] += 1
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a file of questions through /chat/batch")
+    parser.add_argument("input", help="Questions: .jsonl with BatchQuestion objects, or one question per line")
+    parser.add_argument("--url", default="http://localhost:8001", help="Base URL of the InfoPop API")
+    parser.add_argument("--model", help="Model name (default: the server's default)")
+    parser.add_argument("--prompt", help="Prompt name")
+    parser.add_argument("--knowledge-base", help="Knowledge base for questions that don't name one")
+    parser.add_argument("--concurrency", type=int, help="Questions answered at once (capped by the server)")
+    parser.add_argument("--batch-size", type=int, default=500, help="Questions per request")
+    parser.add_argument("--timeout", type=float, default=600.0, help="Read timeout per request in seconds")
+    parser.add_argument("--output", help="NDJSON output file (default: stdout)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        counts = run(args, output)
+    finally:
+        if args.output:
+            output.close()
+    elapsed = time.perf_counter() - start
+    print(f"✅ {counts['answered']} answered, {counts['failed']} failed of {counts['questions']} questions "
+          f"in {elapsed:.1f}s ({counts['questions'] / elapsed if elapsed else 0:.1f} questions/s)", file=sys.stderr)
+    if counts["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
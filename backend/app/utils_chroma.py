@@ -1,20 +1,82 @@
-from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, UnstructuredHTMLLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
-from langchain_chroma import Chroma
-from typing import List
+from typing import Dict, List, Optional
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 import os 
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
 
-text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200, length_function=len)
+from utils_metrics import record_ingest, stage
+from utils_shared_state import SHARED_STATE, GenerationFile, InterProcessLock
+from utils_text_splitter import create_text_splitter
+
+# Document loaders, the OpenAI client and Chroma are heavy to import, so they
+# are only imported when first needed (see get_embedding_model, get_vector_store
+# and load_and_split_document)
+
+# Token-sized, sentence-aware chunks (TEXT_SPLITTER=recursive for the character-based splitter)
+text_splitter = create_text_splitter()
+
+# Document embeddings by text for the current indexing call: known vectors are
+# reused, new ones are added (see index_document_to_chroma)
+_embedding_memo: ContextVar[Optional[Dict[str, List[float]]]] = ContextVar("embedding_memo", default=None)
+
+class TimedEmbeddings(Embeddings):
+    """Embeddings wrapper that records query embedding time as the embed_query stage"""
+
+    def __init__(self, embeddings: Embeddings):
+        self.embeddings = embeddings
+
+    @property
+    def model_id(self) -> str:
+        """Identifies the vectors this model produces, for the embedding cache"""
+        return str(getattr(self.embeddings, "model", None) or type(self.embeddings).__name__)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        memo = _embedding_memo.get()
+        if memo is None:
+            return self.embeddings.embed_documents(texts)
+        missing = list(dict.fromkeys(text for text in texts if text not in memo))
+        if missing:
+            memo.update(zip(missing, self.embeddings.embed_documents(missing)))
+        return [memo[text] for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        with stage("embed_query"):
+            return self.embeddings.embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        with stage("embed_query"):
+            return await self.embeddings.aembed_query(text)
+
+# Vector store backend: "chroma" (default) or "numpy" (see utils_numpy_store)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+
+# Absolute, so the index does not depend on the working directory the server is started from
+CHROMA_PERSIST_DIR = os.path.abspath(
+    os.getenv("CHROMA_PERSIST_DIR", os.path.join(os.path.dirname(__file__), "..", "data", "chroma_db"))
+)
+NUMPY_INDEX_DIR = os.path.abspath(
+    os.getenv("NUMPY_INDEX_DIR", os.path.join(os.path.dirname(CHROMA_PERSIST_DIR), "numpy_index"))
+)
+# Document-level profiles for two-level retrieval (see utils_doc_index)
+DOC_INDEX_DIR = os.path.abspath(
+    os.getenv("DOC_INDEX_DIR", os.path.join(os.path.dirname(CHROMA_PERSIST_DIR), "doc_index"))
+)
 
 # Initialize embedding model and vector store lazily
 _embedding_model = None
 _vector_store = None
+_document_index = None
 
 def get_embedding_model():
     global _embedding_model
     if _embedding_model is None:
+        from langchain_openai import OpenAIEmbeddings
+
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise ValueError("OPENAI_API_KEY environment variable is not set")
@@ -22,71 +84,236 @@ def get_embedding_model():
             raise ValueError("Please replace the placeholder OPENAI_API_KEY with a valid OpenAI API key")
         
         # Use the same proxy API as configured in model_config.json
-        _embedding_model = OpenAIEmbeddings(
+        _embedding_model = TimedEmbeddings(OpenAIEmbeddings(
             api_key=api_key,
             base_url="https://aihub.gz4399.com/v1"
-        )
+        ))
     return _embedding_model
 
+# Single writer, many readers: writes to the persist directory take an
+# inter-process lock and bump a generation counter; in multi-worker mode each
+# reader reopens its Chroma client when the generation changed, since a
+# client does not see index changes made by another process
+_write_lock = InterProcessLock(os.path.join(CHROMA_PERSIST_DIR, ".write.lock"))
+_generation = GenerationFile(os.path.join(CHROMA_PERSIST_DIR, ".generation"))
+_vector_store_generation = None
+
+@contextmanager
+def persist_dir_writer():
+    """Hold the exclusive writer lock for the persist directory and publish the change"""
+    global _vector_store_generation
+    with _write_lock:
+        try:
+            yield
+        finally:
+            _vector_store_generation = _generation.bump()
+
+@contextmanager
+def vector_store_writer():
+    """Hold the exclusive writer lock for the vector store and publish the change"""
+    with persist_dir_writer():
+        yield get_vector_store()
+
+def _reload_if_stale():
+    global _vector_store, _document_index
+    if _vector_store is not None and _generation.read() != _vector_store_generation:
+        if VECTOR_BACKEND == "chroma":
+            from chromadb.api.shared_system_client import SharedSystemClient
+            SharedSystemClient.clear_system_cache()
+        _vector_store = None
+        _document_index = None
+
 def get_vector_store():
-    global _vector_store
+    global _vector_store, _vector_store_generation
+    if SHARED_STATE:
+        _reload_if_stale()
     if _vector_store is None:
-        embedding_model = get_embedding_model()
-        _vector_store = Chroma(
-            collection_name="documents", 
-            embedding_function=embedding_model, 
-            persist_directory="backend/data/chroma_db"
+        _vector_store_generation = _generation.read()
+        from utils_vector_index import (
+            CHROMA_SHARD_BY, COLLECTION_NAME, ShardedVectorStore, open_collection_store
         )
+
+        embedding_model = get_embedding_model()
+        if VECTOR_BACKEND == "numpy":
+            from utils_numpy_store import NumpyVectorStore
+            _vector_store = NumpyVectorStore(NUMPY_INDEX_DIR, embedding_model)
+        elif CHROMA_SHARD_BY:
+            _vector_store = ShardedVectorStore(embedding_model, CHROMA_PERSIST_DIR, CHROMA_SHARD_BY)
+        else:
+            _vector_store = open_collection_store(
+                COLLECTION_NAME, embedding_model, persist_directory=CHROMA_PERSIST_DIR
+            )
     return _vector_store
 
+def get_document_index():
+    """The document-level index: one centroid + summary row per file_id"""
+    global _document_index
+    if SHARED_STATE:
+        get_vector_store()
+    if _document_index is None:
+        from utils_numpy_store import NumpyVectorStore
+        _document_index = NumpyVectorStore(DOC_INDEX_DIR, dtype="float32")
+    return _document_index
+
+def set_embedding_model(embedding_model: Embeddings):
+    """Replace the embedding model (e.g. with a fake one for offline benchmarks)"""
+    global _embedding_model, _vector_store, _document_index
+    _embedding_model = TimedEmbeddings(embedding_model)
+    # The vector store holds a reference to the old embedding model
+    _vector_store = None
+    _document_index = None
+
 # For backward compatibility with imports
 vector_store = None  # Will be set to actual vector store when accessed
 
-def load_and_split_document(file_path: str) -> List[Document]:
-    """Load and split a document into chunks based on its file type."""
+def load_document(file_path: str, table_dir: str = None) -> List[Document]:
+    """
+    Load a document into LangChain documents (one per page where the loader supports it).
+
+    Spreadsheets are already chunked into row groups (see utils_spreadsheet);
+    with table_dir, their numeric sheets are also written to the table store.
+    """
     _, file_extension = os.path.splitext(file_path)
     file_extension = file_extension.lower()
     
     if file_extension == ".pdf":
+        from langchain_community.document_loaders import PyPDFLoader
         loader = PyPDFLoader(file_path)
     elif file_extension == ".docx":
+        from langchain_community.document_loaders import Docx2txtLoader
         loader = Docx2txtLoader(file_path)
     elif file_extension == ".html":
+        from langchain_community.document_loaders import UnstructuredHTMLLoader
         loader = UnstructuredHTMLLoader(file_path)
+    elif file_extension == ".xlsx":
+        from utils_spreadsheet import load_xlsx
+        return load_xlsx(file_path, table_dir=table_dir)
     elif file_extension == ".txt":
         with open(file_path, 'r', encoding='utf-8') as f:
             text = f.read()
-        documents = [Document(page_content=text, metadata={"source": file_path})]
-        return text_splitter.split_documents(documents)
+        return [Document(page_content=text, metadata={"source": file_path})]
     else:
         raise ValueError(f"Unsupported file type: {file_extension}")
     
-    documents = loader.load()
-    return text_splitter.split_documents(documents)
+    return loader.load()
+
+def split_documents(documents: List[Document]) -> List[Document]:
+    """Split loaded documents into chunks; spreadsheet row groups are kept as they are"""
+    text_documents = [doc for doc in documents if "sheet" not in doc.metadata]
+    if len(text_documents) == len(documents):
+        return text_splitter.split_documents(documents)
+    return [doc for doc in documents if "sheet" in doc.metadata] + text_splitter.split_documents(text_documents)
+
+def load_and_split_document(file_path: str) -> List[Document]:
+    """Load and split a document into chunks based on its file type."""
+    return split_documents(load_document(file_path))
+
+def index_document_to_chroma(file_path: str, file_id: int, knowledge_base: str = None,
+                             content_sha256: str = None) -> bool:
+    """
+    Parse, split, embed and store a document under file_id
+
+    With content_sha256 (see utils_content_store), the chunks and their
+    embeddings are cached per content, so a duplicate upload skips parsing
+    and the embedding API.
 
-def index_document_to_chroma(file_path: str, file_id: int) -> bool:
+    With TWO_LEVEL_RETRIEVAL=1, the document profile (centroid, keywords,
+    summary) is written to the document index in the same write; a profile
+    that cannot be written is logged and left to `utils_doc_index.py build`.
+    If anything fails once the chunks are stored, they are deleted again, so
+    a failed upload leaves nothing behind under its file_id.
+    """
+    chunks_stored = False
     try:
-        splits = load_and_split_document(file_path)
+        from utils_content_store import load_embeddings, load_parsed, save_embeddings, save_parsed
+        from utils_doc_index import TWO_LEVEL_RETRIEVAL, build_profile, save_profile
+        from utils_metrics import cache_requests
+        from utils_spreadsheet import XLSX_COLUMNAR, link_tables, table_dir_for
+
+        stage_seconds = {}
+        extension = os.path.splitext(file_path)[1].lower()
+        table_dir = table_dir_for(file_id) if XLSX_COLUMNAR else None
+
+        start = time.perf_counter()
+        cached = load_parsed(content_sha256, extension) if content_sha256 else None
+        if cached is not None and table_dir and extension == ".xlsx":
+            # The table store is per file_id: reuse the tables of an earlier copy, or parse again
+            from utils_db import get_file_ids_by_content
+            if not any(link_tables(other, file_id) for other in get_file_ids_by_content(content_sha256)
+                       if other != file_id):
+                cached = None
+        if content_sha256:
+            cache_requests.inc(cache="parsed_documents", result="hit" if cached is not None else "miss")
+        if cached is not None:
+            splits, pages = cached
+            stage_seconds["load"] = time.perf_counter() - start
+        else:
+            documents = load_document(file_path, table_dir)
+            pages = len(documents)
+            stage_seconds["load"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            splits = split_documents(documents)
+            stage_seconds["split"] = time.perf_counter() - start
+            if content_sha256:
+                save_parsed(content_sha256, extension, splits, pages)
         
         # Add metadata to each split
         for split in splits:
             split.metadata['file_id'] = file_id
+            if knowledge_base:
+                split.metadata['knowledge_base'] = knowledge_base
         
-        vector_store = get_vector_store()
-        vector_store.add_documents(splits)
+        start = time.perf_counter()
+        embedding_model = get_embedding_model()
+        memo = {}
+        if content_sha256:
+            memo = load_embeddings(content_sha256, extension, embedding_model.model_id,
+                                   [split.page_content for split in splits]) or {}
+            cache_requests.inc(cache="document_embeddings", result="hit" if memo else "miss")
+        cached_vectors = len(memo)
+        token = _embedding_memo.set(memo)
+        try:
+            with vector_store_writer() as vector_store:
+                chunk_ids = vector_store.add_documents(splits)
+                chunks_stored = True
+                if splits and TWO_LEVEL_RETRIEVAL:
+                    start_profile = time.perf_counter()
+                    try:
+                        profile = build_profile(splits, [memo[split.page_content] for split in splits])
+                        save_profile(get_document_index(), file_id, profile, chunk_ids, knowledge_base)
+                    except Exception as e:
+                        print(f"Error saving the document profile of file_id {file_id}: {e}")
+                    stage_seconds["profile"] = time.perf_counter() - start_profile
+        finally:
+            _embedding_memo.reset(token)
         # vectorstore.persist()
+        stage_seconds["embed_and_store"] = time.perf_counter() - start - stage_seconds.get("profile", 0.0)
+        if content_sha256 and len(memo) > cached_vectors:
+            save_embeddings(content_sha256, extension, embedding_model.model_id,
+                            [memo[split.page_content] for split in splits])
+
+        record_ingest(pages=pages, chunks=len(splits), embeddings=len(memo) - cached_vectors,
+                      stage_seconds=stage_seconds)
         return True
     except Exception as e:
         print(f"Error indexing document: {e}")
+        if chunks_stored:
+            delete_doc_from_chroma(file_id)
         return False
 
 def delete_doc_from_chroma(file_id: int):
     try:
-        vector_store = get_vector_store()
-        docs = vector_store.get(where={"file_id": file_id})
-        print(f"Found {len(docs['ids'])} document chunks for file_id {file_id}")
-        
-        vector_store._collection.delete(where={"file_id": file_id})
+        with vector_store_writer() as vector_store:
+            from utils_vector_index import delete_where
+
+            docs = vector_store.get(where={"file_id": file_id})
+            print(f"Found {len(docs['ids'])} document chunks for file_id {file_id}")
+            
+            delete_where(vector_store, {"file_id": file_id})
+            get_document_index().delete(ids=[str(file_id)])
+        from utils_spreadsheet import delete_tables
+        delete_tables(file_id)
         print(f"Deleted all documents with file_id {file_id}")
         
         return True
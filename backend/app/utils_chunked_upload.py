@@ -0,0 +1,336 @@
+"""
+Resumable chunked uploads
+
+A large file is uploaded as fixed-size parts instead of one multipart
+request, so a dropped connection only costs the parts in flight:
+
+1. POST /uploads creates a session and preallocates the target file in the
+   incoming directory of the content store (see utils_content_store).
+2. PUT /uploads/{upload_id}/parts/{part} streams one part (0-based) straight
+   to its offset in that file, in any order and in parallel. The part's
+   sha256 (X-Part-SHA256 header) is verified before the part is marked as
+   received.
+3. GET /uploads/{upload_id} lists the received parts, so an interrupted
+   upload resumes with the missing ones.
+4. POST /uploads/{upload_id}/complete hashes the file and renames it into the
+   blob store (commit_blob, no copy), then it is indexed like any upload.
+
+Sessions live on disk next to the file (INCOMING_DIR/<upload_id>.parts: the
+session and one marker per received part), so any worker can take any part
+and a restarted server resumes them. Sessions untouched for
+UPLOAD_SESSION_TTL seconds are removed when a new one is created.
+
+Parts are written from a thread, a batch of received chunks at a time, so a
+large upload does not hold up the event loop. A part holds a lock on the
+upload file while it is written (shared, or its own byte range on Windows);
+completing takes the whole file, so it waits for the parts in flight, and a
+part that gets the lock after the session was claimed is rejected.
+"""
+import asyncio
+import errno
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+from utils_content_store import INCOMING_DIR, UPLOAD_CHUNK_BYTES, StoredUpload, commit_blob, new_incoming_path
+
+UPLOAD_PART_BYTES = int(os.getenv("UPLOAD_PART_BYTES", str(8 * 1024 * 1024)))
+UPLOAD_MIN_PART_BYTES = 256 * 1024
+UPLOAD_MAX_PART_BYTES = 64 * 1024 * 1024
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(4 * 1024 ** 3)))
+UPLOAD_SESSION_TTL = float(os.getenv("UPLOAD_SESSION_TTL", str(24 * 3600)))
+
+_UPLOAD_ID = re.compile(r"[0-9a-f]{32}")
+
+
+def _data_path(upload_id: str) -> str:
+    return os.path.join(INCOMING_DIR, upload_id)
+
+
+def _session_dir(upload_id: str) -> str:
+    return os.path.join(INCOMING_DIR, f"{upload_id}.parts")
+
+
+def _write_json(path: str, value: Any):
+    temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(value, f, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+
+def create_session(filename: str, size: int, part_size: Optional[int] = None,
+                   knowledge_base: Optional[str] = None) -> Dict[str, Any]:
+    """Start an upload of `size` bytes; the target file is allocated up front"""
+    if size < 0 or size > UPLOAD_MAX_BYTES:
+        raise ValueError(f"File size must be between 0 and {UPLOAD_MAX_BYTES} bytes")
+    part_size = min(max(part_size or UPLOAD_PART_BYTES, UPLOAD_MIN_PART_BYTES), UPLOAD_MAX_PART_BYTES)
+    purge_expired()
+
+    data_path = new_incoming_path()
+    upload_id = os.path.basename(data_path)
+    with open(data_path, "wb") as f:
+        f.truncate(size)
+        if size and hasattr(os, "posix_fallocate"):
+            # Reserve the blocks now, so a full disk fails here and not halfway through
+            try:
+                os.posix_fallocate(f.fileno(), 0, size)
+            except OSError as e:
+                if e.errno == errno.ENOSPC:
+                    f.close()
+                    os.remove(data_path)
+                    raise
+    session = {
+        "upload_id": upload_id,
+        "filename": filename,
+        "size": size,
+        "part_size": part_size,
+        "parts": -(-size // part_size),
+        "knowledge_base": knowledge_base,
+        "created_at": time.time(),
+    }
+    os.makedirs(_session_dir(upload_id))
+    _write_json(os.path.join(_session_dir(upload_id), "session.json"), session)
+    return session
+
+
+def load_session(upload_id: str) -> Optional[Dict[str, Any]]:
+    if not _UPLOAD_ID.fullmatch(upload_id):
+        return None
+    try:
+        with open(os.path.join(_session_dir(upload_id), "session.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def received_parts(upload_id: str) -> List[int]:
+    """Numbers of the verified parts, in order"""
+    try:
+        names = os.listdir(_session_dir(upload_id))
+    except FileNotFoundError:
+        return []
+    return sorted(int(name[5:]) for name in names if name.startswith("part-") and name[5:].isdigit())
+
+
+def part_range(session: Dict[str, Any], part: int):
+    """(offset, length) of a part in the file"""
+    if not 0 <= part < session["parts"]:
+        raise ValueError(f"Part must be between 0 and {session['parts'] - 1}")
+    offset = part * session["part_size"]
+    return offset, min(session["part_size"], session["size"] - offset)
+
+
+@contextmanager
+def _file_lock(f, offset: int, length: int, exclusive: bool):
+    """
+    Lock the upload file for a part (exclusive=False) or for complete_upload
+
+    POSIX: a shared or exclusive flock of the whole file. Windows has no
+    shared locks: a part locks its own byte range and complete_upload the
+    whole file, which overlaps every part.
+    """
+    if os.name == "nt":
+        if length:
+            f.seek(offset)
+            # msvcrt.locking retries for ~10s on LK_LOCK; keep retrying beyond that
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, length)
+                    break
+                except OSError:
+                    time.sleep(0.05)
+        try:
+            yield
+        finally:
+            if length:
+                f.seek(offset)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, length)
+    else:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class _PartWriter:
+    """
+    Writes one part from worker threads, holding the part lock from open to close
+
+    Every method blocks, so the handler calls them with asyncio.to_thread;
+    they are serialized, so close() waits for a write still in progress.
+    """
+
+    def __init__(self, session: Dict[str, Any], part: int, offset: int, length: int):
+        self.upload_id = session["upload_id"]
+        self.offset = offset
+        self.length = length
+        self.marker = os.path.join(_session_dir(self.upload_id), f"part-{part}")
+        self.hasher = hashlib.sha256()
+        self._lock = threading.Lock()
+        self._stack = ExitStack()
+        self._file = None
+
+    def open(self):
+        """Open the file and wait for the lock (a complete_upload in progress holds it)"""
+        with self._lock:
+            # One handle per part, so parallel parts never share a file position
+            self._file = self._stack.enter_context(open(_data_path(self.upload_id), "r+b"))
+            self._stack.enter_context(_file_lock(self._file, self.offset, self.length, exclusive=False))
+            if not os.path.isdir(_session_dir(self.upload_id)):
+                # Completed (claimed) or aborted before this part got the lock
+                raise FileNotFoundError(f"Upload not found: {self.upload_id}")
+            # A part in flight keeps the session from expiring
+            os.utime(_session_dir(self.upload_id))
+            # The bytes on disk are about to change: forget the old part until the new one is verified
+            try:
+                os.remove(self.marker)
+            except FileNotFoundError:
+                pass
+            self._file.seek(self.offset)
+
+    def write(self, chunks: List[bytes]):
+        with self._lock:
+            for chunk in chunks:
+                self._file.write(chunk)
+                self.hasher.update(chunk)
+
+    def mark_received(self, digest: str):
+        with self._lock:
+            with open(self.marker, "w", encoding="utf-8") as f:
+                f.write(digest)
+
+    def close(self):
+        """Release the lock and close the file"""
+        with self._lock:
+            self._stack.close()
+
+
+async def write_part(session: Dict[str, Any], part: int, chunks: AsyncIterator[bytes],
+                     sha256: Optional[str] = None) -> str:
+    """
+    Stream a part to its offset in the upload file
+
+    The part counts as received once its length and sha256 (if given) are
+    verified. Uploading a part again replaces it. The file is written from a
+    thread, UPLOAD_CHUNK_BYTES of received chunks at a time.
+
+    Returns:
+        The sha256 of the part
+    """
+    offset, length = part_range(session, part)
+    writer = _PartWriter(session, part, offset, length)
+    try:
+        await asyncio.to_thread(writer.open)
+        written = 0
+        batch = []
+        batch_bytes = 0
+        async for chunk in chunks:
+            if written + batch_bytes + len(chunk) > length:
+                raise ValueError(f"Part {part} is larger than {length} bytes")
+            batch.append(chunk)
+            batch_bytes += len(chunk)
+            if batch_bytes >= UPLOAD_CHUNK_BYTES:
+                await asyncio.to_thread(writer.write, batch)
+                written += batch_bytes
+                batch = []
+                batch_bytes = 0
+        if batch:
+            await asyncio.to_thread(writer.write, batch)
+            written += batch_bytes
+        if written != length:
+            raise ValueError(f"Part {part} has {written} bytes, expected {length}")
+        digest = writer.hasher.hexdigest()
+        if sha256 and sha256.lower() != digest:
+            raise ValueError(f"Checksum mismatch for part {part}")
+        # Marked while the lock is still held, so complete_upload sees the part whole or not at all
+        await asyncio.to_thread(writer.mark_received, digest)
+        return digest
+    finally:
+        await asyncio.to_thread(writer.close)
+
+
+def complete_upload(upload_id: str) -> StoredUpload:
+    """Check that every part arrived, hash the file and move it into the blob store"""
+    session = load_session(upload_id)
+    if session is None:
+        raise FileNotFoundError(f"Upload not found: {upload_id}")
+
+    claimed = f"{_session_dir(upload_id)}.complete"
+    # The whole-file lock waits for the parts in flight; parts that come later see the claim
+    with open(_data_path(upload_id), "rb") as f, _file_lock(f, 0, session["size"], exclusive=True):
+        missing = session["parts"] - len(received_parts(upload_id))
+        if missing:
+            raise ValueError(f"{missing} of {session['parts']} parts have not been received")
+
+        # Claim the session, so a concurrent complete of the same upload finds nothing
+        try:
+            os.rename(_session_dir(upload_id), claimed)
+        except OSError:
+            raise FileNotFoundError(f"Upload not found: {upload_id}")
+        try:
+            hasher = hashlib.sha256()
+            f.seek(0)
+            while True:
+                block = f.read(UPLOAD_CHUNK_BYTES)
+                if not block:
+                    break
+                hasher.update(block)
+        except BaseException:
+            os.rename(claimed, _session_dir(upload_id))
+            raise
+    try:
+        stored = commit_blob(_data_path(upload_id), hasher.hexdigest(),
+                             os.path.splitext(session["filename"])[1], session["size"])
+    except BaseException:
+        os.rename(claimed, _session_dir(upload_id))
+        raise
+    shutil.rmtree(claimed, ignore_errors=True)
+    return stored
+
+
+def abort_upload(upload_id: str) -> bool:
+    """Remove a session and its partial file"""
+    if load_session(upload_id) is None:
+        return False
+    shutil.rmtree(_session_dir(upload_id), ignore_errors=True)
+    try:
+        os.remove(_data_path(upload_id))
+    except FileNotFoundError:
+        pass
+    return True
+
+
+def purge_expired(ttl: float = None) -> int:
+    """Abort the sessions not written to for `ttl` seconds (UPLOAD_SESSION_TTL)"""
+    ttl = UPLOAD_SESSION_TTL if ttl is None else ttl
+    try:
+        names = os.listdir(INCOMING_DIR)
+    except FileNotFoundError:
+        return 0
+    purged = 0
+    now = time.time()
+    for name in names:
+        if not name.endswith(".parts"):
+            continue
+        upload_id = name[:-len(".parts")]
+        try:
+            # Starting or receiving a part touches the session directory
+            idle = now - os.path.getmtime(_session_dir(upload_id))
+        except FileNotFoundError:
+            continue
+        if idle > ttl and abort_upload(upload_id):
+            purged += 1
+    return purged
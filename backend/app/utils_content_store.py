@@ -0,0 +1,164 @@
+"""
+Content-addressed upload storage and the parsed-document cache
+
+Uploads are hashed (sha256) while they are streamed to disk and stored once
+per content under UPLOAD_DIR/blobs/<aa>/<sha256><ext>, so same-named files no
+longer overwrite each other and identical files share one blob. The
+document_content table maps every file_id to its blob.
+
+The split chunks of a blob are cached in PARSED_CACHE_DIR per content hash,
+extension and loader version (which covers the splitter settings), together
+with their embeddings per embedding model. Indexing a duplicate upload then
+reads the chunks and vectors back instead of parsing and calling the
+embedding API again; only the vector store rows for the new file_id are
+written.
+"""
+import glob
+import hashlib
+import json
+import os
+import re
+import uuid
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from langchain_core.documents import Document
+
+UPLOAD_DIR = os.path.abspath(
+    os.getenv("UPLOAD_DIR", os.path.join(os.path.dirname(__file__), "..", "data", "uploads"))
+)
+BLOB_DIR = os.path.join(UPLOAD_DIR, "blobs")
+INCOMING_DIR = os.path.join(UPLOAD_DIR, ".incoming")
+PARSED_CACHE_DIR = os.path.abspath(
+    os.getenv("PARSED_CACHE_DIR", os.path.join(os.path.dirname(UPLOAD_DIR), "parsed_cache"))
+)
+# Bump when a loader changes its output, so cached chunks are not reused
+LOADER_VERSION = 1
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+class StoredUpload(NamedTuple):
+    sha256: str
+    path: str
+    size: int
+
+
+def blob_path(sha256: str, extension: str) -> str:
+    return os.path.join(BLOB_DIR, sha256[:2], f"{sha256}{extension.lower()}")
+
+
+def new_incoming_path() -> str:
+    """A fresh temporary path next to the blobs, so committing is a rename"""
+    os.makedirs(INCOMING_DIR, exist_ok=True)
+    return os.path.join(INCOMING_DIR, uuid.uuid4().hex)
+
+
+def commit_blob(temp_path: str, sha256: str, extension: str, size: int) -> StoredUpload:
+    """Move a fully written temporary file to its blob path (or drop it if the blob exists)"""
+    path = blob_path(sha256, extension)
+    if os.path.exists(path):
+        os.remove(temp_path)
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
+    return StoredUpload(sha256, path, size)
+
+
+async def save_upload(upload) -> StoredUpload:
+    """Stream an UploadFile to the blob store, hashing it on the way"""
+    temp_path = new_incoming_path()
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        with open(temp_path, "wb") as f:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return commit_blob(temp_path, hasher.hexdigest(), os.path.splitext(upload.filename)[1], size)
+
+
+def release_content(file_id: int):
+    """Unlink a document from its blob; the blob and its cache go with the last reference"""
+    from utils_db import count_document_content, delete_document_content
+
+    content = delete_document_content(file_id)
+    if content is None or count_document_content(content.sha256):
+        return
+    try:
+        os.remove(content.path)
+    except FileNotFoundError:
+        pass
+    for path in glob.glob(os.path.join(PARSED_CACHE_DIR, f"{content.sha256}*")):
+        os.remove(path)
+
+
+# Parsed-document cache
+
+def loader_version() -> str:
+    """Version of the parse + split output: LOADER_VERSION and the splitter settings"""
+    from utils_text_splitter import CHUNK_OVERLAP_TOKENS, CHUNK_TOKENS, TEXT_SPLITTER, TOKENIZER_ENCODING
+
+    signature = f"{LOADER_VERSION}:{TEXT_SPLITTER}:{CHUNK_TOKENS}:{CHUNK_OVERLAP_TOKENS}:{TOKENIZER_ENCODING}"
+    return hashlib.sha1(signature.encode("utf-8")).hexdigest()[:12]
+
+
+def _cache_path(sha256: str, extension: str, suffix: str) -> str:
+    return os.path.join(PARSED_CACHE_DIR, f"{sha256}{extension.lower()}-{loader_version()}{suffix}")
+
+
+def _write_atomic(path: str, write):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(temp_path, "wb") as f:
+        write(f)
+    os.replace(temp_path, path)
+
+
+def load_parsed(sha256: str, extension: str) -> Optional[Tuple[List[Document], int]]:
+    """Cached (chunks, page count) of a blob, or None"""
+    try:
+        with open(_cache_path(sha256, extension, ".json"), "r", encoding="utf-8") as f:
+            cached = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    documents = [Document(page_content=chunk["text"], metadata=chunk["metadata"]) for chunk in cached["chunks"]]
+    return documents, cached["pages"]
+
+
+def save_parsed(sha256: str, extension: str, documents: List[Document], pages: int):
+    cached = {
+        "pages": pages,
+        "chunks": [{"text": doc.page_content, "metadata": doc.metadata} for doc in documents],
+    }
+    payload = json.dumps(cached, ensure_ascii=False, default=str).encode("utf-8")
+    _write_atomic(_cache_path(sha256, extension, ".json"), lambda f: f.write(payload))
+
+
+def _model_suffix(model_id: str) -> str:
+    return "." + re.sub(r"[^A-Za-z0-9_.-]+", "-", model_id) + ".npy"
+
+
+def load_embeddings(sha256: str, extension: str, model_id: str, texts: List[str]) -> Optional[Dict[str, List[float]]]:
+    """Cached embeddings of a blob's chunks (texts, in cache order) for an embedding model, by text"""
+    import numpy as np
+
+    try:
+        vectors = np.load(_cache_path(sha256, extension, _model_suffix(model_id)))
+    except (FileNotFoundError, ValueError):
+        return None
+    if len(vectors) != len(texts):
+        return None
+    return dict(zip(texts, vectors.tolist()))
+
+
+def save_embeddings(sha256: str, extension: str, model_id: str, vectors: List[List[float]]):
+    import numpy as np
+
+    array = np.asarray(vectors, dtype=np.float32)
+    _write_atomic(_cache_path(sha256, extension, _model_suffix(model_id)), lambda f: np.save(f, array))
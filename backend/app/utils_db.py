@@ -1,5 +1,6 @@
+from sqlalchemy import String, cast, delete, func
 from sqlmodel import SQLModel, Field, Session, select
-from typing import Optional, List, Dict
+from typing import Any, Optional, List, Dict
 from datetime import datetime, timedelta
 from database import engine
 
@@ -8,11 +9,26 @@ class ApplicationLog(SQLModel, table=True):
     __tablename__ = "application_logs"
     
     id: Optional[int] = Field(default=None, primary_key=True)
-    session_id: str
+    session_id: str = Field(index=True)
     user_query: str
     gpt_response: str
     model: str
-    created_at: datetime = Field(default_factory=datetime.now)
+    created_at: datetime = Field(default_factory=datetime.now, index=True)
+    # Time to answer the question, when the caller measured it
+    latency_ms: Optional[float] = None
+
+class ApplicationLogRollup(SQLModel, table=True):
+    """Per-model, per-day totals of application_logs, updated with every insert (see log_rollup_upsert)"""
+    __tablename__ = "application_log_rollups"
+    
+    day: str = Field(primary_key=True)  # YYYY-MM-DD of created_at
+    model: str = Field(primary_key=True)
+    requests: int = 0
+    query_chars: int = 0
+    response_chars: int = 0
+    # Requests with a recorded latency, and the sum of their latencies
+    latency_samples: int = 0
+    latency_ms_sum: float = 0.0
 
 class DocumentStore(SQLModel, table=True):
     __tablename__ = "document_store"
@@ -21,17 +37,105 @@ class DocumentStore(SQLModel, table=True):
     filename: str
     upload_timestamp: datetime = Field(default_factory=datetime.now)
 
+class DocumentContent(SQLModel, table=True):
+    __tablename__ = "document_content"
+    
+    # One row per document_store row; identical uploads share sha256 and path
+    file_id: int = Field(primary_key=True)
+    sha256: str = Field(index=True)
+    size: int
+    path: str
+
+class ConversationMessage(SQLModel, table=True):
+    __tablename__ = "conversation_messages"
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    conversation_id: str = Field(index=True)
+    content: str
+    from_user: bool = True
+    timestamp: datetime = Field(default_factory=datetime.now)
+
+class SharedCacheEntry(SQLModel, table=True):
+    __tablename__ = "shared_cache"
+    
+    key: str = Field(primary_key=True)
+    value: str
+    expires_at: Optional[float] = None
+
+# Rollup upserts by dialect, built once (see log_rollup_upsert)
+_log_rollup_upserts: Dict[str, Any] = {}
+
+def log_rollup_upsert(dialect_name: str = engine.dialect.name):
+    """
+    INSERT ... ON CONFLICT statement adding one log to the rollup row of its day and model
+
+    Built once per dialect, so every insert reuses its compiled SQL; execute
+    it with params=log_rollup_params(log).
+    """
+    statement = _log_rollup_upserts.get(dialect_name)
+    if statement is None:
+        if dialect_name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        rollup = ApplicationLogRollup.__table__
+        statement = insert(rollup)
+        statement = statement.on_conflict_do_update(
+            index_elements=[rollup.c.day, rollup.c.model],
+            set_={name: rollup.c[name] + statement.excluded[name] for name in (
+                "requests", "query_chars", "response_chars", "latency_samples", "latency_ms_sum"
+            )},
+        )
+        _log_rollup_upserts[dialect_name] = statement
+    return statement
+
+def log_rollup_params(log: ApplicationLog) -> Dict[str, Any]:
+    """The contribution of one log to its rollup row"""
+    return {
+        "day": log.created_at.date().isoformat(),
+        "model": log.model,
+        "requests": 1,
+        "query_chars": len(log.user_query),
+        "response_chars": len(log.gpt_response),
+        "latency_samples": 0 if log.latency_ms is None else 1,
+        "latency_ms_sum": log.latency_ms or 0.0,
+    }
+
+def log_rollup_rebuild_statements():
+    """
+    Statements recomputing the rollup rows from application_logs, aggregated in the database
+
+    Only the days that still have logs are replaced: the rows of days already
+    pruned by delete_old_logs are kept.
+    """
+    day = func.substr(cast(ApplicationLog.created_at, String), 1, 10)
+    totals = select(
+        day, ApplicationLog.model, func.count(), func.coalesce(func.sum(func.length(ApplicationLog.user_query)), 0),
+        func.coalesce(func.sum(func.length(ApplicationLog.gpt_response)), 0), func.count(ApplicationLog.latency_ms),
+        func.coalesce(func.sum(ApplicationLog.latency_ms), 0.0)
+    ).group_by(day, ApplicationLog.model)
+    rollup = ApplicationLogRollup.__table__
+    return [
+        delete(ApplicationLogRollup).where(ApplicationLogRollup.day.in_(select(day).distinct())),
+        rollup.insert().from_select(
+            ["day", "model", "requests", "query_chars", "response_chars", "latency_samples", "latency_ms_sum"], totals
+        ),
+    ]
+
 # Database operations using SQLModel ORM
-def insert_application_logs(session_id: str, user_query: str, gpt_response: str, model: str) -> int:
-    """Insert a new application log record"""
+def insert_application_logs(session_id: str, user_query: str, gpt_response: str, model: str,
+                            latency_ms: Optional[float] = None) -> int:
+    """Insert a new application log record and add it to the per-model, per-day rollup"""
     with Session(engine) as session:
         log = ApplicationLog(
             session_id=session_id,
             user_query=user_query,
             gpt_response=gpt_response,
-            model=model
+            model=model,
+            latency_ms=latency_ms
         )
         session.add(log)
+        session.exec(log_rollup_upsert(), params=log_rollup_params(log))
         session.commit()
         session.refresh(log)
         return log.id
@@ -53,6 +157,27 @@ def get_chat_history(session_id: str) -> List[Dict[str, str]]:
             ])
         return messages
 
+def rebuild_log_rollups() -> int:
+    """Recompute the rollups of the days that have logs (after a backfill, or for logs from before rollups existed)"""
+    with Session(engine) as session:
+        for statement in log_rollup_rebuild_statements():
+            session.exec(statement)
+        session.commit()
+        return session.exec(select(func.count()).select_from(ApplicationLogRollup)).one()
+
+def get_log_rollups(start: Optional[str] = None, end: Optional[str] = None,
+                    model: Optional[str] = None) -> List[ApplicationLogRollup]:
+    """Rollup rows for days start..end (YYYY-MM-DD, inclusive), oldest first"""
+    with Session(engine) as session:
+        statement = select(ApplicationLogRollup)
+        if start:
+            statement = statement.where(ApplicationLogRollup.day >= start)
+        if end:
+            statement = statement.where(ApplicationLogRollup.day <= end)
+        if model:
+            statement = statement.where(ApplicationLogRollup.model == model)
+        return session.exec(statement.order_by(ApplicationLogRollup.day, ApplicationLogRollup.model)).all()
+
 def insert_document_record(filename: str) -> int:
     """Insert a new document record and return its ID"""
     with Session(engine) as session:
@@ -74,6 +199,35 @@ def delete_document_record(file_id: int) -> bool:
             return True
         return False
 
+def insert_document_content(file_id: int, sha256: str, size: int, path: str):
+    """Link a document to its content-addressed blob"""
+    with Session(engine) as session:
+        session.add(DocumentContent(file_id=file_id, sha256=sha256, size=size, path=path))
+        session.commit()
+
+def delete_document_content(file_id: int) -> Optional[DocumentContent]:
+    """Unlink a document from its blob; returns the removed link, if any"""
+    with Session(engine) as session:
+        content = session.get(DocumentContent, file_id)
+        if content:
+            session.delete(content)
+            session.commit()
+        return content
+
+def count_document_content(sha256: str) -> int:
+    """Number of documents sharing a blob"""
+    with Session(engine) as session:
+        statement = select(DocumentContent.file_id).where(DocumentContent.sha256 == sha256)
+        return len(session.exec(statement).all())
+
+def get_file_ids_by_content(sha256: str) -> List[int]:
+    """IDs of the documents with the given content hash, oldest first"""
+    with Session(engine) as session:
+        statement = select(DocumentContent.file_id).where(
+            DocumentContent.sha256 == sha256
+        ).order_by(DocumentContent.file_id)
+        return list(session.exec(statement).all())
+
 def get_all_documents() -> List[Dict]:
     """Get all documents ordered by upload timestamp (newest first)"""
     with Session(engine) as session:
@@ -118,4 +272,62 @@ def delete_old_logs(days: int = 30) -> int:
         for log in old_logs:
             session.delete(log)
         session.commit()
-        return count
\ No newline at end of file
+        return count
+
+def insert_conversation_message(conversation_id: str, content: str, from_user: bool, timestamp: datetime) -> int:
+    """Append a message to a shared conversation"""
+    with Session(engine) as session:
+        message = ConversationMessage(
+            conversation_id=conversation_id,
+            content=content,
+            from_user=from_user,
+            timestamp=timestamp
+        )
+        session.add(message)
+        session.commit()
+        session.refresh(message)
+        return message.id
+
+def get_conversation_messages(conversation_id: str, limit: Optional[int] = None) -> List[ConversationMessage]:
+    """Get the messages of a shared conversation in insertion order, only the newest `limit` if given"""
+    with Session(engine) as session:
+        statement = select(ConversationMessage).where(
+            ConversationMessage.conversation_id == conversation_id
+        )
+        if limit is None:
+            return session.exec(statement.order_by(ConversationMessage.id)).all()
+        messages = session.exec(statement.order_by(ConversationMessage.id.desc()).limit(limit)).all()
+        return messages[::-1]
+
+def delete_conversation_messages(conversation_id: str) -> int:
+    """Delete all messages of a shared conversation"""
+    with Session(engine) as session:
+        statement = select(ConversationMessage).where(
+            ConversationMessage.conversation_id == conversation_id
+        )
+        messages = session.exec(statement).all()
+        for message in messages:
+            session.delete(message)
+        session.commit()
+        return len(messages)
+
+def get_shared_cache_entry(key: str) -> Optional[SharedCacheEntry]:
+    """Get a shared cache entry by key"""
+    with Session(engine) as session:
+        return session.get(SharedCacheEntry, key)
+
+def upsert_shared_cache_entry(key: str, value: str, expires_at: Optional[float]):
+    """Insert or replace a shared cache entry"""
+    with Session(engine) as session:
+        session.merge(SharedCacheEntry(key=key, value=value, expires_at=expires_at))
+        session.commit()
+
+def delete_shared_cache_entry(key: str) -> bool:
+    """Delete a shared cache entry by key"""
+    with Session(engine) as session:
+        entry = session.get(SharedCacheEntry, key)
+        if entry:
+            session.delete(entry)
+            session.commit()
+            return True
+        return False
@@ -0,0 +1,211 @@
+"""
+Async equivalents of the utils_db operations, for the FastAPI handlers
+
+The functions keep the names and signatures of utils_db but run on the shared
+async engine (database.async_engine, aiosqlite), so awaiting them yields the
+event loop instead of blocking it on SQLite.
+
+The hot queries are built once at import with bound parameters: every call
+reuses the same statement object, SQLAlchemy finds its compiled SQL in the
+engine's compiled cache and sqlite3 reuses the prepared statement of the
+connection (see database.STATEMENT_CACHE_SIZE).
+"""
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import bindparam, delete, func
+from sqlmodel import select
+
+from database import async_engine, async_session
+from utils_db import (
+    ApplicationLog, ApplicationLogRollup, ConversationMessage, DocumentContent, DocumentStore, SharedCacheEntry,
+    log_rollup_params, log_rollup_upsert
+)
+
+# Prebuilt statements
+_logs_by_session = select(ApplicationLog).where(
+    ApplicationLog.session_id == bindparam("session_id")
+).order_by(ApplicationLog.created_at)
+_recent_logs = select(ApplicationLog).order_by(ApplicationLog.created_at.desc()).limit(bindparam("limit"))
+_delete_old_logs = delete(ApplicationLog).where(ApplicationLog.created_at < bindparam("cutoff"))
+_all_documents = select(DocumentStore).order_by(DocumentStore.upload_timestamp.desc())
+_delete_document = delete(DocumentStore).where(DocumentStore.id == bindparam("file_id"))
+_count_content = select(func.count()).select_from(DocumentContent).where(
+    DocumentContent.sha256 == bindparam("sha256")
+)
+_file_ids_by_content = select(DocumentContent.file_id).where(
+    DocumentContent.sha256 == bindparam("sha256")
+).order_by(DocumentContent.file_id)
+_conversation_messages = select(ConversationMessage).where(
+    ConversationMessage.conversation_id == bindparam("conversation_id")
+).order_by(ConversationMessage.id)
+_newest_conversation_messages = select(ConversationMessage).where(
+    ConversationMessage.conversation_id == bindparam("conversation_id")
+).order_by(ConversationMessage.id.desc()).limit(bindparam("limit"))
+_delete_conversation = delete(ConversationMessage).where(
+    ConversationMessage.conversation_id == bindparam("conversation_id")
+)
+_delete_cache_entry = delete(SharedCacheEntry).where(SharedCacheEntry.key == bindparam("key"))
+
+
+async def insert_application_logs(session_id: str, user_query: str, gpt_response: str, model: str,
+                                  latency_ms: Optional[float] = None) -> int:
+    """Insert a new application log record and add it to the per-model, per-day rollup"""
+    async with async_session() as session:
+        log = ApplicationLog(
+            session_id=session_id,
+            user_query=user_query,
+            gpt_response=gpt_response,
+            model=model,
+            latency_ms=latency_ms
+        )
+        session.add(log)
+        await session.exec(log_rollup_upsert(async_engine.dialect.name), params=log_rollup_params(log))
+        await session.commit()
+        return log.id
+
+async def get_chat_history(session_id: str) -> List[Dict[str, str]]:
+    """Get chat history for a specific session"""
+    messages = []
+    for log in await get_application_logs_by_session(session_id):
+        messages.extend([
+            {"role": "human", "content": log.user_query},
+            {"role": "ai", "content": log.gpt_response}
+        ])
+    return messages
+
+async def insert_document_record(filename: str) -> int:
+    """Insert a new document record and return its ID"""
+    async with async_session() as session:
+        document = DocumentStore(filename=filename)
+        session.add(document)
+        await session.commit()
+        return document.id
+
+async def delete_document_record(file_id: int) -> bool:
+    """Delete a document record by ID"""
+    async with async_session() as session:
+        result = await session.exec(_delete_document, params={"file_id": file_id})
+        await session.commit()
+        return result.rowcount > 0
+
+async def insert_document_content(file_id: int, sha256: str, size: int, path: str):
+    """Link a document to its content-addressed blob"""
+    async with async_session() as session:
+        session.add(DocumentContent(file_id=file_id, sha256=sha256, size=size, path=path))
+        await session.commit()
+
+async def delete_document_content(file_id: int) -> Optional[DocumentContent]:
+    """Unlink a document from its blob; returns the removed link, if any"""
+    async with async_session() as session:
+        content = await session.get(DocumentContent, file_id)
+        if content:
+            await session.delete(content)
+            await session.commit()
+        return content
+
+async def count_document_content(sha256: str) -> int:
+    """Number of documents sharing a blob"""
+    async with async_session() as session:
+        result = await session.exec(_count_content, params={"sha256": sha256})
+        return result.one()
+
+async def get_file_ids_by_content(sha256: str) -> List[int]:
+    """IDs of the documents with the given content hash, oldest first"""
+    async with async_session() as session:
+        result = await session.exec(_file_ids_by_content, params={"sha256": sha256})
+        return list(result.all())
+
+async def get_all_documents() -> List[Dict]:
+    """Get all documents ordered by upload timestamp (newest first)"""
+    async with async_session() as session:
+        documents = (await session.exec(_all_documents)).all()
+        return [
+            {
+                "id": doc.id,
+                "filename": doc.filename,
+                "upload_timestamp": doc.upload_timestamp
+            }
+            for doc in documents
+        ]
+
+async def get_application_logs_by_session(session_id: str) -> List[ApplicationLog]:
+    """Get all application logs for a specific session"""
+    async with async_session() as session:
+        result = await session.exec(_logs_by_session, params={"session_id": session_id})
+        return list(result.all())
+
+async def get_recent_logs(limit: int = 10) -> List[ApplicationLog]:
+    """Get recent application logs"""
+    async with async_session() as session:
+        result = await session.exec(_recent_logs, params={"limit": limit})
+        return list(result.all())
+
+async def delete_old_logs(days: int = 30) -> int:
+    """Delete logs older than specified days"""
+    async with async_session() as session:
+        result = await session.exec(_delete_old_logs, params={"cutoff": datetime.now() - timedelta(days=days)})
+        await session.commit()
+        return result.rowcount
+
+async def get_log_rollups(start: Optional[str] = None, end: Optional[str] = None,
+                          model: Optional[str] = None) -> List[ApplicationLogRollup]:
+    """Rollup rows for days start..end (YYYY-MM-DD, inclusive), oldest first"""
+    async with async_session() as session:
+        statement = select(ApplicationLogRollup)
+        if start:
+            statement = statement.where(ApplicationLogRollup.day >= start)
+        if end:
+            statement = statement.where(ApplicationLogRollup.day <= end)
+        if model:
+            statement = statement.where(ApplicationLogRollup.model == model)
+        result = await session.exec(statement.order_by(ApplicationLogRollup.day, ApplicationLogRollup.model))
+        return list(result.all())
+
+async def insert_conversation_message(conversation_id: str, content: str, from_user: bool, timestamp: datetime) -> int:
+    """Append a message to a shared conversation"""
+    async with async_session() as session:
+        message = ConversationMessage(
+            conversation_id=conversation_id,
+            content=content,
+            from_user=from_user,
+            timestamp=timestamp
+        )
+        session.add(message)
+        await session.commit()
+        return message.id
+
+async def get_conversation_messages(conversation_id: str, limit: Optional[int] = None) -> List[ConversationMessage]:
+    """Get the messages of a shared conversation in insertion order, only the newest `limit` if given"""
+    async with async_session() as session:
+        if limit is None:
+            result = await session.exec(_conversation_messages, params={"conversation_id": conversation_id})
+            return list(result.all())
+        result = await session.exec(_newest_conversation_messages,
+                                    params={"conversation_id": conversation_id, "limit": limit})
+        return result.all()[::-1]
+
+async def delete_conversation_messages(conversation_id: str) -> int:
+    """Delete all messages of a shared conversation"""
+    async with async_session() as session:
+        result = await session.exec(_delete_conversation, params={"conversation_id": conversation_id})
+        await session.commit()
+        return result.rowcount
+
+async def get_shared_cache_entry(key: str) -> Optional[SharedCacheEntry]:
+    """Get a shared cache entry by key"""
+    async with async_session() as session:
+        return await session.get(SharedCacheEntry, key)
+
+async def upsert_shared_cache_entry(key: str, value: str, expires_at: Optional[float]):
+    """Insert or replace a shared cache entry"""
+    async with async_session() as session:
+        await session.merge(SharedCacheEntry(key=key, value=value, expires_at=expires_at))
+        await session.commit()
+
+async def delete_shared_cache_entry(key: str) -> bool:
+    """Delete a shared cache entry by key"""
+    async with async_session() as session:
+        result = await session.exec(_delete_cache_entry, params={"key": key})
+        await session.commit()
+        return result.rowcount > 0
@@ -0,0 +1,255 @@
+"""
+Document-level index for two-level (coarse-to-fine) retrieval
+
+When a document is indexed, a profile is computed once from its chunks:
+
+- centroid: the mean of the unit-normalized chunk embeddings, normalized again
+- keywords: the most frequent terms (English words and CJK character bigrams,
+  minus stopwords)
+- summary: an extractive summary, the SUMMARY_SENTENCES sentences that carry
+  the most keyword weight, in document order
+
+Profiles are stored in a small NumpyVectorStore (one row per file_id, under
+DOC_INDEX_DIR) whatever the chunk backend is. With TWO_LEVEL_RETRIEVAL=1 the
+retriever first picks the DOC_TOP_M documents closest to the query there, then
+searches only their chunks (by chunk id on Chroma, with a file_id filter
+otherwise), instead of running the search over every chunk of every document
+(see two_level_search).
+
+Documents indexed before the feature was enabled have no profile; backfill
+them from the stored chunks (no re-parsing; embeddings are reused where the
+vector store returns them):
+
+    python utils_doc_index.py build
+    python utils_doc_index.py show 12
+"""
+import argparse
+import os
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+
+from utils_text_splitter import split_sentences
+
+TWO_LEVEL_RETRIEVAL = os.getenv("TWO_LEVEL_RETRIEVAL", "0") == "1"
+# Documents whose chunks are searched per query
+DOC_TOP_M = int(os.getenv("DOC_TOP_M", "8"))
+# Chunks of the selected documents fetched by id at most; above, a filtered search is used
+DOC_FETCH_MAX_CHUNKS = 4096
+DOC_KEYWORDS = 20
+SUMMARY_SENTENCES = 5
+# Sentences longer than this (characters) are cut before going into a summary
+SUMMARY_SENTENCE_CHARS = 300
+
+_WORD = re.compile(r"[A-Za-z][A-Za-z0-9_-]{2,}")
+_CJK_RUN = re.compile(r"[一-鿿]{2,}")
+_STOPWORDS = frozenset(
+    "the and for with that this from are was were been have has had not but you your they their them "
+    "its our can will would should could may might into than then there these those which what when "
+    "where who how all any each more most other some such only also very just over about after before "
+    "between under again further once here why both few own same too out off per via".split()
+) | frozenset(
+    "的了 了的 是一 一个 我们 你们 他们 这个 那个 以及 或者 因为 所以 如果 但是 可以 进行 没有 不是 就是 "
+    "这些 那些 其中 之一 对于 关于 通过 已经 还是 并且 而且 以上 以下 时候 什么 为了".split()
+)
+
+
+def _terms(text: str) -> List[str]:
+    terms = [word.lower() for word in _WORD.findall(text)]
+    for run in _CJK_RUN.findall(text):
+        terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return [term for term in terms if term not in _STOPWORDS]
+
+
+def extract_keywords(texts: Sequence[str], limit: int = DOC_KEYWORDS) -> Dict[str, int]:
+    """The `limit` most frequent terms of the texts, with their counts"""
+    counts = Counter()
+    for text in texts:
+        counts.update(_terms(text))
+    return dict(counts.most_common(limit))
+
+
+def extractive_summary(texts: Sequence[str], keywords: Dict[str, int], sentences: int = SUMMARY_SENTENCES) -> str:
+    """The sentences with the highest keyword weight per term, joined in document order"""
+    candidates = []
+    seen = set()
+    for text in texts:
+        for sentence in split_sentences(text):
+            sentence = " ".join(sentence.split())[:SUMMARY_SENTENCE_CHARS]
+            # Chunks overlap, so the same sentence shows up more than once
+            if len(sentence) < 8 or sentence in seen:
+                continue
+            seen.add(sentence)
+            terms = _terms(sentence)
+            if terms:
+                score = sum(keywords.get(term, 0) for term in terms) / len(terms) ** 0.5
+                candidates.append((score, len(candidates), sentence))
+    best = sorted(candidates, key=lambda candidate: -candidate[0])[:sentences]
+    return " ".join(sentence for _, _, sentence in sorted(best, key=lambda candidate: candidate[1]))
+
+
+def centroid(embeddings: Sequence[Sequence[float]]) -> List[float]:
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    mean = vectors.mean(axis=0)
+    return (mean / max(float(np.linalg.norm(mean)), 1e-12)).tolist()
+
+
+def build_profile(chunks: Sequence[Document], embeddings: Sequence[Sequence[float]]) -> Dict[str, Any]:
+    """Centroid, keywords and summary of a document from its chunks and their embeddings"""
+    texts = [chunk.page_content for chunk in chunks]
+    keywords = extract_keywords(texts)
+    return {
+        "embedding": centroid(embeddings),
+        "keywords": list(keywords),
+        "summary": extractive_summary(texts, keywords),
+    }
+
+
+def save_profile(doc_index, file_id: int, profile: Dict[str, Any], chunk_ids: List[str],
+                 knowledge_base: Optional[str] = None):
+    """Add or replace the row of a document; chunk_ids are the ids of its chunks in the vector store"""
+    metadata = {"file_id": file_id, "keywords": ", ".join(profile["keywords"]),
+                "chunks": len(chunk_ids), "chunk_ids": list(chunk_ids)}
+    if knowledge_base:
+        metadata["knowledge_base"] = knowledge_base
+    doc_index.add_embeddings([profile["embedding"]], [profile["summary"]], [metadata], [str(file_id)])
+
+
+def select_documents(doc_index, embedding: List[float], top_m: int = DOC_TOP_M,
+                     filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Metadata of the top_m documents closest to the query embedding"""
+    return [doc.metadata for doc in doc_index.similarity_search_by_vector(embedding, k=top_m, filter=filter)]
+
+
+def _rank_chunks_by_id(vector_store, embedding: List[float], chunk_ids: List[str], k: int) -> Optional[List[Document]]:
+    """
+    Top-k of the given Chroma chunks by cosine similarity, or None for other backends
+
+    Chroma evaluates metadata filters by scanning its metadata table, which
+    grows with the corpus; fetching the chunks by id and ranking them here
+    only costs as much as the chunks of the selected documents.
+    """
+    from utils_vector_index import iter_collection_stores
+
+    collections = [getattr(store, "_collection", None) for store in iter_collection_stores(vector_store)]
+    if not collections or None in collections:
+        return None
+    ids, texts, metadatas, vectors = [], [], [], []
+    for collection in collections:
+        records = collection.get(ids=chunk_ids, include=["embeddings", "documents", "metadatas"])
+        ids.extend(records["ids"])
+        texts.extend(records["documents"])
+        metadatas.extend(records["metadatas"])
+        vectors.extend(records["embeddings"])
+    if not ids:
+        return []
+    vectors = np.asarray(vectors, dtype=np.float32)
+    query = np.asarray(embedding, dtype=np.float32)
+    scores = vectors @ query / np.maximum(np.linalg.norm(vectors, axis=1) * np.linalg.norm(query), 1e-12)
+    top = np.argsort(-scores, kind="stable")[:k]
+    return [Document(page_content=texts[i], metadata=metadatas[i] or {}, id=ids[i]) for i in top]
+
+
+def two_level_search(vector_store, doc_index, embedding: List[float], k: int, top_m: int = DOC_TOP_M,
+                     filter: Optional[Dict[str, Any]] = None) -> List[Document]:
+    """
+    Top-k chunks among those of the top_m closest documents
+
+    filter (e.g. {"knowledge_base": "hr"}) applies to both levels. On Chroma
+    the chunks of the selected documents are fetched by id and ranked
+    exactly (up to DOC_FETCH_MAX_CHUNKS); otherwise they are searched with a
+    file_id $in filter. Falls back to a search over all chunks when the
+    document index has no match, e.g. before it was built.
+    """
+    documents = select_documents(doc_index, embedding, top_m, filter)
+    if not documents:
+        return vector_store.similarity_search_by_vector(embedding, k=k, filter=filter)
+    chunk_ids = [chunk_id for metadata in documents for chunk_id in metadata.get("chunk_ids") or []]
+    if len(chunk_ids) == sum(metadata.get("chunks", 0) for metadata in documents) \
+            and len(chunk_ids) <= DOC_FETCH_MAX_CHUNKS:
+        ranked = _rank_chunks_by_id(vector_store, embedding, chunk_ids, k)
+        if ranked is not None:
+            return ranked
+    chunk_filter: Dict[str, Any] = {"file_id": {"$in": [metadata["file_id"] for metadata in documents]}}
+    if filter:
+        chunk_filter = {"$and": [filter, chunk_filter]}
+    return vector_store.similarity_search_by_vector(embedding, k=k, filter=chunk_filter)
+
+
+# Backfill
+
+def _stored_chunks(vector_store, file_id: int):
+    """(chunks, embeddings or None) of a document in the vector store"""
+    try:
+        records = vector_store.get(where={"file_id": file_id}, include=["documents", "metadatas", "embeddings"])
+    except (TypeError, ValueError):
+        records = vector_store.get(where={"file_id": file_id})
+    chunks = [Document(page_content=text, metadata=metadata or {}, id=chunk_id)
+              for chunk_id, text, metadata in zip(records["ids"], records.get("documents") or [],
+                                                  records.get("metadatas") or [])]
+    embeddings = records.get("embeddings")
+    if embeddings is None or len(embeddings) != len(chunks):
+        embeddings = None
+    return chunks, embeddings
+
+
+def build(file_ids: Optional[List[int]] = None, rebuild: bool = False) -> Dict[str, int]:
+    """Profile the documents of the vector store that have no row in the document index yet"""
+    from utils_chroma import get_document_index, get_embedding_model, vector_store_writer
+    from utils_db import get_all_documents
+
+    counts = {"built": 0, "skipped": 0, "empty": 0}
+    file_ids = file_ids or [doc["id"] for doc in get_all_documents()]
+    with vector_store_writer() as vector_store:
+        doc_index = get_document_index()
+        existing = set(doc_index.get()["ids"])
+        for file_id in file_ids:
+            if str(file_id) in existing and not rebuild:
+                counts["skipped"] += 1
+                continue
+            chunks, embeddings = _stored_chunks(vector_store, file_id)
+            if not chunks:
+                counts["empty"] += 1
+                continue
+            if embeddings is None:
+                embeddings = get_embedding_model().embed_documents([chunk.page_content for chunk in chunks])
+            save_profile(doc_index, file_id, build_profile(chunks, embeddings), [chunk.id for chunk in chunks],
+                         chunks[0].metadata.get("knowledge_base"))
+            counts["built"] += 1
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Document-level index for two-level retrieval")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="Profile documents that are not in the document index")
+    build_parser.add_argument("file_ids", nargs="*", type=int, help="Only these documents (default: all)")
+    build_parser.add_argument("--rebuild", action="store_true", help="Also recompute existing profiles")
+    show_parser = commands.add_parser("show", help="Print the profile of a document")
+    show_parser.add_argument("file_id", type=int)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        counts = build(args.file_ids, args.rebuild)
+        print(f"✅ {counts['built']} built, {counts['skipped']} already indexed, {counts['empty']} without chunks")
+    else:
+        from utils_chroma import get_document_index
+
+        records = get_document_index().get(ids=[str(args.file_id)])
+        if not records["ids"]:
+            print(f"No profile for file_id {args.file_id}")
+            return
+        metadata = records["metadatas"][0]
+        print(f"file_id: {metadata['file_id']} ({metadata['chunks']} chunks)")
+        if metadata.get("knowledge_base"):
+            print(f"knowledge_base: {metadata['knowledge_base']}")
+        print(f"keywords: {metadata['keywords']}")
+        print(f"summary: {records['documents'][0]}")
+
+
+if __name__ == "__main__":
+    main()
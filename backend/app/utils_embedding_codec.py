@@ -0,0 +1,174 @@
+"""
+Compact embedding storage: self-describing blobs and quantized matrices
+
+Blob layout (little endian), used for KnowledgeBase.embedding:
+
+    magic "IPEM" | version u8 | dtype u8 | dimension u32 | model id length u16 | model id (utf-8) | payload
+
+Payload per dtype, for a dimension d:
+
+    float32   4d bytes
+    float16   2d bytes                    2x smaller
+    int8      float32 scale + d bytes     ~4x smaller, per-vector symmetric scale
+    binary    ceil(d / 8) bytes           32x smaller, one sign bit per dimension
+
+Blobs without the magic are legacy raw float32 arrays. The same quantizers
+work row-wise on matrices for the NumPy vector store, where the compact codes
+give a coarse ranking that is then rescored with the float32 vectors.
+"""
+import struct
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+
+MAGIC = b"IPEM"
+VERSION = 1
+_HEADER = struct.Struct("<4sBBIH")
+
+DTYPES = ("float32", "float16", "int8", "binary")
+_DTYPE_CODES = {name: code for code, name in enumerate(DTYPES)}
+
+# Bytes per vector of dimension d, used for reporting
+BYTES_PER_DIMENSION = {"float32": 4.0, "float16": 2.0, "int8": 1.0, "binary": 1 / 8}
+
+
+class EmbeddingHeader(NamedTuple):
+    dimension: int
+    dtype: str
+    model_id: str
+    version: int
+
+
+def _check_dtype(dtype: str):
+    if dtype not in _DTYPE_CODES:
+        raise ValueError(f"Unknown embedding dtype: {dtype}. Available dtypes: {', '.join(DTYPES)}")
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length (zero rows are left as is)"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def code_width(dtype: str, dimension: int) -> int:
+    """Number of code elements per row of a quantized matrix"""
+    return (dimension + 7) // 8 if dtype == "binary" else dimension
+
+
+def code_dtype(dtype: str) -> np.dtype:
+    return np.dtype(np.uint8) if dtype == "binary" else np.dtype(dtype)
+
+
+def quantize(vectors: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Quantize a matrix row-wise
+
+    Returns:
+        (codes, scales); scales is only set for int8
+    """
+    _check_dtype(dtype)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dtype == "float32":
+        return vectors, None
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    return np.packbits(vectors > 0, axis=1), None
+
+
+def dequantize(codes: np.ndarray, dtype: str, dimension: int, scales: Optional[np.ndarray] = None) -> np.ndarray:
+    """Approximate float32 rows back from codes (binary rows become unit-length sign vectors)"""
+    _check_dtype(dtype)
+    if dtype == "int8":
+        return codes.astype(np.float32) * scales[:, None]
+    if dtype == "binary":
+        signs = np.unpackbits(codes, axis=1, count=dimension).astype(np.float32) * 2 - 1
+        return signs / np.sqrt(dimension)
+    return codes.astype(np.float32)
+
+
+if hasattr(np, "bitwise_count"):
+    def _popcount_rows(bits: np.ndarray) -> np.ndarray:
+        return np.bitwise_count(bits).sum(axis=1, dtype=np.int32)
+else:
+    _POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _popcount_rows(bits: np.ndarray) -> np.ndarray:
+        return _POPCOUNT[bits].sum(axis=1, dtype=np.int32)
+
+
+def coarse_scores(codes: np.ndarray, query: np.ndarray, dtype: str,
+                  scales: Optional[np.ndarray] = None, block_rows: int = 16384) -> np.ndarray:
+    """
+    Approximate cosine similarity of a unit query to every row of a quantized matrix
+
+    Binary rows are compared by Hamming distance on the sign bits, mapped to
+    [-1, 1]; the other dtypes use a dot product. Rows are processed in blocks
+    so the float32 temporaries stay small for memory-mapped matrices.
+    """
+    count = len(codes)
+    scores = np.empty(count, dtype=np.float32)
+    if dtype == "binary":
+        dimension = len(query)
+        packed_query = np.packbits(query > 0)
+        for start in range(0, count, block_rows):
+            end = min(start + block_rows, count)
+            hamming = _popcount_rows(np.bitwise_xor(codes[start:end], packed_query))
+            scores[start:end] = 1 - 2 * hamming / dimension
+        return scores
+    if dtype == "float32":
+        return np.asarray(codes @ query, dtype=np.float32)
+    for start in range(0, count, block_rows):
+        end = min(start + block_rows, count)
+        block_scores = codes[start:end].astype(np.float32) @ query
+        if dtype == "int8":
+            block_scores *= scales[start:end]
+        scores[start:end] = block_scores
+    return scores
+
+
+def encode_embedding(vector, dtype: str = "float16", model_id: str = "") -> bytes:
+    """Encode one embedding as a self-describing blob"""
+    _check_dtype(dtype)
+    vector = np.asarray(vector, dtype=np.float32).reshape(1, -1)
+    model_bytes = model_id.encode("utf-8")
+    header = _HEADER.pack(MAGIC, VERSION, _DTYPE_CODES[dtype], vector.shape[1], len(model_bytes))
+    codes, scales = quantize(vector, dtype)
+    payload = codes.astype(code_dtype(dtype).newbyteorder("<"), copy=False).tobytes()
+    if scales is not None:
+        payload = scales.astype("<f4").tobytes() + payload
+    return header + model_bytes + payload
+
+
+def read_embedding_header(blob: bytes) -> Optional[EmbeddingHeader]:
+    """Header of a blob, or None for a legacy raw float32 blob"""
+    if len(blob) < _HEADER.size or blob[:4] != MAGIC:
+        return None
+    _, version, dtype_code, dimension, model_length = _HEADER.unpack_from(blob)
+    if version != VERSION or dtype_code >= len(DTYPES):
+        raise ValueError(f"Unsupported embedding blob (version {version}, dtype code {dtype_code})")
+    model_id = blob[_HEADER.size:_HEADER.size + model_length].decode("utf-8")
+    return EmbeddingHeader(dimension, DTYPES[dtype_code], model_id, version)
+
+
+def decode_embedding(blob: bytes) -> np.ndarray:
+    """Decode a blob (or a legacy raw float32 blob) into a float32 vector"""
+    header = read_embedding_header(blob)
+    if header is None:
+        if len(blob) % 4:
+            raise ValueError("Legacy embedding blob length is not a multiple of 4 bytes")
+        return np.frombuffer(blob, dtype="<f4").astype(np.float32)
+    offset = _HEADER.size + len(header.model_id.encode("utf-8"))
+    scales = None
+    if header.dtype == "int8":
+        scales = np.frombuffer(blob, dtype="<f4", count=1, offset=offset)
+        offset += 4
+    width = code_width(header.dtype, header.dimension)
+    codes = np.frombuffer(blob, dtype=code_dtype(header.dtype).newbyteorder("<"), count=width, offset=offset)
+    return dequantize(codes.reshape(1, -1), header.dtype, header.dimension, scales)[0]
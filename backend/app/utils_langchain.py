@@ -1,17 +1,139 @@
-from langchain_openai import ChatOpenAI
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun, BaseCallbackHandler, CallbackManagerForRetrieverRun
+)
+from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.outputs import LLMResult
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.chains import create_history_aware_retriever, create_retrieval_chain
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from typing import List
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
 from langchain_core.documents import Document
+import asyncio
+import difflib
+import json
 import os
-from utils_chroma import get_vector_store
-from prompt_loader import get_default_system_prompt
+import time
+import unicodedata
+from prompt_loader import get_compiled_prompt
+from contextvars import ContextVar
+from utils_metrics import cache_requests, embedding_batch_size, record_span, speculative_retrieval_saved, stage
+from utils_singleflight import EMBEDDING_MAX_BATCH, EmbeddingMicroBatcher, SingleFlight
+
+DEFAULT_PROMPT_NAME = "AI_Agent_Prompt"
+
+# Concurrent requests for the same query embedding, vector search or answer
+# share one in-flight call (see CoalescingRetriever and the /chat endpoint)
+query_embedding_flight = SingleFlight("query_embedding")
+vector_search_flight = SingleFlight("vector_search")
+answer_flight = SingleFlight("answer")
+
+def _get_embedding_model():
+    from utils_chroma import get_embedding_model
+    return get_embedding_model()
+
+# Distinct query embeddings arriving within a few milliseconds go out as one call
+query_embedding_batcher = EmbeddingMicroBatcher(_get_embedding_model)
+
+class RetrievalMemo:
+    """
+    Query embeddings and search results shared by the questions of one batch
+
+    Unlike the single-flight layer, results are kept for the lifetime of the
+    memo, so identical queries (raw or rewritten) anywhere in a /chat/batch
+    request are embedded and searched once. It applies to the retrieval of
+    every task started while it is set in `retrieval_memo`.
+    """
+
+    def __init__(self):
+        self.embeddings: Dict[str, List[float]] = {}
+        self._searches: Dict[Any, asyncio.Task] = {}
+
+    async def prefetch_embeddings(self, texts: List[str]):
+        """Embed the distinct texts not embedded yet, EMBEDDING_MAX_BATCH per call"""
+        texts = [text for text in dict.fromkeys(texts) if text not in self.embeddings]
+        for offset in range(0, len(texts), EMBEDDING_MAX_BATCH):
+            batch = texts[offset:offset + EMBEDDING_MAX_BATCH]
+            embedding_batch_size.observe(len(batch))
+            self.embeddings.update(zip(batch, await _get_embedding_model().aembed_documents(batch)))
+
+    async def search(self, key: Any, fn) -> List[Document]:
+        task = self._searches.get(key)
+        if task is None or (task.done() and (task.cancelled() or task.exception() is not None)):
+            cache_requests.inc(cache="batch_retrieval", result="miss")
+            task = self._searches[key] = asyncio.ensure_future(fn())
+        else:
+            cache_requests.inc(cache="batch_retrieval", result="hit")
+        return await asyncio.shield(task)
+
+retrieval_memo: ContextVar[Optional[RetrievalMemo]] = ContextVar("retrieval_memo", default=None)
+
+class CoalescingRetriever(BaseRetriever):
+    """
+    Vector store retriever that coalesces concurrent work
+
+    The async path embeds the query through the single-flight + micro-batching
+    layer and runs the similarity search by vector in a thread, sharing the
+    search between concurrent identical queries (and, within a batch, between
+    all identical queries, see RetrievalMemo).
+
+    With a document index, the search is two-level: the doc_top_m closest
+    documents first, then the chunks of those documents only (see
+    utils_doc_index.two_level_search).
+    """
+
+    vector_store: Any
+    k: int = 2
+    # Chroma-style metadata filter, e.g. {"knowledge_base": "hr"}
+    filter: Optional[Dict[str, Any]] = None
+    doc_index: Any = None
+    doc_top_m: int = 8
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        if self.doc_index is None:
+            return self.vector_store.similarity_search(query, k=self.k, filter=self.filter)
+        return self._search(_get_embedding_model().embed_query(query))
+
+    async def _aget_relevant_documents(self, query: str, *,
+                                       run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        memo = retrieval_memo.get()
+        if memo is not None:
+            return await memo.search(self._search_key(query), lambda: self._aretrieve(query, memo))
+        return await self._aretrieve(query)
+
+    async def _aretrieve(self, query: str, memo: Optional[RetrievalMemo] = None) -> List[Document]:
+        with stage("embed_query"):
+            embedding = memo.embeddings.get(query) if memo is not None else None
+            if embedding is None:
+                embedding = await query_embedding_flight.do(query, lambda: query_embedding_batcher.embed(query))
+                if memo is not None:
+                    memo.embeddings[query] = embedding
+        with stage("vector_search"):
+            return await vector_search_flight.do(self._search_key(query), lambda: self._search_by_vector(embedding))
 
-def get_retriever():
-    vector_store = get_vector_store()
-    return vector_store.as_retriever(search_kwargs={"k": 2})
+    def _search_key(self, query: str) -> Tuple[str, int, Optional[str]]:
+        return query, self.k, json.dumps(self.filter, sort_keys=True) if self.filter else None
+
+    def _search(self, embedding: List[float]) -> List[Document]:
+        if self.doc_index is None:
+            return self.vector_store.similarity_search_by_vector(embedding, k=self.k, filter=self.filter)
+        from utils_doc_index import two_level_search
+        return two_level_search(self.vector_store, self.doc_index, embedding, self.k, self.doc_top_m, self.filter)
+
+    async def _search_by_vector(self, embedding: List[float]) -> List[Document]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._search, embedding)
+
+def get_retriever(knowledge_base: str = None):
+    """The chat retriever, restricted to one knowledge base if given; two-level with TWO_LEVEL_RETRIEVAL=1"""
+    from utils_chroma import get_document_index, get_vector_store
+    from utils_doc_index import DOC_TOP_M, TWO_LEVEL_RETRIEVAL
+    return CoalescingRetriever(
+        vector_store=get_vector_store(), k=2,
+        filter={"knowledge_base": knowledge_base} if knowledge_base else None,
+        doc_index=get_document_index() if TWO_LEVEL_RETRIEVAL else None, doc_top_m=DOC_TOP_M
+    )
 
 output_parser = StrOutputParser()
 
@@ -31,55 +153,293 @@ contextualize_q_prompt = ChatPromptTemplate.from_messages([
 ])
 
 
+# Retrieval modes for follow-up questions (turns with chat history):
+# - "sequential": rewrite the question into a standalone one, then retrieve
+# - "speculative": retrieve for the raw question while the rewrite runs; keep
+#   those documents when the rewrite is materially the same question,
+#   otherwise retrieve for the rewrite as well and merge both result sets
+RETRIEVAL_MODES = ("sequential", "speculative")
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "sequential")
+# Similarity (0-1) of the normalized questions above which a rewrite counts as unchanged
+SPECULATIVE_MATCH_RATIO = float(os.getenv("SPECULATIVE_MATCH_RATIO", "0.9"))
 
-qa_prompt = ChatPromptTemplate.from_messages([
-    ("system", get_default_system_prompt()),
-    ("system", "Context: {context}"),
-    MessagesPlaceholder(variable_name="chat_history"),
-    ("human", "{input}")
-])
+def normalize_question(text: str) -> str:
+    """Casefolded letters and digits only, so punctuation, spacing and width differences don't count"""
+    return "".join(ch for ch in unicodedata.normalize("NFKC", text).casefold() if ch.isalnum())
+
+def is_same_question(question: str, rewritten: str, ratio: float = None) -> bool:
+    """Whether a rewrite is materially the same question"""
+    question, rewritten = normalize_question(question), normalize_question(rewritten)
+    if question == rewritten:
+        return True
+    threshold = SPECULATIVE_MATCH_RATIO if ratio is None else ratio
+    return difflib.SequenceMatcher(None, question, rewritten, autojunk=False).ratio() >= threshold
+
+def merge_documents(*result_sets: List[Document]) -> List[Document]:
+    """Concatenate retrieval results in order, dropping repeated chunks"""
+    seen = set()
+    merged = []
+    for documents in result_sets:
+        for doc in documents:
+            key = doc.id or (doc.page_content, doc.metadata.get("file_id"))
+            if key not in seen:
+                seen.add(key)
+                merged.append(doc)
+    return merged
 
-def get_custom_qa_prompt(prompt_name: str = "AI_Agent_Prompt"):
+def create_speculative_history_aware_retriever(llm: BaseChatModel, retriever: BaseRetriever,
+                                               prompt: ChatPromptTemplate) -> Runnable:
+    """
+    Drop-in replacement for create_history_aware_retriever that retrieves speculatively
+
+    Takes {"input", "chat_history"} and returns documents. Without chat history
+    the raw question is retrieved as is. Otherwise retrieval for the raw
+    question starts together with the rewrite. On a hit (is_same_question)
+    the answer step only waits for the slower of the two; on a miss the rewrite
+    is retrieved as well and its documents come first. Hits and misses are
+    counted as cache_requests{cache="speculative_retrieval"}, and the latency
+    saved against the sequential pipeline goes to speculative_retrieval_saved.
+    Only the async path is speculative.
+    """
+    from langchain.chains import create_history_aware_retriever
+
+    sequential = create_history_aware_retriever(llm, retriever, prompt)
+    rewrite_chain = prompt | llm | StrOutputParser()
+
+    async def timed(awaitable) -> Tuple[Any, float]:
+        start = time.perf_counter()
+        result = await awaitable
+        return result, time.perf_counter() - start
+
+    async def aretrieve(inputs: Dict[str, Any], config: RunnableConfig) -> List[Document]:
+        if not inputs.get("chat_history"):
+            return await retriever.ainvoke(inputs["input"], config)
+
+        start = time.perf_counter()
+        speculative = asyncio.ensure_future(timed(retriever.ainvoke(inputs["input"], config)))
+        try:
+            question, rewrite_seconds = await timed(rewrite_chain.ainvoke(inputs, config))
+        except BaseException:
+            speculative.cancel()
+            raise
+
+        if is_same_question(inputs["input"], question):
+            result = "hit"
+            documents, retrieve_seconds = await speculative
+        else:
+            result = "miss"
+            documents, retrieve_seconds = await timed(retriever.ainvoke(question, config))
+            speculative_documents, _ = await speculative
+            documents = merge_documents(documents, speculative_documents)
+        # The sequential pipeline would have taken rewrite + retrieval of the question used
+        saved = rewrite_seconds + retrieve_seconds - (time.perf_counter() - start)
+        cache_requests.inc(cache="speculative_retrieval", result=result)
+        speculative_retrieval_saved.observe(saved, result=result)
+        return documents
+
+    return RunnableLambda(sequential.invoke, afunc=aretrieve).with_config(run_name="chat_retriever_chain")
+
+# Prompt assembly modes:
+# - "classic": system prompt, retrieved context, chat history, question
+# - "cache_friendly": the static system prompt and the append-only chat history
+#   come first and everything volatile (retrieved context, question) goes into
+#   the final message, so consecutive requests share a byte-identical prefix
+#   that provider-side prompt caching can reuse
+PROMPT_LAYOUTS = ("classic", "cache_friendly")
+PROMPT_LAYOUT = os.getenv("PROMPT_LAYOUT", "classic")
+
+def _build_qa_prompt(system_prompt: str) -> ChatPromptTemplate:
+    return ChatPromptTemplate.from_messages([
+        ("system", system_prompt),
+        ("system", "Context: {context}"),
+        MessagesPlaceholder(variable_name="chat_history"),
+        ("human", "{input}")
+    ])
+
+def _build_cache_friendly_qa_prompt(system_prompt: str) -> ChatPromptTemplate:
+    return ChatPromptTemplate.from_messages([
+        ("system", system_prompt),
+        MessagesPlaceholder(variable_name="chat_history"),
+        ("human", "Context: {context}\n\n{input}")
+    ])
+
+_QA_PROMPT_BUILDERS = {
+    "classic": _build_qa_prompt,
+    "cache_friendly": _build_cache_friendly_qa_prompt,
+}
+
+def get_qa_prompt() -> ChatPromptTemplate:
+    """Get the default QA prompt, compiled once and cached by the prompt registry"""
+    return get_custom_qa_prompt(DEFAULT_PROMPT_NAME)
+
+def __getattr__(name):
+    # For backward compatibility with `from utils_langchain import qa_prompt`
+    if name == "qa_prompt":
+        return get_qa_prompt()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def get_custom_qa_prompt(prompt_name: str = DEFAULT_PROMPT_NAME, layout: str = None):
     """
     Create a custom QA prompt using a specific prompt configuration
     
+    The template is memoized per prompt name and layout, and rebuilt when the prompt file changes.
+    
     Args:
         prompt_name: Name of the prompt file (without .json extension)
+        layout: Prompt assembly mode, one of PROMPT_LAYOUTS. Defaults to PROMPT_LAYOUT.
         
     Returns:
         ChatPromptTemplate with the specified prompt
     """
-    from prompt_loader import get_system_prompt
+    layout = layout or PROMPT_LAYOUT
+    if layout not in _QA_PROMPT_BUILDERS:
+        raise ValueError(f"Unknown prompt layout: {layout}. Available layouts: {', '.join(PROMPT_LAYOUTS)}")
+    return get_compiled_prompt(prompt_name).get_template(f"qa:{layout}", _QA_PROMPT_BUILDERS[layout])
+
+class PromptUsageCallbackHandler(BaseCallbackHandler):
+    """
+    Collect prompt token usage from provider usage metadata for one request
     
-    return ChatPromptTemplate.from_messages([
-        ("system", get_system_prompt(prompt_name)),
-        ("system", "Context: {context}"),
-        MessagesPlaceholder(variable_name="chat_history"),
-        ("human", "{input}")
-    ])
+    Cached prompt tokens are the part of the prompt served from the provider's
+    prompt cache (OpenAI reports them as prompt_tokens_details.cached_tokens).
+    """
+
+    run_inline = True
+
+    def __init__(self):
+        self.calls: List[Dict[str, int]] = []
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        for generations in response.generations:
+            for generation in generations:
+                usage = _extract_usage(generation, response.llm_output)
+                if usage:
+                    self.calls.append(usage)
 
+    def summary(self) -> Dict[str, int]:
+        prompt_tokens = sum(call["prompt_tokens"] for call in self.calls)
+        cached_prompt_tokens = sum(call["cached_prompt_tokens"] for call in self.calls)
+        return {
+            "llm_calls": len(self.calls),
+            "prompt_tokens": prompt_tokens,
+            "cached_prompt_tokens": cached_prompt_tokens,
+            "uncached_prompt_tokens": prompt_tokens - cached_prompt_tokens,
+            "completion_tokens": sum(call["completion_tokens"] for call in self.calls),
+        }
 
+def _extract_usage(generation: Any, llm_output: Optional[Dict[str, Any]]) -> Optional[Dict[str, int]]:
+    # Chat generations carry standardized usage_metadata on the message
+    usage_metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+    if usage_metadata:
+        details = usage_metadata.get("input_token_details") or {}
+        return {
+            "prompt_tokens": usage_metadata.get("input_tokens", 0),
+            "cached_prompt_tokens": details.get("cache_read", 0) or 0,
+            "completion_tokens": usage_metadata.get("output_tokens", 0),
+        }
+    # Fall back to the raw OpenAI token_usage block
+    token_usage = (llm_output or {}).get("token_usage")
+    if token_usage:
+        details = token_usage.get("prompt_tokens_details") or {}
+        return {
+            "prompt_tokens": token_usage.get("prompt_tokens", 0),
+            "cached_prompt_tokens": details.get("cached_tokens", 0) or 0,
+            "completion_tokens": token_usage.get("completion_tokens", 0),
+        }
+    return None
 
-def get_rag_chain(model="gpt-3.5-turbo", prompt_name: str = None):
+
+
+class StageTimingCallbackHandler(BaseCallbackHandler):
+    """
+    Turn LangChain LLM and retriever runs into pipeline stage spans
+
+    LLM runs are named after their "rewrite" or "answer" tag, so tag the models
+    with `with_config(tags=[...])` when building the chain.
+    """
+
+    run_inline = True
+
+    def __init__(self):
+        self._runs: Dict[UUID, Tuple[str, float]] = {}
+
+    def _start(self, run_id: UUID, stage_name: str):
+        self._runs[run_id] = (stage_name, time.perf_counter())
+
+    def _end(self, run_id: UUID):
+        run = self._runs.pop(run_id, None)
+        if run is not None:
+            stage_name, start = run
+            record_span(stage_name, start, time.perf_counter() - start)
+
+    @staticmethod
+    def _llm_stage(tags: Optional[List[str]]) -> str:
+        for tag in tags or []:
+            if tag in ("rewrite", "answer"):
+                return tag
+        return "llm"
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, tags: Optional[List[str]] = None, **kwargs: Any):
+        self._start(run_id, self._llm_stage(tags))
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, tags: Optional[List[str]] = None, **kwargs: Any):
+        self._start(run_id, self._llm_stage(tags))
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id)
+
+    def on_llm_error(self, error, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id)
+
+    def on_retriever_start(self, serialized, query, *, run_id: UUID, **kwargs: Any):
+        self._start(run_id, "retrieve")
+
+    def on_retriever_end(self, documents, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id)
+
+    def on_retriever_error(self, error, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id)
+
+
+
+def get_rag_chain(model="gpt-3.5-turbo", prompt_name: str = None, prompt_layout: str = None,
+                  llm: BaseChatModel = None, retrieval_mode: str = None, knowledge_base: str = None):
     """
     Create a RAG chain with optional custom prompt
     
     Args:
         model: The language model to use
         prompt_name: Optional prompt configuration name. If None, uses default prompt.
+        prompt_layout: Optional prompt assembly mode. If None, uses PROMPT_LAYOUT.
+        llm: Optional chat model instance (e.g. from AIService.get_chat_model). If None, creates ChatOpenAI(model=model).
+        retrieval_mode: Optional retrieval mode, one of RETRIEVAL_MODES. If None, uses RETRIEVAL_MODE.
+        knowledge_base: Optional knowledge base to restrict retrieval to. If None, searches all documents.
         
     Returns:
         RAG chain with the specified configuration
     """
-    llm = ChatOpenAI(model=model)
-    retriever = get_retriever()
-    history_aware_retriever = create_history_aware_retriever(llm, retriever, contextualize_q_prompt)
+    # Heavy imports are deferred until a chain is actually built
+    from langchain_openai import ChatOpenAI
+    from langchain.chains import create_history_aware_retriever, create_retrieval_chain
+    from langchain.chains.combine_documents import create_stuff_documents_chain
+
+    retrieval_mode = retrieval_mode or RETRIEVAL_MODE
+    if retrieval_mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode: {retrieval_mode}. Available modes: {', '.join(RETRIEVAL_MODES)}")
+    if llm is None:
+        llm = ChatOpenAI(model=model)
+    retriever = get_retriever(knowledge_base)
+    # Tags name the LLM calls for StageTimingCallbackHandler
+    create_retriever = (create_speculative_history_aware_retriever if retrieval_mode == "speculative"
+                        else create_history_aware_retriever)
+    history_aware_retriever = create_retriever(
+        llm.with_config(tags=["rewrite"]), retriever, contextualize_q_prompt
+    )
     
     # Use custom prompt if specified, otherwise use default
-    if prompt_name:
-        question_answer_chain = create_stuff_documents_chain(llm, get_custom_qa_prompt(prompt_name))
-    else:
-        question_answer_chain = create_stuff_documents_chain(llm, qa_prompt)
+    question_answer_chain = create_stuff_documents_chain(
+        llm.with_config(tags=["answer"]), get_custom_qa_prompt(prompt_name or DEFAULT_PROMPT_NAME, prompt_layout)
+    )
     
     rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)    
-    return rag_chain
\ No newline at end of file
+    return rag_chain
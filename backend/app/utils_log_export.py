@@ -0,0 +1,155 @@
+"""
+Streaming export of application_logs and per-model, per-day rollups
+
+The export reads the logs with yield_per: rows come from the database cursor
+EXPORT_BATCH_ROWS at a time, as plain column tuples (no ORM objects, no
+identity map), and leave as NDJSON, one JSON object per line, optionally
+zstd-compressed. Memory stays flat whatever the size of the table.
+
+Usage reports read application_log_rollups instead of scanning the logs:
+every insert adds its log to the row of its day and model in the same
+transaction (see utils_db.log_rollup_upsert). Rollups survive delete_old_logs.
+Logs written before rollups existed are backfilled once at startup, when the
+rollups table is created (see database.upgrade_existing_tables).
+
+    python utils_log_export.py export --start 2026-01-01 --end 2026-02-01 --model gpt-4 -o logs.ndjson
+    python utils_log_export.py export --zstd -o logs.ndjson.zst
+    python utils_log_export.py rollups --start 2026-01-01
+    python utils_log_export.py rebuild-rollups
+"""
+import argparse
+import json
+import sys
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+EXPORT_BATCH_ROWS = 1000
+EXPORT_ZSTD_LEVEL = 3
+
+EXPORT_COLUMNS = ("id", "session_id", "model", "created_at", "latency_ms", "user_query", "gpt_response")
+
+
+def iter_log_records(start: Optional[datetime] = None, end: Optional[datetime] = None, model: Optional[str] = None,
+                     session_id: Optional[str] = None, batch_size: int = EXPORT_BATCH_ROWS) -> Iterator[Dict[str, Any]]:
+    """Logs with start <= created_at < end, oldest first, streamed from the database"""
+    from sqlmodel import Session, select
+
+    from database import engine
+    from utils_db import ApplicationLog
+
+    statement = select(*(getattr(ApplicationLog, column) for column in EXPORT_COLUMNS))
+    if start is not None:
+        statement = statement.where(ApplicationLog.created_at >= start)
+    if end is not None:
+        statement = statement.where(ApplicationLog.created_at < end)
+    if model:
+        statement = statement.where(ApplicationLog.model == model)
+    if session_id:
+        statement = statement.where(ApplicationLog.session_id == session_id)
+    statement = statement.order_by(ApplicationLog.created_at, ApplicationLog.id)
+
+    with Session(engine) as session:
+        for row in session.exec(statement.execution_options(yield_per=batch_size)):
+            record = dict(zip(EXPORT_COLUMNS, row))
+            record["created_at"] = record["created_at"].isoformat()
+            yield record
+
+
+def iter_ndjson(records: Iterable[Dict[str, Any]], batch_size: int = EXPORT_BATCH_ROWS) -> Iterator[bytes]:
+    """NDJSON in chunks of batch_size lines (a StreamingResponse hops threads once per chunk, not per line)"""
+    lines = []
+    for record in records:
+        lines.append(json.dumps(record, ensure_ascii=False))
+        if len(lines) >= batch_size:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def iter_zstd(chunks: Iterable[bytes], level: int = EXPORT_ZSTD_LEVEL) -> Iterator[bytes]:
+    """One zstd frame over the chunks, compressed as they come"""
+    import zstandard
+
+    compressor = zstandard.ZstdCompressor(level=level).compressobj()
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_logs(compression: Optional[str] = None, **filters) -> Iterator[bytes]:
+    """The filtered logs as NDJSON bytes, zstd-compressed with compression="zstd" """
+    chunks = iter_ndjson(iter_log_records(**filters))
+    if compression == "zstd":
+        return iter_zstd(chunks)
+    if compression:
+        raise ValueError(f"Unsupported compression: {compression}")
+    return chunks
+
+
+def rollup_to_dict(rollup) -> Dict[str, Any]:
+    """A rollup row with the averages reports need"""
+    return {
+        "day": rollup.day,
+        "model": rollup.model,
+        "requests": rollup.requests,
+        "query_chars": rollup.query_chars,
+        "response_chars": rollup.response_chars,
+        "avg_query_chars": rollup.query_chars / rollup.requests if rollup.requests else 0.0,
+        "avg_response_chars": rollup.response_chars / rollup.requests if rollup.requests else 0.0,
+        "latency_samples": rollup.latency_samples,
+        "avg_latency_ms": rollup.latency_ms_sum / rollup.latency_samples if rollup.latency_samples else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export application logs and query the usage rollups")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="Stream logs as NDJSON")
+    export_parser.add_argument("--start", type=datetime.fromisoformat, help="From this time (inclusive)")
+    export_parser.add_argument("--end", type=datetime.fromisoformat, help="Until this time (exclusive)")
+    export_parser.add_argument("--model")
+    export_parser.add_argument("--session", dest="session_id")
+    export_parser.add_argument("--zstd", action="store_true", help="Compress the output with zstd")
+    export_parser.add_argument("-o", "--output", help="Output file (default: stdout)")
+    rollups_parser = commands.add_parser("rollups", help="Per-model, per-day totals")
+    rollups_parser.add_argument("--start", help="First day, YYYY-MM-DD")
+    rollups_parser.add_argument("--end", help="Last day, YYYY-MM-DD (inclusive)")
+    rollups_parser.add_argument("--model")
+    commands.add_parser("rebuild-rollups", help="Recompute the rollups from the logs")
+    args = parser.parse_args()
+
+    import database
+    import utils_db  # noqa: F401  (registers the tables)
+
+    # SQL echo would end up in the export on stdout
+    database.engine.echo = False
+    database.create_db_and_tables()
+    if args.command == "export":
+        chunks = export_logs("zstd" if args.zstd else None, start=args.start, end=args.end, model=args.model,
+                             session_id=args.session_id)
+        output = open(args.output, "wb") if args.output else sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+        finally:
+            if args.output:
+                output.close()
+    elif args.command == "rollups":
+        from utils_db import get_log_rollups
+
+        print(f"{'day':<12}{'model':<24}{'requests':>10}{'avg query':>11}{'avg answer':>12}{'avg latency':>13}")
+        for rollup in map(rollup_to_dict, get_log_rollups(args.start, args.end, args.model)):
+            latency = f"{rollup['avg_latency_ms']:.0f} ms" if rollup["avg_latency_ms"] is not None else "-"
+            print(f"{rollup['day']:<12}{rollup['model']:<24}{rollup['requests']:>10}"
+                  f"{rollup['avg_query_chars']:>11.0f}{rollup['avg_response_chars']:>12.0f}{latency:>13}")
+    else:
+        from utils_db import rebuild_log_rollups
+
+        print(f"✅ {rebuild_log_rollups()} rollup rows rebuilt")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""
+Memory diagnostics for long-running servers (opt-in, MEMORY_DIAGNOSTICS=1)
+
+With diagnostics on, tracemalloc traces Python allocations from startup
+(MEMORY_TRACE_FRAMES frames per allocation; tracing slows allocation-heavy
+code down noticeably, so it stays off in production) and the app exposes:
+
+- GET /debug/memory: RSS, traced memory, object counts (conversations,
+  compiled prompts, embeddings, Chroma handles, ...) and the memory retained
+  per route; with ?gc=true also the most common live object types
+- POST /debug/memory/snapshots: take a tracemalloc snapshot (the last
+  MEMORY_SNAPSHOTS are kept)
+- GET /debug/memory/snapshots/{first}/diff/{second}: the allocation sites
+  that grew the most between two snapshots
+
+The object counts are also exported on /metrics (infopop_memory_objects).
+Per-route retained memory is the traced memory a request left behind; with
+concurrent requests the attribution is approximate, but a route whose total
+keeps growing is the one to look at.
+
+The same from the command line, against a running server:
+
+    python utils_memory.py status
+    python utils_memory.py snapshot            # prints the snapshot id
+    python utils_memory.py diff 1 2 --limit 20
+
+See benchmarks/soak_memory.py for a soak test that drives synthetic chat
+traffic and fails when RSS keeps growing.
+"""
+import argparse
+import gc
+import linecache
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+from utils_metrics import metrics_registry
+
+MEMORY_DIAGNOSTICS = os.getenv("MEMORY_DIAGNOSTICS", "0") == "1"
+MEMORY_TRACE_FRAMES = int(os.getenv("MEMORY_TRACE_FRAMES", "10"))
+MEMORY_SNAPSHOTS = int(os.getenv("MEMORY_SNAPSHOTS", "8"))
+
+memory_objects = metrics_registry.gauge(
+    "infopop_memory_objects", "Objects held by the process by kind (with MEMORY_DIAGNOSTICS=1)", ("kind",)
+)
+route_retained_bytes = metrics_registry.gauge(
+    "infopop_memory_route_retained_bytes", "Traced memory left behind by requests, summed per route", ("route",)
+)
+process_resident_memory = metrics_registry.gauge(
+    "infopop_process_resident_memory_bytes", "Resident set size of the process"
+)
+
+# Allocations made by tracemalloc itself and by imports are noise in a diff
+_SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+
+def rss_bytes() -> int:
+    """Current resident set size (0 where /proc is not available)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def _loaded(module_name: str):
+    """A module if something already imported it; counting must not import heavy modules"""
+    return sys.modules.get(module_name)
+
+
+def _vector_store_counts() -> Dict[str, int]:
+    counts = {"embedding_rows": 0, "chroma_collections": 0, "chroma_systems": 0}
+    utils_chroma = _loaded("utils_chroma")
+    if utils_chroma is not None:
+        for store in (utils_chroma._vector_store, utils_chroma._document_index):
+            # NumpyVectorStore keeps ids and metadata of every row in memory, vectors are mapped
+            counts["embedding_rows"] += getattr(store, "count", 0) or 0
+        if utils_chroma._vector_store is not None and utils_chroma.VECTOR_BACKEND == "chroma":
+            from utils_vector_index import iter_collection_stores
+            counts["chroma_collections"] = len(iter_collection_stores(utils_chroma._vector_store))
+    shared_system_client = _loaded("chromadb.api.shared_system_client")
+    if shared_system_client is not None:
+        counts["chroma_systems"] = len(shared_system_client.SharedSystemClient._identifier_to_system)
+    return counts
+
+
+def _cache_counts() -> Dict[str, int]:
+    counts = {}
+    prompt_loader = _loaded("prompt_loader")
+    if prompt_loader is not None:
+        counts["compiled_prompts"] = len(prompt_loader.prompt_registry)
+    utils_shared_state = _loaded("utils_shared_state")
+    if utils_shared_state is not None:
+        counts["shared_cache_entries"] = len(getattr(utils_shared_state.shared_cache, "_entries", ()))
+    utils_langchain = _loaded("utils_langchain")
+    if utils_langchain is not None:
+        counts["in_flight_calls"] = sum(len(flight) for flight in (
+            utils_langchain.query_embedding_flight, utils_langchain.vector_search_flight,
+            utils_langchain.answer_flight
+        ))
+        counts["pending_query_embeddings"] = len(utils_langchain.query_embedding_batcher._pending)
+    return counts
+
+
+class MemoryDiagnostics:
+    """
+    Object counts, tracemalloc snapshots and per-route retained memory
+
+    Other modules add their own object counts with register_count (e.g. main
+    registers the conversation history).
+    """
+
+    def __init__(self, enabled: bool = MEMORY_DIAGNOSTICS, max_snapshots: int = MEMORY_SNAPSHOTS):
+        self.enabled = enabled
+        self.max_snapshots = max_snapshots
+        self._counters: Dict[str, Callable[[], int]] = {}
+        self._snapshots: Dict[int, Dict[str, Any]] = {}
+        self._next_snapshot_id = 1
+        self._routes: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self.enabled and not tracemalloc.is_tracing():
+            tracemalloc.start(MEMORY_TRACE_FRAMES)
+
+    def register_count(self, kind: str, count: Callable[[], int]):
+        self._counters[kind] = count
+
+    def object_counts(self) -> Dict[str, int]:
+        """Current object counts by kind; also updates the infopop_memory_objects gauge"""
+        counts = {kind: count() for kind, count in self._counters.items()}
+        counts.update(_cache_counts())
+        counts.update(_vector_store_counts())
+        for kind, value in counts.items():
+            memory_objects.set(value, kind=kind)
+        process_resident_memory.set(rss_bytes())
+        return counts
+
+    @staticmethod
+    def traced_memory() -> int:
+        return tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+
+    def record_request(self, route: str, retained: int):
+        """Add the traced memory a request left behind to its route"""
+        with self._lock:
+            totals = self._routes.setdefault(route, {"requests": 0, "retained_bytes": 0})
+            totals["requests"] += 1
+            totals["retained_bytes"] += retained
+        route_retained_bytes.inc(retained, route=route)
+
+    def routes(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {route: dict(totals) for route, totals in
+                    sorted(self._routes.items(), key=lambda item: -item[1]["retained_bytes"])}
+
+    @staticmethod
+    def most_common_types(limit: int = 20) -> Dict[str, int]:
+        """Live objects tracked by the garbage collector, by type (walks the whole heap)"""
+        gc.collect()
+        return dict(Counter(type(obj).__qualname__ for obj in gc.get_objects()).most_common(limit))
+
+    def status(self, include_gc: bool = False) -> Dict[str, Any]:
+        current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        status = {
+            "rss_bytes": rss_bytes(),
+            "tracing": tracemalloc.is_tracing(),
+            "traced_bytes": current,
+            "traced_peak_bytes": peak,
+            "objects": self.object_counts(),
+            "routes": self.routes(),
+            "snapshots": [{"id": snapshot_id, "taken_at": snapshot["taken_at"], "rss_bytes": snapshot["rss_bytes"]}
+                          for snapshot_id, snapshot in self._snapshots.items()],
+        }
+        if include_gc:
+            status["types"] = self.most_common_types()
+        return status
+
+    def take_snapshot(self) -> Dict[str, Any]:
+        """Take a tracemalloc snapshot; the oldest one is dropped beyond max_snapshots"""
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not tracing; start the server with MEMORY_DIAGNOSTICS=1")
+        snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        with self._lock:
+            snapshot_id = self._next_snapshot_id
+            self._next_snapshot_id += 1
+            self._snapshots[snapshot_id] = {"snapshot": snapshot, "taken_at": time.time(), "rss_bytes": rss_bytes()}
+            while len(self._snapshots) > self.max_snapshots:
+                self._snapshots.pop(next(iter(self._snapshots)))
+        return {"id": snapshot_id, "taken_at": self._snapshots[snapshot_id]["taken_at"],
+                "rss_bytes": self._snapshots[snapshot_id]["rss_bytes"],
+                "traced_bytes": sum(stat.size for stat in snapshot.statistics("filename"))}
+
+    def diff(self, first: int, second: int, limit: int = 20, key_type: str = "lineno") -> Dict[str, Any]:
+        """The allocation sites that grew the most from snapshot `first` to `second`"""
+        if first not in self._snapshots or second not in self._snapshots:
+            raise KeyError(f"Unknown snapshot; available: {sorted(self._snapshots)}")
+        older, newer = self._snapshots[first], self._snapshots[second]
+        stats = newer["snapshot"].compare_to(older["snapshot"], key_type)
+        return {
+            "first": first,
+            "second": second,
+            "seconds": newer["taken_at"] - older["taken_at"],
+            "rss_growth_bytes": newer["rss_bytes"] - older["rss_bytes"],
+            "traced_growth_bytes": sum(stat.size_diff for stat in stats),
+            "top": [_format_stat(stat) for stat in stats[:limit]],
+        }
+
+
+def _format_stat(stat: tracemalloc.StatisticDiff) -> Dict[str, Any]:
+    frame = stat.traceback[0]
+    return {
+        "location": f"{frame.filename}:{frame.lineno}",
+        "code": linecache.getline(frame.filename, frame.lineno).strip(),
+        "size_diff_bytes": stat.size_diff,
+        "count_diff": stat.count_diff,
+        "size_bytes": stat.size,
+        "count": stat.count,
+    }
+
+
+# Global diagnostics; tracing starts as soon as this module is imported
+memory_diagnostics = MemoryDiagnostics()
+memory_diagnostics.start()
+
+
+# Command-line client for a running server
+
+def _format_bytes(value: float) -> str:
+    return f"{value / 1024 ** 2:+.2f} MB" if abs(value) >= 1024 ** 2 else f"{value / 1024:+.1f} KB"
+
+
+def main():
+    import httpx
+
+    parser = argparse.ArgumentParser(description="Memory diagnostics of a running server (MEMORY_DIAGNOSTICS=1)")
+    parser.add_argument("--url", default=os.getenv("INFOPOP_URL", "http://127.0.0.1:8001"))
+    commands = parser.add_subparsers(dest="command", required=True)
+    status_parser = commands.add_parser("status", help="RSS, object counts and retained memory per route")
+    status_parser.add_argument("--gc", action="store_true", help="Also count live objects by type (slow)")
+    commands.add_parser("snapshot", help="Take a tracemalloc snapshot")
+    diff_parser = commands.add_parser("diff", help="Top allocation growth between two snapshots")
+    diff_parser.add_argument("first", type=int)
+    diff_parser.add_argument("second", type=int)
+    diff_parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    with httpx.Client(base_url=args.url, timeout=300) as client:
+        if args.command == "status":
+            response = client.get("/debug/memory", params={"gc": str(args.gc).lower()})
+        elif args.command == "snapshot":
+            response = client.post("/debug/memory/snapshots")
+        else:
+            response = client.get(f"/debug/memory/snapshots/{args.first}/diff/{args.second}",
+                                  params={"limit": args.limit})
+        if response.status_code != 200:
+            print(f"❌ {response.status_code}: {response.text}")
+            sys.exit(1)
+        result = response.json()
+
+    if args.command == "status":
+        print(f"RSS {result['rss_bytes'] / 1024 ** 2:.1f} MB, traced {result['traced_bytes'] / 1024 ** 2:.1f} MB "
+              f"(peak {result['traced_peak_bytes'] / 1024 ** 2:.1f} MB)")
+        for kind, value in result["objects"].items():
+            print(f"   {kind:<26} {value}")
+        for route, totals in result["routes"].items():
+            print(f"   {route:<40} {totals['requests']:>7} requests  {_format_bytes(totals['retained_bytes'])}")
+        for type_name, count in result.get("types", {}).items():
+            print(f"   {type_name:<40} {count}")
+    elif args.command == "snapshot":
+        print(f"📸 Snapshot {result['id']}: RSS {result['rss_bytes'] / 1024 ** 2:.1f} MB, "
+              f"traced {result['traced_bytes'] / 1024 ** 2:.1f} MB")
+    else:
+        print(f"Snapshots {result['first']} → {result['second']} ({result['seconds']:.0f}s): "
+              f"RSS {_format_bytes(result['rss_growth_bytes'])}, traced {_format_bytes(result['traced_growth_bytes'])}")
+        for stat in result["top"]:
+            print(f"   {_format_bytes(stat['size_diff_bytes']):>12} {stat['count_diff']:+8d}  {stat['location']}")
+            if stat["code"]:
+                print(f"   {'':>21}  {stat['code']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Minimal in-process metrics with Prometheus text exposition, so /metrics works
+# without an extra dependency
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: Optional[Dict[str, str]] = None) -> str:
+    pairs = list(zip(names, values)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in pairs) + "}"
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    metric_type = "untyped"
+
+    def __init__(self, name: str, description: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.metric_type}"]
+        lines.extend(self._render_samples())
+        return lines
+
+    def _render_samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    metric_type = "counter"
+
+    def __init__(self, name: str, description: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, description, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _render_samples(self) -> List[str]:
+        # Copied under the lock: ingestion threads may add label sets during a scrape
+        with self._lock:
+            values = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(values)
+        ]
+
+
+class Gauge(_Metric):
+    metric_type = "gauge"
+
+    def __init__(self, name: str, description: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, description, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(values)
+        ]
+
+
+class Histogram(_Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name: str, description: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, description, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> (per-bucket counts incl. +Inf, sum, count)
+        self._values: Dict[LabelValues, List[Any]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def get_count(self, **labels) -> int:
+        entry = self._values.get(self._key(labels))
+        return entry[2] if entry else 0
+
+    def get_sum(self, **labels) -> float:
+        entry = self._values.get(self._key(labels))
+        return entry[1] if entry else 0.0
+
+    def _render_samples(self) -> List[str]:
+        # Copied under the lock, so a row is never read half-updated by observe()
+        with self._lock:
+            values = [(key, (list(bucket_counts), total, count))
+                      for key, (bucket_counts, total, count) in self._values.items()]
+        lines = []
+        for key, (bucket_counts, total, count) in sorted(values):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), bucket_counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, {"le": _format_value(bound)})
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, description: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, description, labelnames))
+
+    def gauge(self, name: str, description: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, description, labelnames))
+
+    def histogram(self, name: str, description: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, description, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Global metrics registry
+metrics_registry = MetricsRegistry()
+
+http_request_duration = metrics_registry.histogram(
+    "infopop_http_request_duration_seconds", "HTTP request latency", ("method", "route", "status")
+)
+chat_stage_duration = metrics_registry.histogram(
+    "infopop_chat_stage_duration_seconds", "Latency of each /chat pipeline stage", ("stage",)
+)
+llm_tokens = metrics_registry.counter(
+    "infopop_llm_tokens_total", "LLM tokens by kind (prompt, cached_prompt, completion)", ("model", "kind")
+)
+cache_requests = metrics_registry.counter(
+    "infopop_cache_requests_total", "Cache lookups by cache and result (hit, miss)", ("cache", "result")
+)
+ingest_items = metrics_registry.counter(
+    "infopop_ingest_items_total", "Ingested items by kind (files, pages, chunks, embeddings)", ("kind",)
+)
+ingest_stage_duration = metrics_registry.histogram(
+    "infopop_ingest_stage_duration_seconds", "Latency of each ingestion stage", ("stage",)
+)
+ingest_throughput = metrics_registry.gauge(
+    "infopop_ingest_throughput_per_second", "Throughput of the most recent ingestion", ("kind",)
+)
+speculative_retrieval_saved = metrics_registry.histogram(
+    "infopop_speculative_retrieval_saved_seconds",
+    "Latency saved by speculative retrieval per request by result (hit, miss); negative when it cost time",
+    ("result",), buckets=(-0.1, -0.01, 0.0, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+)
+embedding_batch_size = metrics_registry.histogram(
+    "infopop_embedding_batch_size", "Distinct texts per micro-batched query embedding call",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+model_up = metrics_registry.gauge(
+    "infopop_model_up", "1 if the last background probe of the model succeeded, else 0", ("model",)
+)
+model_probe_latency = metrics_registry.gauge(
+    "infopop_model_probe_latency_seconds", "Latency of the last background probe of the model", ("model",)
+)
+
+
+def record_ingest(pages: int, chunks: int, embeddings: int, stage_seconds: Dict[str, float]):
+    """Record one document ingestion: counters, per-stage latency and throughput"""
+    ingest_items.inc(kind="files")
+    ingest_items.inc(pages, kind="pages")
+    ingest_items.inc(chunks, kind="chunks")
+    ingest_items.inc(embeddings, kind="embeddings")
+    for stage_name, seconds in stage_seconds.items():
+        ingest_stage_duration.observe(seconds, stage=stage_name)
+    total = sum(stage_seconds.values())
+    if total > 0:
+        ingest_throughput.set(pages / total, kind="pages")
+        ingest_throughput.set(chunks / total, kind="chunks")
+        ingest_throughput.set(embeddings / total, kind="embeddings")
+
+
+def record_token_usage(model: str, usage: Dict[str, int]):
+    """Record the PromptUsageCallbackHandler summary of one request"""
+    llm_tokens.inc(usage.get("uncached_prompt_tokens", 0), model=model, kind="prompt")
+    llm_tokens.inc(usage.get("cached_prompt_tokens", 0), model=model, kind="cached_prompt")
+    llm_tokens.inc(usage.get("completion_tokens", 0), model=model, kind="completion")
+
+
+class RequestTrace:
+    """Spans recorded for one request, in start order"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: List[Dict[str, float]] = []
+        self._lock = threading.Lock()
+
+    def add_span(self, stage_name: str, start: float, duration: float):
+        with self._lock:
+            self.spans.append({
+                "stage": stage_name,
+                "start_ms": (start - self.started) * 1000,
+                "duration_ms": duration * 1000,
+            })
+
+    def timings_ms(self) -> Dict[str, float]:
+        """Total milliseconds per stage, plus the request total"""
+        timings: Dict[str, float] = {}
+        for span in self.spans:
+            timings[span["stage"]] = timings.get(span["stage"], 0.0) + span["duration_ms"]
+        # The retriever span includes the query embedding; derive the search
+        # time unless the retriever recorded it itself
+        if "retrieve" in timings and "vector_search" not in timings:
+            timings["vector_search"] = max(timings["retrieve"] - timings.get("embed_query", 0.0), 0.0)
+        timings["total"] = (time.perf_counter() - self.started) * 1000
+        return {name: round(value, 3) for name, value in timings.items()}
+
+
+_current_trace: contextvars.ContextVar[Optional[RequestTrace]] = contextvars.ContextVar(
+    "infopop_request_trace", default=None
+)
+
+
+@contextmanager
+def start_trace() -> Iterator[RequestTrace]:
+    """Start collecting spans for the current request"""
+    trace = RequestTrace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        chat_stage_duration.observe(time.perf_counter() - trace.started, stage="total")
+
+
+def get_current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+def record_span(stage_name: str, start: float, duration: float):
+    """Record a finished stage in the stage histogram and the current trace, if any"""
+    chat_stage_duration.observe(duration, stage=stage_name)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_span(stage_name, start, duration)
+
+
+@contextmanager
+def stage(stage_name: str) -> Iterator[None]:
+    """Time a block of code as a pipeline stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(stage_name, start, time.perf_counter() - start)
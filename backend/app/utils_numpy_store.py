@@ -0,0 +1,486 @@
+"""
+Pure-NumPy vector store for the desktop build and small-to-medium corpora
+
+Layout of the index directory:
+
+    meta.json       dimension, dtype, rescoring flag and committed row count
+    vectors.npy     unit-length embeddings in the index dtype (see
+                    utils_embedding_codec), memory-mapped, grown by doubling
+    scales.npy      per-row dequantization scale (int8 only)
+    rescore.npy     float32 copy for rescoring (quantized dtypes with rescoring)
+    deleted.npy     tombstones, one bool per row
+    records.jsonl   one {"id", "metadata", "text"} line per row, in row order
+
+Search is one matrix-vector product (Hamming distance for binary codes) over
+the memory-mapped rows followed by `argpartition`; metadata filters and
+tombstones are boolean masks over the rows. With a quantized dtype and
+rescoring, the compact codes select k * NUMPY_INDEX_OVERSAMPLE candidates that
+are then ranked exactly with their float32 rows, so only the codes need to
+stay in RAM. Deletes only set tombstones, and the index is compacted once more
+than NUMPY_INDEX_COMPACT_RATIO of the rows are dead.
+"""
+import json
+import os
+import shutil
+import threading
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from utils_embedding_codec import DTYPES, code_dtype, code_width, coarse_scores, normalize, quantize
+
+NUMPY_INDEX_DTYPE = os.getenv("NUMPY_INDEX_DTYPE", "float32")
+NUMPY_INDEX_RESCORE = os.getenv("NUMPY_INDEX_RESCORE", "1") == "1"
+NUMPY_INDEX_OVERSAMPLE = int(os.getenv("NUMPY_INDEX_OVERSAMPLE", "10"))
+NUMPY_INDEX_COMPACT_RATIO = float(os.getenv("NUMPY_INDEX_COMPACT_RATIO", "0.2"))
+
+INDEX_DTYPES = DTYPES
+MIN_CAPACITY = 1024
+# Filters keeping less than this share of the rows only score the rows they keep
+SELECTIVE_FILTER_RATIO = 0.25
+
+
+def _matches(column: np.ndarray, condition: Any) -> np.ndarray:
+    """Boolean mask of the rows of a metadata column matching a Chroma-style condition"""
+    if not isinstance(condition, dict):
+        condition = {"$eq": condition}
+    mask = np.ones(len(column), dtype=bool)
+    for operator, value in condition.items():
+        if operator == "$eq":
+            mask &= column == value
+        elif operator == "$ne":
+            mask &= column != value
+        elif operator in ("$in", "$nin"):
+            values = set(value)
+            found = np.fromiter((item in values for item in column), dtype=bool, count=len(column))
+            mask &= found if operator == "$in" else ~found
+        elif operator in ("$gt", "$gte", "$lt", "$lte"):
+            compare = {
+                "$gt": lambda item: item > value, "$gte": lambda item: item >= value,
+                "$lt": lambda item: item < value, "$lte": lambda item: item <= value,
+            }[operator]
+            mask &= np.fromiter(
+                (item is not None and compare(item) for item in column), dtype=bool, count=len(column)
+            )
+        else:
+            raise ValueError(f"Unsupported filter operator: {operator}")
+    return mask
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    Memory-mapped vector store with exact top-k search
+
+    Scores are L2 distances between unit vectors (2 - 2 * cosine), so lower is
+    more similar, like the default Chroma collection.
+    """
+
+    def __init__(self, directory: str, embedding: Optional[Embeddings] = None, dtype: str = NUMPY_INDEX_DTYPE,
+                 rescore: bool = NUMPY_INDEX_RESCORE):
+        """dtype and rescore only apply to a new index; an existing one keeps its own"""
+        if dtype not in INDEX_DTYPES:
+            raise ValueError(f"Unknown index dtype: {dtype}. Available dtypes: {', '.join(INDEX_DTYPES)}")
+        self.directory = os.path.abspath(directory)
+        self._embedding = embedding
+        self._lock = threading.RLock()
+        self._recover()
+        self._load(dtype, rescore and dtype != "float32")
+
+    # Persistence
+
+    def _path(self, name: str, directory: Optional[str] = None) -> str:
+        return os.path.join(directory or self.directory, name)
+
+    def _recover(self):
+        """Finish a compaction that stopped between swapping the directories"""
+        temp_dir = f"{self.directory}.compact"
+        if not os.path.exists(self.directory) and os.path.exists(self._path("meta.json", temp_dir)):
+            os.replace(temp_dir, self.directory)
+        shutil.rmtree(f"{self.directory}.old", ignore_errors=True)
+
+    def _load(self, dtype: str, rescore: bool):
+        try:
+            with open(self._path("meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            meta = {"dimension": None, "dtype": dtype, "rescore": rescore, "count": 0}
+        self.dimension: Optional[int] = meta["dimension"]
+        self.dtype: str = meta["dtype"]
+        self.rescore: bool = meta.get("rescore", False)
+        self.count: int = meta["count"]
+
+        self._arrays: Dict[str, np.ndarray] = {}
+        if self.dimension is not None:
+            self._open_arrays()
+        try:
+            self._deleted = np.load(self._path("deleted.npy"))[:self.count]
+        except FileNotFoundError:
+            self._deleted = np.zeros(0, dtype=bool)
+        if len(self._deleted) < self.count:
+            self._deleted = np.concatenate([self._deleted, np.zeros(self.count - len(self._deleted), dtype=bool)])
+
+        # Texts stay on disk; only ids, metadata and line offsets are kept in memory
+        self._ids: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        offsets = []
+        # Records past the committed count (an interrupted add) are ignored here
+        # and overwritten by the next add, which holds the writer lock
+        self._records_end = 0
+        records_path = self._path("records.jsonl")
+        if os.path.exists(records_path):
+            with open(records_path, "rb") as f:
+                while len(self._ids) < self.count:
+                    offset = f.tell()
+                    line = f.readline()
+                    if not line:
+                        break
+                    record = json.loads(line)
+                    offsets.append(offset)
+                    self._ids.append(record["id"])
+                    self._metadatas.append(record["metadata"])
+                self._records_end = f.tell()
+        self._offsets = np.array(offsets, dtype=np.int64)
+        self._rows = {record_id: row for row, record_id in enumerate(self._ids) if not self._deleted[row]}
+        self._columns: Dict[str, np.ndarray] = {}
+        self._postings: Dict[str, Dict[Any, np.ndarray]] = {}
+
+    def _write_meta(self, directory: Optional[str] = None, count: Optional[int] = None):
+        path = self._path("meta.json", directory)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({"dimension": self.dimension, "dtype": self.dtype, "rescore": self.rescore,
+                       "count": self.count if count is None else count}, f)
+        os.replace(f"{path}.tmp", path)
+
+    def _save_deleted(self, directory: Optional[str] = None, deleted: Optional[np.ndarray] = None):
+        path = self._path("deleted.npy", directory)
+        with open(f"{path}.tmp", "wb") as f:
+            np.save(f, self._deleted if deleted is None else deleted)
+        os.replace(f"{path}.tmp", path)
+
+    def _array_specs(self) -> List[Tuple[str, np.dtype, Tuple[int, ...]]]:
+        """(name, dtype, row shape) of the per-row arrays of this index"""
+        specs = [("vectors", code_dtype(self.dtype), (code_width(self.dtype, self.dimension),))]
+        if self.dtype == "int8":
+            specs.append(("scales", np.dtype(np.float32), ()))
+        if self.rescore:
+            specs.append(("rescore", np.dtype(np.float32), (self.dimension,)))
+        return specs
+
+    def _open_arrays(self):
+        self._arrays = {
+            name: np.load(self._path(f"{name}.npy"), mmap_mode="r+") for name, _, _ in self._array_specs()
+        }
+
+    def _write_arrays(self, directory: str, capacity: int, rows: Optional[np.ndarray] = None):
+        """Write new array files with the given capacity, copying `rows` (default: all rows) first"""
+        for name, dtype, row_shape in self._array_specs():
+            array = np.lib.format.open_memmap(
+                self._path(f"{name}.npy", directory), mode="w+", dtype=dtype, shape=(capacity,) + row_shape
+            )
+            if name in self._arrays:
+                source = self._arrays[name]
+                if rows is None:
+                    array[:self.count] = source[:self.count]
+                else:
+                    array[:len(rows)] = source[rows]
+            array.flush()
+            # Close every map before the files are replaced (required on Windows)
+            del array
+
+    def _ensure_capacity(self, rows: int):
+        capacity = len(self._arrays["vectors"]) if self._arrays else 0
+        if self.count + rows <= capacity:
+            return
+        temp_dir = f"{self.directory}.grow"
+        os.makedirs(temp_dir, exist_ok=True)
+        self._write_arrays(temp_dir, max(MIN_CAPACITY, capacity * 2, self.count + rows))
+        self._arrays = {}
+        for name, _, _ in self._array_specs():
+            os.replace(self._path(f"{name}.npy", temp_dir), self._path(f"{name}.npy"))
+        os.rmdir(temp_dir)
+        self._open_arrays()
+
+    # Writes
+
+    def add_embeddings(self, embeddings: List[List[float]], texts: List[str],
+                       metadatas: Optional[List[Dict[str, Any]]] = None, ids: Optional[List[str]] = None) -> List[str]:
+        """Add precomputed embeddings; existing ids are replaced"""
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+        vectors = normalize(embeddings)
+
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            if self.dimension is None:
+                self.dimension = vectors.shape[1]
+            elif vectors.shape[1] != self.dimension:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the index ({self.dimension})")
+
+            replaced = [self._rows[record_id] for record_id in ids if record_id in self._rows]
+            self._ensure_capacity(len(texts))
+            start, end = self.count, self.count + len(texts)
+            codes, scales = quantize(vectors, self.dtype)
+            self._arrays["vectors"][start:end] = codes
+            if scales is not None:
+                self._arrays["scales"][start:end] = scales
+            if self.rescore:
+                self._arrays["rescore"][start:end] = vectors
+            for array in self._arrays.values():
+                array.flush()
+
+            offsets = []
+            records_path = self._path("records.jsonl")
+            with open(records_path, "r+b" if os.path.exists(records_path) else "wb") as f:
+                f.seek(self._records_end)
+                f.truncate()
+                for record_id, text, metadata in zip(ids, texts, metadatas):
+                    offsets.append(f.tell())
+                    line = json.dumps({"id": record_id, "metadata": metadata, "text": text}, ensure_ascii=False)
+                    f.write(line.encode("utf-8") + b"\n")
+                records_end = f.tell()
+
+            # The new rows become visible once meta.json records the new count
+            self._deleted = np.concatenate([self._deleted, np.zeros(len(texts), dtype=bool)])
+            self._deleted[replaced] = True
+            self._save_deleted()
+            self.count = end
+            self._write_meta()
+            self._records_end = records_end
+
+            self._offsets = np.concatenate([self._offsets, np.array(offsets, dtype=np.int64)])
+            self._ids.extend(ids)
+            self._metadatas.extend(dict(metadata) for metadata in metadatas)
+            for row, record_id in enumerate(ids, start):
+                self._rows[record_id] = row
+            self._columns = {}
+            self._postings = {}
+        return ids
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        return self.add_embeddings(self._embedding.embed_documents(texts), texts, metadatas, ids)
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+        """Tombstone rows by id and/or metadata filter, compacting when enough rows are dead"""
+        with self._lock:
+            rows = [self._rows[record_id] for record_id in ids or [] if record_id in self._rows]
+            if where:
+                rows.extend(np.flatnonzero(self._mask(where) & ~self._deleted).tolist())
+            if not rows:
+                return
+            self._deleted[rows] = True
+            for row in rows:
+                self._rows.pop(self._ids[row], None)
+            self._save_deleted()
+            if self.count >= MIN_CAPACITY and self._deleted.sum() > NUMPY_INDEX_COMPACT_RATIO * self.count:
+                self.compact()
+
+    def compact(self) -> int:
+        """Rewrite the index without tombstoned rows; returns the number of live rows"""
+        with self._lock:
+            if not self.count:
+                return 0
+            live = np.flatnonzero(~self._deleted)
+            temp_dir = f"{self.directory}.compact"
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            os.makedirs(temp_dir)
+            os.makedirs(self.directory, exist_ok=True)
+            if self.dimension is not None:
+                self._write_arrays(temp_dir, max(MIN_CAPACITY, len(live)), live)
+            with open(self._path("records.jsonl"), "rb") as source, \
+                    open(self._path("records.jsonl", temp_dir), "wb") as target:
+                for row in live:
+                    source.seek(self._offsets[row])
+                    target.write(source.readline())
+            self._save_deleted(temp_dir, np.zeros(len(live), dtype=bool))
+            self._write_meta(temp_dir, count=len(live))
+
+            # Swap directories; _recover finishes the swap if we stop in between
+            self._arrays = {}
+            os.replace(self.directory, f"{self.directory}.old")
+            os.replace(temp_dir, self.directory)
+            shutil.rmtree(f"{self.directory}.old", ignore_errors=True)
+            self._load(self.dtype, self.rescore)
+            return self.count
+
+    # Reads
+
+    def _column(self, key: str) -> np.ndarray:
+        column = self._columns.get(key)
+        if column is None:
+            column = np.empty(len(self._metadatas), dtype=object)
+            column[:] = [metadata.get(key) for metadata in self._metadatas]
+            self._columns[key] = column
+        return column
+
+    def _posting_lists(self, key: str) -> Optional[Dict[Any, np.ndarray]]:
+        """Rows by value of a metadata field, or None if some value is unhashable"""
+        postings = self._postings.get(key)
+        if postings is None:
+            rows: Dict[Any, List[int]] = {}
+            try:
+                for row, value in enumerate(self._column(key)):
+                    rows.setdefault(value, []).append(row)
+            except TypeError:
+                return None
+            postings = self._postings[key] = {value: np.asarray(r, dtype=np.int64) for value, r in rows.items()}
+        return postings
+
+    def _mask(self, where: Dict[str, Any]) -> np.ndarray:
+        """Boolean mask for a Chroma-style where filter ($and / $or and field conditions)"""
+        mask = np.ones(self.count, dtype=bool)
+        for key, condition in where.items():
+            if key == "$and":
+                for clause in condition:
+                    mask &= self._mask(clause)
+            elif key == "$or":
+                mask &= np.logical_or.reduce([self._mask(clause) for clause in condition])
+            elif isinstance(condition, dict) and list(condition) == ["$in"] and self._posting_lists(key) is not None:
+                # Cost in matching rows, not all rows (e.g. the file_ids of two-level retrieval)
+                postings = self._posting_lists(key)
+                found = np.zeros(self.count, dtype=bool)
+                for value in condition["$in"]:
+                    found[postings.get(value, [])] = True
+                mask &= found
+            else:
+                mask &= _matches(self._column(key), condition)
+        return mask
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+        """Indices of the k highest scores, best first"""
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        return top[np.argsort(-scores[top], kind="stable")]
+
+    def _read_texts(self, rows: np.ndarray) -> List[str]:
+        texts = []
+        if not len(rows):
+            return texts
+        with open(self._path("records.jsonl"), "rb") as f:
+            for row in rows:
+                f.seek(self._offsets[row])
+                record = json.loads(f.readline())
+                if record["id"] != self._ids[row]:
+                    # Compacted by another process since this store was loaded
+                    raise RuntimeError("The vector index changed on disk, please retry")
+                texts.append(record["text"])
+        return texts
+
+    def similarity_search_by_vector_with_relevance_scores(
+        self, embedding: List[float], k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        """Top-k by (rescored) similarity; scores are L2 distances between unit vectors, lower is more similar"""
+        with self._lock:
+            count = self.count
+            if not count or self.dimension is None:
+                return []
+            query = normalize(embedding)
+            excluded = self._deleted[:count].copy()
+            if filter:
+                excluded |= ~self._mask(filter)
+            candidates = count - int(excluded.sum())
+            if filter and candidates < SELECTIVE_FILTER_RATIO * count:
+                # e.g. the chunks of a few documents (two-level retrieval): score only those rows
+                rows = np.flatnonzero(~excluded)
+                scores = np.full(count, -np.inf, dtype=np.float32)
+                scores[rows] = coarse_scores(self._arrays["vectors"][rows], query, self.dtype,
+                                             self._arrays["scales"][rows] if "scales" in self._arrays else None)
+            else:
+                scores = coarse_scores(self._arrays["vectors"][:count], query, self.dtype,
+                                       self._arrays["scales"][:count] if "scales" in self._arrays else None)
+                scores[excluded] = -np.inf
+
+            k = min(k, candidates)
+            if k <= 0:
+                return []
+            if self.rescore:
+                # Coarse candidates from the codes, then exact scores from their float32 rows
+                shortlist = np.sort(self._top_k(scores, min(k * NUMPY_INDEX_OVERSAMPLE, candidates)))
+                exact = self._arrays["rescore"][shortlist] @ query
+                top = shortlist[self._top_k(exact, k)]
+                scores = np.full(count, -np.inf, dtype=np.float32)
+                scores[shortlist] = exact
+            else:
+                top = self._top_k(scores, k)
+            texts = self._read_texts(top)
+            return [
+                (Document(page_content=text, metadata=dict(self._metadatas[row]), id=self._ids[row]),
+                 max(0.0, float(2 - 2 * scores[row])))
+                for row, text in zip(top, texts)
+            ]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4,
+                                    filter: Optional[Dict[str, Any]] = None, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_relevance_scores(embedding, k, filter)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4,
+                                     filter: Optional[Dict[str, Any]] = None, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_relevance_scores(self._embedding.embed_query(query), k, filter)
+
+    def similarity_search(self, query: str, k: int = 4,
+                          filter: Optional[Dict[str, Any]] = None, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+            **kwargs: Any) -> Dict[str, List[Any]]:
+        """Live records by id and/or filter, in the shape of Chroma's get()"""
+        with self._lock:
+            mask = ~self._deleted[:self.count]
+            if where:
+                mask &= self._mask(where)
+            if ids is not None:
+                wanted = np.zeros(self.count, dtype=bool)
+                wanted[[self._rows[record_id] for record_id in ids if record_id in self._rows]] = True
+                mask &= wanted
+            rows = np.flatnonzero(mask)
+            return {
+                "ids": [self._ids[row] for row in rows],
+                "documents": self._read_texts(rows),
+                "metadatas": [dict(self._metadatas[row]) for row in rows],
+            }
+
+    def live_count(self) -> int:
+        return len(self._rows)
+
+    def memory_footprint(self) -> Dict[str, int]:
+        """Bytes per committed row set that searches touch: codes (resident) and rescoring rows (paged in)"""
+        sizes = {name: int(array[:self.count].nbytes) for name, array in self._arrays.items()}
+        return {
+            "resident_bytes": sizes.get("vectors", 0) + sizes.get("scales", 0),
+            "rescore_bytes": sizes.get("rescore", 0),
+        }
+
+    def export_rows(self) -> Tuple[List[str], np.ndarray, List[str], List[Dict[str, Any]]]:
+        """Live (ids, float32 vectors, texts, metadatas), e.g. to convert the index to another dtype"""
+        from utils_embedding_codec import dequantize
+
+        with self._lock:
+            rows = np.flatnonzero(~self._deleted[:self.count])
+            if self.dtype == "float32" or self.rescore:
+                source = self._arrays["vectors" if self.dtype == "float32" else "rescore"]
+                vectors = np.asarray(source[rows], dtype=np.float32)
+            else:
+                scales = self._arrays["scales"][rows] if "scales" in self._arrays else None
+                vectors = dequantize(self._arrays["vectors"][rows], self.dtype, self.dimension, scales)
+            return ([self._ids[row] for row in rows], vectors, self._read_texts(rows),
+                    [dict(self._metadatas[row]) for row in rows])
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self._embedding
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   directory: Optional[str] = None, **kwargs: Any) -> "NumpyVectorStore":
+        if directory is None:
+            raise ValueError("NumpyVectorStore.from_texts needs a directory")
+        store = cls(directory, embedding)
+        store.add_texts(texts, metadatas, ids=kwargs.get("ids"))
+        return store
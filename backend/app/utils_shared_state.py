@@ -0,0 +1,233 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from models_pydantic import ChatMessage
+
+# Multi-worker mode: every uvicorn worker is a separate process, so state that
+# must be shared between workers (conversations, caches) lives in SQLite, and
+# the Chroma persist directory gets a single inter-process writer lock
+SHARED_STATE = os.getenv("INFOPOP_SHARED_STATE", "0") == "1"
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+
+class InterProcessLock:
+    """Exclusive lock held across threads and processes via a lock file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._file = None
+
+    def acquire(self):
+        self._thread_lock.acquire()
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._file = open(self.path, "a+b")
+            if os.name == "nt":
+                # msvcrt.locking retries for ~10s on LK_LOCK; keep retrying beyond that
+                while True:
+                    try:
+                        self._file.seek(0)
+                        msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        time.sleep(0.05)
+            else:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        except Exception:
+            self._close()
+            self._thread_lock.release()
+            raise
+
+    def release(self):
+        try:
+            if os.name == "nt":
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        finally:
+            self._close()
+            self._thread_lock.release()
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+class GenerationFile:
+    """A counter file bumped by the writer so readers in other processes can detect changes"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def read(self) -> int:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def bump(self) -> int:
+        """Increment the counter; call while holding the writer lock"""
+        generation = self.read() + 1
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(str(generation))
+        os.replace(temp_path, self.path)
+        return generation
+
+
+class SQLiteConversationHistory:
+    """Drop-in replacement for ConversationHistory that stores messages in SQLite"""
+
+    def __init__(self, max_messages: Optional[int] = None):
+        # Only the newest max_messages of a conversation are read back
+        self.max_messages = max_messages
+
+    def add_message(self, conversation_id: str, message: ChatMessage):
+        from utils_db import insert_conversation_message
+        insert_conversation_message(
+            conversation_id=conversation_id,
+            content=message.content,
+            from_user=message.from_user,
+            timestamp=message.timestamp or datetime.now()
+        )
+
+    def get_messages(self, conversation_id: str) -> List[ChatMessage]:
+        from utils_db import get_conversation_messages
+        return [
+            ChatMessage(content=row.content, from_user=row.from_user, timestamp=row.timestamp)
+            for row in get_conversation_messages(conversation_id, self.max_messages)
+        ]
+
+    def clear_conversation(self, conversation_id: str):
+        from utils_db import delete_conversation_messages
+        delete_conversation_messages(conversation_id)
+
+    # Async variants for the request handlers, on the async engine (utils_db_async)
+
+    async def aadd_message(self, conversation_id: str, message: ChatMessage):
+        from utils_db_async import insert_conversation_message
+        await insert_conversation_message(
+            conversation_id=conversation_id,
+            content=message.content,
+            from_user=message.from_user,
+            timestamp=message.timestamp or datetime.now()
+        )
+
+    async def aget_messages(self, conversation_id: str) -> List[ChatMessage]:
+        from utils_db_async import get_conversation_messages
+        return [
+            ChatMessage(content=row.content, from_user=row.from_user, timestamp=row.timestamp)
+            for row in await get_conversation_messages(conversation_id, self.max_messages)
+        ]
+
+    async def aclear_conversation(self, conversation_id: str):
+        from utils_db_async import delete_conversation_messages
+        await delete_conversation_messages(conversation_id)
+
+
+class SharedCache:
+    """
+    Key-value cache with expiry shared by all workers, stored in SQLite
+
+    Mirrors the small subset of the Redis API we need (get / set with `ex` / delete),
+    with JSON-serializable values.
+    """
+
+    def get(self, key: str) -> Optional[Any]:
+        from utils_db import get_shared_cache_entry
+        entry = get_shared_cache_entry(key)
+        if entry is None:
+            return None
+        if entry.expires_at is not None and entry.expires_at < time.time():
+            self.delete(key)
+            return None
+        return json.loads(entry.value)
+
+    def set(self, key: str, value: Any, ex: Optional[float] = None):
+        from utils_db import upsert_shared_cache_entry
+        expires_at = time.time() + ex if ex is not None else None
+        upsert_shared_cache_entry(key, json.dumps(value, default=str), expires_at)
+
+    def delete(self, key: str):
+        from utils_db import delete_shared_cache_entry
+        delete_shared_cache_entry(key)
+
+    # Async variants for the request handlers, on the async engine (utils_db_async)
+
+    async def aget(self, key: str) -> Optional[Any]:
+        from utils_db_async import get_shared_cache_entry
+        entry = await get_shared_cache_entry(key)
+        if entry is None:
+            return None
+        if entry.expires_at is not None and entry.expires_at < time.time():
+            await self.adelete(key)
+            return None
+        return json.loads(entry.value)
+
+    async def aset(self, key: str, value: Any, ex: Optional[float] = None):
+        from utils_db_async import upsert_shared_cache_entry
+        expires_at = time.time() + ex if ex is not None else None
+        await upsert_shared_cache_entry(key, json.dumps(value, default=str), expires_at)
+
+    async def adelete(self, key: str):
+        from utils_db_async import delete_shared_cache_entry
+        await delete_shared_cache_entry(key)
+
+
+class LocalCache:
+    """In-process counterpart of SharedCache for single-worker mode"""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: Dict[str, tuple] = {}
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None or (entry[1] is not None and entry[1] < time.time()):
+            return None
+        return entry[0]
+
+    def set(self, key: str, value: Any, ex: Optional[float] = None):
+        if len(self._entries) >= self.max_entries and key not in self._entries:
+            now = time.time()
+            self._entries = {k: v for k, v in self._entries.items() if v[1] is None or v[1] >= now}
+            if len(self._entries) >= self.max_entries:
+                # Still full: drop the oldest entry
+                self._entries.pop(next(iter(self._entries)))
+        self._entries[key] = (value, time.time() + ex if ex is not None else None)
+
+    def delete(self, key: str):
+        self._entries.pop(key, None)
+
+    async def aget(self, key: str) -> Optional[Any]:
+        return self.get(key)
+
+    async def aset(self, key: str, value: Any, ex: Optional[float] = None):
+        self.set(key, value, ex)
+
+    async def adelete(self, key: str):
+        self.delete(key)
+
+
+# Global cache, shared between workers in multi-worker mode
+shared_cache = SharedCache() if SHARED_STATE else LocalCache()
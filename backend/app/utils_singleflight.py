@@ -0,0 +1,98 @@
+import asyncio
+import os
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple, TypeVar
+
+from utils_metrics import cache_requests, embedding_batch_size
+
+T = TypeVar("T")
+
+# Embedding micro-batching: query embeddings requested within this window are
+# sent to the embedding API as one batch
+EMBEDDING_BATCH_WINDOW = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5")) / 1000
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "64"))
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key into one in-flight call
+
+    The first caller for a key starts the call; callers arriving while it is
+    in flight await the same task. Nothing is cached once the call finished.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._in_flight.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            cache_requests.inc(cache=f"singleflight_{self.name}", result="miss")
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done, key=key: self._forget(key, done))
+        else:
+            cache_requests.inc(cache=f"singleflight_{self.name}", result="hit")
+        # Shield so one cancelled caller does not cancel the call for everyone
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
+
+
+class EmbeddingMicroBatcher:
+    """
+    Collect query embeddings arriving within a short window into one batch call
+
+    `get_embeddings` is called at flush time, so replacing the embedding model
+    (see utils_chroma.set_embedding_model) takes effect immediately.
+    """
+
+    def __init__(self, get_embeddings: Callable[[], object],
+                 window: float = EMBEDDING_BATCH_WINDOW, max_batch: int = EMBEDDING_MAX_BATCH):
+        self.get_embeddings = get_embeddings
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # The loop only holds weak references to tasks: a batch collected mid-flight would hang its callers
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def embed(self, text: str) -> List[float]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]]):
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        embedding_batch_size.observe(len(texts))
+        try:
+            vectors = await self.get_embeddings().aembed_documents(texts)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        by_text = dict(zip(texts, vectors))
+        for text, future in batch:
+            if not future.done():
+                future.set_result(by_text[text])
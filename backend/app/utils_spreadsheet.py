@@ -0,0 +1,383 @@
+"""
+Spreadsheet (.xlsx) ingestion and the columnar table store
+
+Workbooks are read with openpyxl in read-only mode, which streams rows from
+the sheet XML instead of building the whole workbook in memory. The first
+non-empty row of a sheet is its header. Rows are rendered as Markdown table
+rows and grouped into chunks of at most CHUNK_TOKENS tokens (see
+utils_text_splitter); every chunk repeats the sheet name and header so it can
+be understood on its own, and records the sheet and row range in its metadata.
+
+With XLSX_COLUMNAR=1, sheets where at least half the columns are numeric are
+also written to a columnar side store (one .npz per sheet under
+TABLE_STORE_DIR/<file_id>), so exact values can be looked up without going
+through retrieval.
+"""
+import json
+import os
+import shutil
+from datetime import date, datetime, time
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+from utils_text_splitter import CHUNK_TOKENS, count_tokens
+
+XLSX_COLUMNAR = os.getenv("XLSX_COLUMNAR", "0") == "1"
+TABLE_STORE_DIR = os.path.abspath(
+    os.getenv("TABLE_STORE_DIR", os.path.join(os.path.dirname(__file__), "..", "data", "tables"))
+)
+# Minimum share of numeric columns for a sheet to go to the table store
+NUMERIC_TABLE_RATIO = 0.5
+# Rows token-counted per batch while grouping
+ROW_BATCH = 256
+
+
+def format_cell(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, datetime) and value.time() == time():
+        # Excel stores dates as datetimes at midnight
+        return value.date().isoformat()
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    return str(value).replace("\n", " ").replace("|", "\\|").strip()
+
+
+def _markdown_row(cells: Sequence[str]) -> str:
+    return "| " + " | ".join(cells) + " |\n"
+
+
+def iter_sheet_rows(file_path: str) -> Iterator[Tuple[str, int, Tuple[Any, ...]]]:
+    """(sheet name, 1-based row number, cell values) of every non-empty row, streamed"""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for worksheet in workbook.worksheets:
+            for row_number, values in enumerate(worksheet.iter_rows(values_only=True), 1):
+                if any(value is not None and value != "" for value in values):
+                    yield worksheet.title, row_number, values
+    finally:
+        workbook.close()
+
+
+class _SheetChunker:
+    """Groups the rendered rows of one sheet into token-bounded chunks"""
+
+    def __init__(self, file_path: str, sheet: str, header: Sequence[str], max_tokens: int):
+        self.file_path = file_path
+        self.sheet = sheet
+        self.width = len(header)
+        self.prefix = f"表格：{sheet}\n" + _markdown_row(header) + _markdown_row(["---"] * self.width)
+        self.budget = max(max_tokens - count_tokens([self.prefix])[0], 1)
+        self.pending: List[Tuple[int, str]] = []
+        self.rows: List[Tuple[int, str, int]] = []  # (row number, text, tokens) of the current chunk
+        self.tokens = 0
+
+    def add(self, row_number: int, cells: Sequence[str]) -> Iterator[Document]:
+        cells = list(cells)
+        # Pad to the header; cells past it are kept unless empty
+        while len(cells) > self.width and not cells[-1]:
+            cells.pop()
+        cells += [""] * (self.width - len(cells))
+        self.pending.append((row_number, _markdown_row(cells)))
+        if len(self.pending) >= ROW_BATCH:
+            yield from self._drain()
+
+    def finish(self) -> Iterator[Document]:
+        yield from self._drain()
+        if self.rows:
+            yield self._emit()
+
+    def _drain(self) -> Iterator[Document]:
+        pending, self.pending = self.pending, []
+        for (row_number, text), tokens in zip(pending, count_tokens([text for _, text in pending])):
+            # A row over the budget on its own still becomes one chunk
+            if self.rows and self.tokens + tokens > self.budget:
+                yield self._emit()
+            self.rows.append((row_number, text, tokens))
+            self.tokens += tokens
+
+    def _emit(self) -> Document:
+        rows, self.rows, self.tokens = self.rows, [], 0
+        return Document(
+            page_content=self.prefix + "".join(text for _, text, _ in rows),
+            metadata={
+                "source": self.file_path,
+                "sheet": self.sheet,
+                "row_start": rows[0][0],
+                "row_end": rows[-1][0],
+            },
+        )
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class _ColumnCollector:
+    """
+    Spools the cell values of one sheet to disk for the table store
+
+    Values are buffered for ROW_BATCH rows, then appended to files in a
+    scratch directory: the row numbers, the float64 value of every cell (NaN
+    when empty or not a number) and the formatted text of every cell. Whether
+    a column is numeric is tracked as batches go by, so memory stays at one
+    batch whatever the size of the sheet; save() assembles the .npz column by
+    column from memory-mapped spool files.
+    """
+
+    def __init__(self, header: Sequence[str], spool_dir: str):
+        import tempfile
+
+        self.header = list(header)
+        self.width = len(header)
+        self.spool_dir = tempfile.mkdtemp(prefix=".spool-", dir=spool_dir)
+        self.rows = 0
+        self._numeric = [True] * self.width  # no text value seen
+        self._has_value = [False] * self.width
+        self._text_width = [1] * self.width
+        self._batch_rows: List[int] = []
+        self._batch: List[Sequence[Any]] = []
+        self._rows_file = open(os.path.join(self.spool_dir, "rows.bin"), "wb")
+        self._values_file = open(os.path.join(self.spool_dir, "values.bin"), "wb")
+        self._text_file = open(os.path.join(self.spool_dir, "text.npy"), "wb")
+
+    def add(self, row_number: int, values: Sequence[Any]):
+        self._batch_rows.append(row_number)
+        self._batch.append(values)
+        if len(self._batch) >= ROW_BATCH:
+            self._flush()
+
+    def _flush(self):
+        import numpy as np
+
+        if not self._batch:
+            return
+        count = len(self._batch)
+        numbers = np.full((count, self.width), np.nan)
+        text = []
+        for row_index, values in enumerate(self._batch):
+            cells = list(values[:self.width]) + [None] * (self.width - len(values))
+            for index, value in enumerate(cells):
+                if value is None:
+                    continue
+                self._has_value[index] = True
+                if _is_number(value):
+                    numbers[row_index, index] = value
+                else:
+                    self._numeric[index] = False
+            text.append([format_cell(value) for value in cells])
+        text = np.asarray(text, dtype=str).reshape(count, self.width)
+        for index in range(self.width):
+            self._text_width[index] = max(self._text_width[index], int(np.char.str_len(text[:, index]).max()))
+        np.asarray(self._batch_rows, dtype=np.int64).tofile(self._rows_file)
+        numbers.tofile(self._values_file)
+        # Batches are stored one after another, each as its own .npy record
+        np.save(self._text_file, text, allow_pickle=False)
+        self.rows += count
+        self._batch_rows, self._batch = [], []
+
+    def numeric_columns(self) -> List[bool]:
+        self._flush()
+        return [numeric and has_value for numeric, has_value in zip(self._numeric, self._has_value)]
+
+    def is_numeric_table(self) -> bool:
+        numeric = self.numeric_columns()
+        return bool(self.rows) and sum(numeric) >= NUMERIC_TABLE_RATIO * len(numeric)
+
+    def save(self, path: str):
+        """Write the spooled sheet as an .npz (rows, col_<index>), one column in flight at a time"""
+        import zipfile
+
+        import numpy as np
+
+        numeric = self.numeric_columns()
+        for spool in (self._rows_file, self._values_file, self._text_file):
+            spool.close()
+        shape = (self.rows, self.width)
+        values = np.memmap(os.path.join(self.spool_dir, "values.bin"), dtype=np.float64, mode="r", shape=shape)
+        # Text columns are gathered from the row batches into one memory-mapped array each
+        text_columns = {
+            index: np.lib.format.open_memmap(os.path.join(self.spool_dir, f"text_{index}.npy"), mode="w+",
+                                             dtype=f"<U{self._text_width[index]}", shape=(self.rows,))
+            for index in range(self.width) if not numeric[index]
+        }
+        if text_columns:
+            offset = 0
+            with open(os.path.join(self.spool_dir, "text.npy"), "rb") as f:
+                while offset < self.rows:
+                    batch = np.load(f, allow_pickle=False)
+                    for index, column in text_columns.items():
+                        column[offset:offset + len(batch)] = batch[:, index]
+                    offset += len(batch)
+
+        def write(archive, name, array):
+            with archive.open(f"{name}.npy", "w", force_zip64=True) as member:
+                np.lib.format.write_array(member, array, allow_pickle=False)
+
+        # The layout np.savez writes, so lookups read it with np.load
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED, allowZip64=True) as archive:
+            write(archive, "rows", np.memmap(os.path.join(self.spool_dir, "rows.bin"), dtype=np.int64, mode="r",
+                                             shape=(self.rows,)))
+            for index in range(self.width):
+                write(archive, f"col_{index}", text_columns[index] if index in text_columns else values[:, index])
+        del values, text_columns
+
+    def close(self):
+        """Remove the spool files"""
+        for spool in (self._rows_file, self._values_file, self._text_file):
+            spool.close()
+        shutil.rmtree(self.spool_dir, ignore_errors=True)
+
+
+def _header_cells(values: Sequence[Any]) -> List[str]:
+    from openpyxl.utils import get_column_letter
+
+    # Trailing empty header cells are dropped; empty ones in between get the column letter
+    width = max(index for index, value in enumerate(values) if value is not None and value != "") + 1
+    header = []
+    for index in range(width):
+        name = cell = format_cell(values[index]) or get_column_letter(index + 1)
+        # Repeated names get a suffix (Name, Name_2, ...), so rows keep every column and lookups can address it
+        suffix = 2
+        while name in header:
+            name = f"{cell}_{suffix}"
+            suffix += 1
+        header.append(name)
+    return header
+
+
+def load_xlsx(file_path: str, max_tokens: int = CHUNK_TOKENS, table_dir: Optional[str] = None) -> List[Document]:
+    """
+    Load a workbook as token-bounded row-group documents
+
+    Args:
+        file_path: Path of the .xlsx file
+        max_tokens: Token budget per chunk, header included
+        table_dir: If set, numeric sheets are also written to this table store directory
+
+    Returns:
+        One document per row group, with sheet / row_start / row_end metadata
+    """
+    documents: List[Document] = []
+    tables: Dict[str, Dict[str, Any]] = {}
+    sheet = None
+    chunker: Optional[_SheetChunker] = None
+    collector: Optional[_ColumnCollector] = None
+
+    def finish_sheet():
+        nonlocal collector
+        documents.extend(chunker.finish())
+        if collector is not None:
+            if collector.is_numeric_table():
+                name = f"sheet_{len(tables)}.npz"
+                collector.save(os.path.join(table_dir, name))
+                tables[sheet] = {"file": name, "columns": collector.header, "rows": collector.rows}
+            collector.close()
+            collector = None
+
+    try:
+        for sheet_name, row_number, values in iter_sheet_rows(file_path):
+            if sheet_name != sheet:
+                if chunker is not None:
+                    finish_sheet()
+                sheet = sheet_name
+                header = _header_cells(values)
+                chunker = _SheetChunker(file_path, sheet, header, max_tokens)
+                if table_dir:
+                    os.makedirs(table_dir, exist_ok=True)
+                    collector = _ColumnCollector(header, table_dir)
+                continue
+            documents.extend(chunker.add(row_number, [format_cell(value) for value in values]))
+            if collector is not None:
+                collector.add(row_number, values)
+        if chunker is not None:
+            finish_sheet()
+    finally:
+        if collector is not None:
+            collector.close()
+
+    if tables:
+        with open(os.path.join(table_dir, "index.json"), "w", encoding="utf-8") as f:
+            json.dump(tables, f, ensure_ascii=False, indent=2)
+    elif table_dir and os.path.isdir(table_dir) and not os.listdir(table_dir):
+        os.rmdir(table_dir)
+    return documents
+
+
+# Table store
+
+def table_dir_for(file_id: int) -> str:
+    return os.path.join(TABLE_STORE_DIR, str(file_id))
+
+
+def list_tables(file_id: int) -> Dict[str, Dict[str, Any]]:
+    """Sheets of a document in the table store, with their columns and row counts"""
+    try:
+        with open(os.path.join(table_dir_for(file_id), "index.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def lookup_table_rows(file_id: int, sheet: str, column: Optional[str] = None, value: Optional[str] = None,
+                      limit: int = 100) -> Optional[List[Dict[str, Any]]]:
+    """
+    Rows of a stored sheet, optionally only those where `column` equals `value` exactly
+
+    Returns:
+        Rows as {"row": row number, <column>: value, ...}, or None if the sheet is not stored
+    """
+    import numpy as np
+
+    info = list_tables(file_id).get(sheet)
+    if info is None:
+        return None
+    columns = info["columns"]
+    with np.load(os.path.join(table_dir_for(file_id), info["file"])) as table:
+        arrays = [table[f"col_{index}"] for index in range(len(columns))]
+        rows = table["rows"]
+    mask = np.ones(len(rows), dtype=bool)
+    if column is not None:
+        if column not in columns:
+            raise ValueError(f"Unknown column: {column}")
+        array = arrays[columns.index(column)]
+        if array.dtype.kind == "f":
+            try:
+                mask = array == float(value)
+            except (TypeError, ValueError):
+                mask[:] = False
+        else:
+            mask = array == (value or "")
+    result = []
+    for index in np.flatnonzero(mask)[:limit]:
+        row: Dict[str, Any] = {"row": int(rows[index])}
+        for name, array in zip(columns, arrays):
+            item = array[index]
+            row[name] = None if array.dtype.kind == "f" and np.isnan(item) else item.item()
+        result.append(row)
+    return result
+
+
+def link_tables(source_file_id: int, file_id: int) -> bool:
+    """Give file_id the stored tables of an identical document (hard links where possible)"""
+    source = table_dir_for(source_file_id)
+    if not os.path.exists(os.path.join(source, "index.json")):
+        return False
+
+    def link(src: str, dst: str):
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy2(src, dst)
+
+    shutil.copytree(source, table_dir_for(file_id), copy_function=link, dirs_exist_ok=True)
+    return True
+
+
+def delete_tables(file_id: int):
+    shutil.rmtree(table_dir_for(file_id), ignore_errors=True)
@@ -0,0 +1,136 @@
+import asyncio
+import importlib
+import os
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+
+class Readiness:
+    """Tracks whether the deferred warmup has finished.
+
+    `/health` only says the process is alive; readiness says the heavy
+    modules, database tables and default prompt are in place.
+    """
+
+    def __init__(self):
+        self._event = asyncio.Event()
+        self.status = "starting"
+        self.error: Optional[str] = None
+        self.ready_at: Optional[datetime] = None
+        self.step_timings: Dict[str, float] = {}
+
+    @property
+    def is_ready(self) -> bool:
+        return self.status == "ready"
+
+    def mark_ready(self):
+        self.status = "ready"
+        self.ready_at = datetime.now()
+        self._event.set()
+
+    def mark_failed(self, error: Exception):
+        self.status = "failed"
+        self.error = str(error)
+        self._event.set()
+
+    async def wait_ready(self, timeout: float = 30.0):
+        """Block a request until warmup is done, or fail with 503"""
+        if not self._event.is_set():
+            try:
+                await asyncio.wait_for(self._event.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                raise HTTPException(
+                    status_code=503,
+                    detail="Service is still warming up, please retry shortly",
+                    headers={"Retry-After": "1"},
+                )
+        if self.status == "failed":
+            raise HTTPException(status_code=503, detail=f"Service warmup failed: {self.error}")
+
+    def to_dict(self) -> dict:
+        return {
+            "status": self.status,
+            "error": self.error,
+            "ready_at": self.ready_at,
+            "warmup_seconds": round(sum(self.step_timings.values()), 4),
+            "steps": {name: round(seconds, 4) for name, seconds in self.step_timings.items()},
+        }
+
+
+# Global readiness state
+readiness = Readiness()
+
+
+def _create_tables():
+    from database import create_db_and_tables
+    # The table models live in utils_db and must be registered before create_all
+    import utils_db  # noqa: F401
+    create_db_and_tables()
+
+
+def _check_vector_index():
+    from utils_vector_index import CHROMA_SHARD_BY
+    if not CHROMA_SHARD_BY or os.getenv("VECTOR_BACKEND", "chroma") != "chroma":
+        return
+    import chromadb
+
+    from utils_chroma import CHROMA_PERSIST_DIR
+    from utils_vector_index import check_shard_layout
+    check_shard_layout(chromadb.PersistentClient(path=CHROMA_PERSIST_DIR), CHROMA_SHARD_BY)
+
+
+def _compile_default_prompt():
+    from utils_langchain import get_qa_prompt
+    get_qa_prompt()
+
+
+def _import_modules(*module_names: str) -> Callable[[], None]:
+    def step():
+        for name in module_names:
+            importlib.import_module(name)
+    return step
+
+
+def _load_tokenizer():
+    from utils_text_splitter import TEXT_SPLITTER, get_encoding
+    if TEXT_SPLITTER == "token":
+        get_encoding()
+
+
+# (name, step, required) - ordered so that what the first request needs
+# (database, prompt) is ready first. Optional steps only pre-import modules
+# that would otherwise be imported on first use, so a failure there is logged
+# but does not block readiness.
+WarmupStep = Tuple[str, Callable[[], None], bool]
+
+# Module of the configured vector backend (see utils_chroma.VECTOR_BACKEND)
+_VECTOR_BACKEND_MODULE = "utils_numpy_store" if os.getenv("VECTOR_BACKEND", "chroma") == "numpy" else "langchain_chroma"
+
+WARMUP_STEPS: List[WarmupStep] = [
+    ("database", _create_tables, True),
+    ("prompt", _compile_default_prompt, True),
+    # Sharded serving over an unsharded index would silently lose every indexed document
+    ("vector_index", _check_vector_index, True),
+    ("llm", _import_modules("langchain_openai", "langchain.chains"), False),
+    ("vector_store", _import_modules("utils_chroma", _VECTOR_BACKEND_MODULE), False),
+    ("loaders", _import_modules("langchain_community.document_loaders"), False),
+    ("tokenizer", _load_tokenizer, False),
+]
+
+
+async def warmup(steps: Optional[List[WarmupStep]] = None):
+    """Run the deferred initialization in a worker thread, step by step"""
+    for name, step, required in steps or WARMUP_STEPS:
+        start = time.perf_counter()
+        try:
+            await asyncio.to_thread(step)
+        except Exception as e:
+            print(f"Error during warmup step '{name}': {e}")
+            if required:
+                readiness.mark_failed(e)
+                return
+        readiness.step_timings[name] = time.perf_counter() - start
+    readiness.mark_ready()
@@ -0,0 +1,190 @@
+"""
+Token-sized, CJK-aware text splitting
+
+`RecursiveCharacterTextSplitter` counts characters and only knows ASCII
+separators, so Chinese chunks vary a lot in token count and get cut
+mid-sentence. TokenTextSplitter sizes chunks in tokenizer tokens and cuts on
+sentence boundaries, Chinese and Western:
+
+1. One precompiled regex pass cuts the text into sentences (line and
+   paragraph breaks, 。！？!?；;… with trailing closing quotes / brackets, and
+   ". ").
+2. All sentences are token-counted in one batch (tiktoken's Rust encoder).
+   Sentences longer than a chunk are cut again on clause punctuation
+   (，、,：:), and as a last resort on token boundaries.
+3. Sentences are packed greedily into chunks of at most `chunk_size` tokens;
+   each chunk starts with the trailing sentences of the previous one that fit
+   in `chunk_overlap` tokens.
+
+Every step walks the text once, so splitting is linear in its length. When
+the tiktoken encoding cannot be loaded (e.g. offline without
+TIKTOKEN_CACHE_DIR), token counts are estimated instead: one token per CJK
+character and one per four other non-space characters.
+"""
+import math
+import os
+import re
+from functools import lru_cache
+from typing import Any, Callable, List, Optional, Sequence
+
+from langchain_text_splitters import TextSplitter
+
+# "token" (default) or "recursive" for the previous character-based splitter
+TEXT_SPLITTER = os.getenv("TEXT_SPLITTER", "token")
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "400"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "80"))
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "cl100k_base")
+
+_CLOSERS = re.escape("\"'”’」』）)】》")
+# One sentence: a run without terminal punctuation (a "." only counts when
+# followed by whitespace, so "v1.5" stays whole), then its boundary: a line
+# break, 。！？!?；;… with any closing quotes / brackets, or ". "
+_SENTENCE = re.compile(
+    r"(?:[^\n。！？!?；;….]+|\.(?![" + _CLOSERS + r"]*(?:\s|$)))*"
+    r"(?:\n\s*|[。！？!?；;…]+[" + _CLOSERS + r"]*\s*|\.[" + _CLOSERS + r"]*(?:\s+|$)|$)"
+)
+# One clause of an overlong sentence: up to a comma / colon or whitespace
+_CLAUSE = re.compile(r"[^，、,：:\s]*(?:[，、,：:]\s*|\s+|$)")
+_CJK = re.compile(r"[⺀-鿿가-힯豈-﫿＀-￯]")
+
+
+def _cut(text: str, pattern: "re.Pattern") -> List[str]:
+    """Cut text into the consecutive matches of pattern; the pieces join back to text"""
+    return [piece for piece in pattern.findall(text) if piece]
+
+
+def split_sentences(text: str) -> List[str]:
+    """Cut text into sentences (boundary punctuation and whitespace included); they join back to text"""
+    return _cut(text, _SENTENCE)
+
+
+def _estimate(text: str) -> float:
+    """Unrounded token estimate; pieces of a chunk are summed unrounded so short ones are not each counted as a token"""
+    length = len(text)
+    # CJK characters take 3 bytes in UTF-8, so each adds 2 bytes over its length
+    cjk = (len(text.encode("utf-8")) - length) // 2
+    other = length - cjk - text.count(" ") - text.count("\n")
+    return cjk + max(other, 0) / 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count without a tokenizer: one per CJK character, one per four other non-space characters"""
+    return math.ceil(_estimate(text))
+
+
+@lru_cache(maxsize=None)
+def get_encoding(name: str = TOKENIZER_ENCODING):
+    """The tiktoken encoding, loaded once; None (with a logged error) if it cannot be loaded"""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        print(f"Tokenizer {name} unavailable, estimating token counts: {e}")
+        return None
+
+
+def count_tokens(pieces: Sequence[str], encoding_name: str = TOKENIZER_ENCODING) -> List[int]:
+    """Token counts of several strings, encoded in one batch (estimated without the encoding)"""
+    encoding = get_encoding(encoding_name)
+    if encoding is None:
+        return [estimate_tokens(piece) for piece in pieces]
+    return [len(tokens) for tokens in encoding.encode_ordinary_batch(list(pieces))]
+
+
+class TokenTextSplitter(TextSplitter):
+    """Splits text into chunks of at most `chunk_size` tokens on sentence boundaries"""
+
+    def __init__(self, chunk_size: int = CHUNK_TOKENS, chunk_overlap: int = CHUNK_OVERLAP_TOKENS,
+                 encoding_name: str = TOKENIZER_ENCODING, **kwargs: Any):
+        super().__init__(chunk_size=chunk_size, chunk_overlap=chunk_overlap, **kwargs)
+        self.encoding_name = encoding_name
+
+    @property
+    def encoding(self):
+        return get_encoding(self.encoding_name)
+
+    def _count_tokens(self, pieces: Sequence[str]) -> List[float]:
+        if self.encoding is None:
+            # Unrounded, so a chunk's total is what estimate_tokens gives for the joined chunk (rounded up)
+            return [_estimate(piece) for piece in pieces]
+        return count_tokens(pieces, self.encoding_name)
+
+    def _hard_split(self, text: str) -> List[str]:
+        """Cut a piece without any boundary into chunk_size-token windows"""
+        encoding = self.encoding
+        if encoding is None:
+            # Estimated: CJK-heavy text is about one token per character
+            size = max(1, self._chunk_size if _CJK.search(text) else self._chunk_size * 4)
+            return [text[i:i + size] for i in range(0, len(text), size)]
+        tokens = encoding.encode_ordinary(text)
+        return [encoding.decode(tokens[i:i + self._chunk_size]) for i in range(0, len(tokens), self._chunk_size)]
+
+    def _pieces(self, text: str) -> tuple:
+        """Sentences (or smaller pieces for long sentences) and their token counts"""
+        sentences = split_sentences(text)
+        counts = self._count_tokens(sentences)
+        if max(counts, default=0) <= self._chunk_size:
+            return sentences, counts
+
+        pieces: List[str] = []
+        piece_counts: List[int] = []
+        for sentence, count in zip(sentences, counts):
+            if count <= self._chunk_size:
+                pieces.append(sentence)
+                piece_counts.append(count)
+                continue
+            clauses = _cut(sentence, _CLAUSE)
+            for clause, clause_count in zip(clauses, self._count_tokens(clauses)):
+                if clause_count <= self._chunk_size:
+                    pieces.append(clause)
+                    piece_counts.append(clause_count)
+                else:
+                    windows = self._hard_split(clause)
+                    pieces.extend(windows)
+                    piece_counts.extend(self._count_tokens(windows))
+        return pieces, piece_counts
+
+    def split_text(self, text: str) -> List[str]:
+        pieces, counts = self._pieces(text)
+        chunks = []
+        start = 0  # first piece of the current chunk
+        tokens = 0  # tokens in pieces[start:end]
+        for end, count in enumerate(counts):
+            if tokens + count > self._chunk_size and end > start:
+                self._emit(chunks, pieces, start, end)
+                # Keep the trailing pieces that fit in the overlap
+                new_start = end
+                overlap = 0
+                while new_start > start + 1 and overlap + counts[new_start - 1] <= self._chunk_overlap \
+                        and overlap + counts[new_start - 1] + count <= self._chunk_size:
+                    new_start -= 1
+                    overlap += counts[new_start]
+                start, tokens = new_start, overlap
+            tokens += count
+        if start < len(pieces):
+            self._emit(chunks, pieces, start, len(pieces))
+        return chunks
+
+    def _emit(self, chunks: List[str], pieces: List[str], start: int, end: int):
+        chunk = "".join(pieces[start:end])
+        if self._strip_whitespace:
+            chunk = chunk.strip()
+        if chunk:
+            chunks.append(chunk)
+
+
+def create_text_splitter(kind: str = TEXT_SPLITTER, chunk_size: Optional[int] = None,
+                         chunk_overlap: Optional[int] = None, length_function: Optional[Callable] = None) -> TextSplitter:
+    """The ingest text splitter: "token" (sizes in tokens) or "recursive" (sizes in characters)"""
+    if kind == "recursive":
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+        return RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size or 1000, chunk_overlap=200 if chunk_overlap is None else chunk_overlap,
+            length_function=length_function or len,
+        )
+    if kind == "token":
+        return TokenTextSplitter(
+            chunk_size=chunk_size or CHUNK_TOKENS,
+            chunk_overlap=CHUNK_OVERLAP_TOKENS if chunk_overlap is None else chunk_overlap,
+        )
+    raise ValueError(f"Unknown text splitter: {kind}. Available splitters: token, recursive")
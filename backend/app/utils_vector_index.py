@@ -0,0 +1,594 @@
+"""
+Vector index management: per-collection HNSW settings, sharding and rebuilds
+
+HNSW settings come from backend/index_config.json (or INDEX_CONFIG_FILE):
+
+    {
+      "default": {"space": "l2", "M": 16, "ef_construction": 100, "ef_search": 100},
+      "collections": {"documents": {"ef_search": 50}}
+    }
+
+`M` and `ef_construction` only take effect when a collection is created, so
+changing them needs a rebuild; `ef_search` is applied whenever a collection
+is opened. Shard collections (see CHROMA_SHARD_BY) use the settings of their
+own name if present, else those of the base collection.
+
+Command line (stop the server or expect it to wait for the writer lock):
+
+    python utils_vector_index.py info
+    python utils_vector_index.py rebuild [--collection NAME]
+    python utils_vector_index.py shard [--shard-by knowledge_base]
+    python utils_vector_index.py convert-index --dtype int8 [--from chroma] [--no-rescore]
+    python utils_vector_index.py convert-kb --dtype float16 --model-id MODEL [--dry-run]
+
+With VECTOR_BACKEND=numpy, `rebuild` compacts the NumPy index instead.
+`shard` moves the records of the unsharded collection into the shard
+collections, run once before starting with CHROMA_SHARD_BY set (a sharded
+server refuses to start while the unsharded collection still holds records).
+`convert-index` copies the stored embeddings (no re-embedding) of the Chroma
+collections or of the current NumPy index into a NumPy index of another dtype;
+`convert-kb` re-encodes knowledge_base.embedding blobs in the
+utils_embedding_codec format.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+INDEX_CONFIG_FILE = os.getenv(
+    "INDEX_CONFIG_FILE", os.path.join(os.path.dirname(__file__), "..", "index_config.json")
+)
+
+# Base collection name; shards are named f"{COLLECTION_NAME}__{shard}"
+COLLECTION_NAME = "documents"
+
+# Metadata key to shard the index by (e.g. "knowledge_base"); empty disables sharding
+CHROMA_SHARD_BY = os.getenv("CHROMA_SHARD_BY", "")
+DEFAULT_SHARD = "default"
+
+# Chroma defaults, used when the config file is missing
+DEFAULT_HNSW = {"space": "l2", "M": 16, "ef_construction": 100, "ef_search": 100}
+
+_fan_out_pool: Optional[ThreadPoolExecutor] = None
+
+
+def load_index_config() -> Dict[str, Any]:
+    """Load the index config file, falling back to Chroma's defaults"""
+    try:
+        with open(INDEX_CONFIG_FILE, "r", encoding="utf-8") as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        config = {}
+    return {
+        "default": {**DEFAULT_HNSW, **config.get("default", {})},
+        "collections": config.get("collections", {}),
+    }
+
+
+def get_hnsw_settings(collection_name: str, config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """HNSW settings for a collection: defaults, then the base collection, then the collection itself"""
+    config = config or load_index_config()
+    settings = dict(config["default"])
+    base_name = collection_name.split("__", 1)[0]
+    if base_name != collection_name:
+        settings.update(config["collections"].get(base_name, {}))
+    settings.update(config["collections"].get(collection_name, {}))
+    return settings
+
+
+def hnsw_configuration(settings: Dict[str, Any]) -> Dict[str, Any]:
+    """Translate our settings into a Chroma collection configuration"""
+    return {
+        "hnsw": {
+            "space": settings["space"],
+            "max_neighbors": int(settings["M"]),
+            "ef_construction": int(settings["ef_construction"]),
+            "ef_search": int(settings["ef_search"]),
+        }
+    }
+
+
+def apply_ef_search(collection, ef_search: int):
+    """Update ef_search on an existing collection if it differs (no rebuild needed)"""
+    current = (collection.configuration or {}).get("hnsw") or {}
+    if current.get("ef_search") != ef_search:
+        collection.modify(configuration={"hnsw": {"ef_search": ef_search}})
+
+
+def open_collection_store(collection_name: str, embedding: Embeddings, client=None,
+                          persist_directory: Optional[str] = None, metadata: Optional[Dict[str, Any]] = None):
+    """Open (or create) a Chroma collection with its configured HNSW settings"""
+    from langchain_chroma import Chroma
+
+    settings = get_hnsw_settings(collection_name)
+    store = Chroma(
+        collection_name=collection_name,
+        embedding_function=embedding,
+        client=client,
+        persist_directory=None if client is not None else persist_directory,
+        collection_metadata=metadata,
+        collection_configuration=hnsw_configuration(settings),
+    )
+    apply_ef_search(store._collection, int(settings["ef_search"]))
+    return store
+
+
+def shard_collection_name(shard: str) -> str:
+    """Collection name for a shard value; non-ASCII values get a stable hash suffix"""
+    slug = re.sub(r"[^A-Za-z0-9_-]+", "-", shard).strip("-_")
+    if slug != shard or not slug:
+        slug = f"{slug}-{hashlib.sha1(shard.encode('utf-8')).hexdigest()[:8]}".strip("-")
+    return f"{COLLECTION_NAME}__{slug}"
+
+
+def _get_fan_out_pool() -> ThreadPoolExecutor:
+    global _fan_out_pool
+    if _fan_out_pool is None:
+        _fan_out_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="shard-search")
+    return _fan_out_pool
+
+
+class ShardedVectorStore(VectorStore):
+    """
+    One Chroma collection per value of a metadata key, searched by fan-out
+
+    Chunks are routed by `metadata[shard_key]` (DEFAULT_SHARD when missing).
+    Searches filtered on the shard key only touch that shard; other searches
+    query every shard in parallel and merge the results by distance.
+    """
+
+    def __init__(self, embedding: Embeddings, persist_directory: str, shard_key: str):
+        import chromadb
+
+        self._embedding = embedding
+        self.shard_key = shard_key
+        self._client = chromadb.PersistentClient(path=persist_directory)
+        check_shard_layout(self._client, shard_key)
+        self._shards: Dict[str, Any] = {}
+        self._refresh()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def _refresh(self):
+        prefix = f"{COLLECTION_NAME}__"
+        for collection in self._client.list_collections():
+            name = collection.name if hasattr(collection, "name") else collection
+            if name.startswith(prefix) and name not in self._shards:
+                self._shards[name] = open_collection_store(name, self._embedding, client=self._client)
+
+    def _shard_for(self, shard: str):
+        name = shard_collection_name(shard)
+        if name not in self._shards:
+            self._shards[name] = open_collection_store(
+                name, self._embedding, client=self._client, metadata={"shard": shard}
+            )
+        return self._shards[name]
+
+    def shards(self) -> List[Any]:
+        self._refresh()
+        return list(self._shards.values())
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        documents = [Document(page_content=text, metadata=metadata) for text, metadata in zip(texts, metadatas)]
+        return self.add_documents(documents, ids=ids, **kwargs)
+
+    def add_documents(self, documents: List[Document], **kwargs: Any) -> List[str]:
+        ids = kwargs.pop("ids", None)
+        groups: Dict[str, List[Tuple[Document, Optional[str]]]] = {}
+        for index, document in enumerate(documents):
+            shard = str(document.metadata.get(self.shard_key) or DEFAULT_SHARD)
+            groups.setdefault(shard, []).append((document, ids[index] if ids else None))
+        added = []
+        for shard, items in groups.items():
+            shard_ids = [item_id for _, item_id in items] if ids else None
+            added.extend(self._shard_for(shard).add_documents([doc for doc, _ in items], ids=shard_ids, **kwargs))
+        return added
+
+    def _target_shards(self, filter: Optional[Dict[str, Any]]) -> List[Any]:
+        filter = filter or {}
+        # A shard key condition inside a top-level $and also selects its shard
+        clauses = [filter, *filter.get("$and", [])]
+        value = next((clause[self.shard_key] for clause in clauses if self.shard_key in clause), None)
+        if isinstance(value, str):
+            name = shard_collection_name(value)
+            self._refresh()
+            return [self._shards[name]] if name in self._shards else []
+        return self.shards()
+
+    def similarity_search_by_vector_with_relevance_scores(
+        self, embedding: List[float], k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        """Fan out to the shards; scores are distances, lower is more similar"""
+        shards = self._target_shards(filter)
+        if not shards:
+            return []
+
+        def search(shard):
+            return shard.similarity_search_by_vector_with_relevance_scores(embedding, k=k, filter=filter, **kwargs)
+
+        if len(shards) == 1:
+            results = search(shards[0])
+        else:
+            results = [pair for shard_results in _get_fan_out_pool().map(search, shards) for pair in shard_results]
+        return sorted(results, key=lambda pair: pair[1])[:k]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4,
+                                    filter: Optional[Dict[str, Any]] = None, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_relevance_scores(embedding, k, filter, **kwargs)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4,
+                                     filter: Optional[Dict[str, Any]] = None, **kwargs: Any) -> List[Tuple[Document, float]]:
+        embedding = self._embedding.embed_query(query)
+        return self.similarity_search_by_vector_with_relevance_scores(embedding, k, filter, **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4,
+                          filter: Optional[Dict[str, Any]] = None, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter, **kwargs)]
+
+    def get(self, where: Optional[Dict[str, Any]] = None, **kwargs: Any) -> Dict[str, List[Any]]:
+        merged: Dict[str, List[Any]] = {}
+        for shard in self._target_shards(where):
+            for key, values in shard.get(where=where, **kwargs).items():
+                if isinstance(values, list):
+                    merged.setdefault(key, []).extend(values)
+        return merged
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> None:
+        for shard in self.shards():
+            shard.delete(ids=ids, **kwargs)
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None, **kwargs: Any):
+        raise NotImplementedError("Create a ShardedVectorStore through utils_chroma.get_vector_store")
+
+
+def unsharded_count(client) -> int:
+    """Records in the unsharded collection"""
+    names = {getattr(c, "name", c) for c in client.list_collections()}
+    return client.get_collection(COLLECTION_NAME).count() if COLLECTION_NAME in names else 0
+
+
+def check_shard_layout(client, shard_key: str):
+    """Refuse to serve sharded while the unsharded collection still holds records: they would vanish from retrieval"""
+    count = unsharded_count(client)
+    if count:
+        raise RuntimeError(
+            f"CHROMA_SHARD_BY={shard_key} but the unsharded '{COLLECTION_NAME}' collection still holds {count} "
+            f"records; move them into the shards first: python utils_vector_index.py shard --shard-by {shard_key}"
+        )
+
+
+def shard_collection(client, shard_key: str, batch_size: int = 1000) -> Dict[str, int]:
+    """
+    Move the records of the unsharded collection into the shard collections
+
+    Records are routed like ShardedVectorStore.add_documents and copied with
+    their stored embeddings (no re-embedding); the unsharded collection is
+    dropped once everything is copied. Copies are upserts, so an interrupted
+    run can simply be started again.
+
+    Returns:
+        Records moved per shard collection
+    """
+    names = {getattr(c, "name", c) for c in client.list_collections()}
+    if COLLECTION_NAME not in names:
+        return {}
+    source = client.get_collection(COLLECTION_NAME)
+    targets: Dict[str, Any] = {}
+    moved: Dict[str, int] = {}
+    offset = 0
+    while True:
+        batch = source.get(include=["embeddings", "documents", "metadatas"], limit=batch_size, offset=offset)
+        if not batch["ids"]:
+            break
+        groups: Dict[str, List[int]] = {}
+        for index, metadata in enumerate(batch["metadatas"]):
+            groups.setdefault(str((metadata or {}).get(shard_key) or DEFAULT_SHARD), []).append(index)
+        for shard, indexes in groups.items():
+            name = shard_collection_name(shard)
+            if name not in targets:
+                targets[name] = client.get_or_create_collection(
+                    name, configuration=hnsw_configuration(get_hnsw_settings(name)),
+                    metadata={"shard": shard}, embedding_function=None
+                )
+            targets[name].upsert(
+                ids=[batch["ids"][i] for i in indexes],
+                embeddings=[batch["embeddings"][i] for i in indexes],
+                documents=[batch["documents"][i] for i in indexes],
+                metadatas=[batch["metadatas"][i] for i in indexes],
+            )
+            moved[name] = moved.get(name, 0) + len(indexes)
+        offset += len(batch["ids"])
+    client.delete_collection(COLLECTION_NAME)
+    return moved
+
+
+def iter_collection_stores(vector_store) -> List[Any]:
+    """The Chroma stores behind a vector store: its shards, or the store itself"""
+    if isinstance(vector_store, ShardedVectorStore):
+        return vector_store.shards()
+    return [vector_store]
+
+
+def delete_where(vector_store, where: Dict[str, Any]):
+    """Delete every record matching a metadata filter, in all shards"""
+    for store in iter_collection_stores(vector_store):
+        collection = getattr(store, "_collection", None)
+        if collection is not None:
+            collection.delete(where=where)
+        else:
+            store.delete(where=where)
+
+
+def rebuild_collection(client, collection_name: str, batch_size: int = 1000) -> int:
+    """
+    Rebuild a collection with its configured HNSW settings
+
+    Copies every record (with its stored embedding, no re-embedding) into a new
+    collection, drops the old one and renames the copy. This also compacts the
+    index, since HNSW keeps deleted entries around until a rebuild.
+
+    Returns:
+        Number of records copied
+    """
+    temp_name = f"rebuild-{collection_name}"
+    existing = {getattr(c, "name", c) for c in client.list_collections()}
+    if collection_name not in existing:
+        if temp_name in existing:
+            # A previous rebuild stopped after dropping the old collection
+            client.get_collection(temp_name).modify(name=collection_name)
+            return client.get_collection(collection_name).count()
+        raise ValueError(f"Collection not found: {collection_name}")
+    if temp_name in existing:
+        client.delete_collection(temp_name)
+
+    source = client.get_collection(collection_name)
+    settings = get_hnsw_settings(collection_name)
+    target = client.create_collection(
+        temp_name, configuration=hnsw_configuration(settings), metadata=source.metadata, embedding_function=None
+    )
+    copied = 0
+    while True:
+        batch = source.get(include=["embeddings", "documents", "metadatas"], limit=batch_size, offset=copied)
+        if not batch["ids"]:
+            break
+        target.add(ids=batch["ids"], embeddings=batch["embeddings"],
+                   documents=batch["documents"], metadatas=batch["metadatas"])
+        copied += len(batch["ids"])
+
+    client.delete_collection(collection_name)
+    target.modify(name=collection_name)
+    return copied
+
+
+def describe_collections(client) -> List[Dict[str, Any]]:
+    """Record count and configured vs. actual HNSW settings of every collection"""
+    config = load_index_config()
+    rows = []
+    for collection in client.list_collections():
+        collection = client.get_collection(getattr(collection, "name", collection))
+        actual = (collection.configuration or {}).get("hnsw") or {}
+        rows.append({
+            "name": collection.name,
+            "count": collection.count(),
+            "configured": get_hnsw_settings(collection.name, config),
+            "actual": {
+                "space": actual.get("space"),
+                "M": actual.get("max_neighbors"),
+                "ef_construction": actual.get("ef_construction"),
+                "ef_search": actual.get("ef_search"),
+            },
+        })
+    return rows
+
+
+def convert_to_numpy_index(batches: Iterable[Tuple[List[str], Any, List[str], List[Dict[str, Any]]]],
+                           directory: str, dtype: str, rescore: bool = True) -> int:
+    """
+    Write (ids, embeddings, texts, metadatas) batches into a new NumPy index
+
+    The index is built next to `directory` and swapped in at the end, so the
+    source may be the index being replaced.
+
+    Returns:
+        Number of records written
+    """
+    import shutil
+
+    from utils_numpy_store import NumpyVectorStore
+
+    temp_dir = f"{directory}.convert"
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    store = NumpyVectorStore(temp_dir, dtype=dtype, rescore=rescore)
+    written = 0
+    for ids, embeddings, texts, metadatas in batches:
+        if len(ids):
+            store.add_embeddings(embeddings, texts, metadatas, ids)
+            written += len(ids)
+    del store
+    if os.path.exists(directory):
+        os.replace(directory, f"{directory}.old")
+    os.replace(temp_dir, directory)
+    shutil.rmtree(f"{directory}.old", ignore_errors=True)
+    return written
+
+
+def iter_chroma_records(client, batch_size: int = 1000):
+    """(ids, embeddings, texts, metadatas) batches of every collection, with the stored embeddings"""
+    for collection in client.list_collections():
+        name = getattr(collection, "name", collection)
+        if name.startswith("rebuild-"):
+            continue
+        collection = client.get_collection(name)
+        offset = 0
+        while True:
+            batch = collection.get(include=["embeddings", "documents", "metadatas"], limit=batch_size, offset=offset)
+            if not batch["ids"]:
+                break
+            yield batch["ids"], batch["embeddings"], batch["documents"], [m or {} for m in batch["metadatas"]]
+            offset += len(batch["ids"])
+
+
+def convert_kb_embeddings(dtype: str, model_id: str, batch_size: int = 500, dry_run: bool = False) -> Dict[str, int]:
+    """
+    Re-encode KnowledgeBase.embedding blobs (legacy raw float32 or any codec
+    dtype) into the given dtype
+
+    Returns:
+        Counts of converted, skipped (already in the target format) and total rows
+    """
+    from sqlalchemy import inspect
+    from sqlmodel import Session, select
+
+    from database import engine
+    from models_sql import KnowledgeBase
+    from utils_embedding_codec import decode_embedding, encode_embedding, read_embedding_header
+
+    counts = {"total": 0, "converted": 0, "skipped": 0, "bytes_before": 0, "bytes_after": 0}
+    if not inspect(engine).has_table(KnowledgeBase.__tablename__):
+        return counts
+    last_id = 0
+    while True:
+        with Session(engine) as session:
+            rows = session.exec(
+                select(KnowledgeBase).where(KnowledgeBase.id > last_id, KnowledgeBase.embedding.is_not(None))
+                .order_by(KnowledgeBase.id).limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            for row in rows:
+                counts["total"] += 1
+                header = read_embedding_header(row.embedding)
+                counts["bytes_before"] += len(row.embedding)
+                if header is not None and header.dtype == dtype and header.model_id == model_id:
+                    counts["skipped"] += 1
+                    counts["bytes_after"] += len(row.embedding)
+                    continue
+                blob = encode_embedding(decode_embedding(row.embedding), dtype, model_id)
+                counts["converted"] += 1
+                counts["bytes_after"] += len(blob)
+                if not dry_run:
+                    row.embedding = blob
+                    session.add(row)
+            if not dry_run:
+                session.commit()
+            last_id = rows[-1].id
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect, rebuild and convert the vector index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("info", help="Show collections, sizes and HNSW settings")
+    rebuild = subparsers.add_parser("rebuild", help="Rebuild (and compact) collections with the configured settings")
+    rebuild.add_argument("--collection", help="Collection to rebuild (default: all)")
+    rebuild.add_argument("--batch-size", type=int, default=1000)
+    shard = subparsers.add_parser("shard", help="Move the unsharded collection into the shard collections")
+    shard.add_argument("--shard-by", default=CHROMA_SHARD_BY, help="Metadata key (default: CHROMA_SHARD_BY)")
+    shard.add_argument("--batch-size", type=int, default=1000)
+    convert = subparsers.add_parser("convert-index", help="Copy the stored embeddings into a NumPy index of another dtype")
+    convert.add_argument("--dtype", required=True, choices=("float32", "float16", "int8", "binary"))
+    convert.add_argument("--from", dest="source", choices=("chroma", "numpy"), default="numpy")
+    convert.add_argument("--no-rescore", action="store_true", help="Do not keep float32 rows for rescoring")
+    convert.add_argument("--output", help="Index directory to write (default: NUMPY_INDEX_DIR)")
+    convert.add_argument("--batch-size", type=int, default=1000)
+    convert_kb = subparsers.add_parser("convert-kb", help="Re-encode knowledge_base.embedding blobs")
+    convert_kb.add_argument("--dtype", required=True, choices=("float32", "float16", "int8", "binary"))
+    convert_kb.add_argument("--model-id", default="", help="Embedding model recorded in the blob header")
+    convert_kb.add_argument("--batch-size", type=int, default=500)
+    convert_kb.add_argument("--dry-run", action="store_true", help="Only report the sizes")
+    args = parser.parse_args()
+
+    from utils_chroma import CHROMA_PERSIST_DIR, NUMPY_INDEX_DIR, VECTOR_BACKEND, persist_dir_writer
+
+    if args.command == "convert-kb":
+        counts = convert_kb_embeddings(args.dtype, args.model_id, args.batch_size, args.dry_run)
+        ratio = counts["bytes_before"] / counts["bytes_after"] if counts["bytes_after"] else 1.0
+        print(f"{'🔍 Would convert' if args.dry_run else '✅ Converted'} {counts['converted']} of {counts['total']} "
+              f"embeddings ({counts['skipped']} already {args.dtype}); "
+              f"{counts['bytes_before']} -> {counts['bytes_after']} bytes ({ratio:.1f}x)")
+        return
+
+    if args.command == "convert-index":
+        output = os.path.abspath(args.output or NUMPY_INDEX_DIR)
+        with persist_dir_writer():
+            if args.source == "chroma":
+                import chromadb
+
+                batches = iter_chroma_records(chromadb.PersistentClient(path=CHROMA_PERSIST_DIR), args.batch_size)
+            else:
+                from utils_numpy_store import NumpyVectorStore
+
+                # Exported in one piece: the source directory may be the output
+                batches = [NumpyVectorStore(NUMPY_INDEX_DIR).export_rows()]
+            written = convert_to_numpy_index(batches, output, args.dtype, not args.no_rescore)
+        print(f"✅ Converted {written} records into {output} ({args.dtype})")
+        return
+
+    if VECTOR_BACKEND == "numpy":
+        from utils_numpy_store import NumpyVectorStore
+
+        print(f"📁 NumPy index directory: {NUMPY_INDEX_DIR}")
+        if args.command == "info":
+            store = NumpyVectorStore(NUMPY_INDEX_DIR)
+            footprint = store.memory_footprint()
+            print(f"  {store.live_count()} live records of {store.count} rows, dtype {store.dtype}, "
+                  f"rescore {store.rescore}")
+            print(f"  search codes {footprint['resident_bytes']} bytes, rescoring rows {footprint['rescore_bytes']} bytes")
+            return
+        with persist_dir_writer():
+            print(f"✅ Compacted: {NumpyVectorStore(NUMPY_INDEX_DIR).compact()} records")
+        return
+
+    import chromadb
+
+    print(f"📁 Persist directory: {CHROMA_PERSIST_DIR}")
+    if args.command == "info":
+        client = chromadb.PersistentClient(path=CHROMA_PERSIST_DIR)
+        for row in describe_collections(client):
+            stale = {
+                key for key in ("M", "ef_construction", "space")
+                if row["actual"][key] is not None and row["actual"][key] != row["configured"][key]
+            }
+            print(f"  {row['name']}: {row['count']} records")
+            print(f"    actual:     {row['actual']}")
+            print(f"    configured: {row['configured']}" + (" (rebuild to apply)" if stale else ""))
+        return
+
+    if args.command == "shard":
+        if not args.shard_by:
+            parser.error("--shard-by is required when CHROMA_SHARD_BY is not set")
+        with persist_dir_writer():
+            moved = shard_collection(chromadb.PersistentClient(path=CHROMA_PERSIST_DIR), args.shard_by, args.batch_size)
+        for name, count in sorted(moved.items()):
+            print(f"✅ {name}: {count} records")
+        print(f"✅ Moved {sum(moved.values())} records into {len(moved)} shards" if moved
+              else f"Nothing to move: no '{COLLECTION_NAME}' collection")
+        return
+
+    # Hold the writer lock so running workers do not write mid-rebuild; they
+    # reopen the index once the generation is bumped
+    with persist_dir_writer():
+        client = chromadb.PersistentClient(path=CHROMA_PERSIST_DIR)
+        names = [args.collection] if args.collection else [
+            getattr(c, "name", c) for c in client.list_collections() if not getattr(c, "name", c).startswith("rebuild-")
+        ]
+        for name in names:
+            copied = rebuild_collection(client, name, args.batch_size)
+            print(f"✅ Rebuilt {name}: {copied} records")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,11 @@ interface ModelConfig {
   api_key_env: string;
   base_url?: string;
   model_type: string;
+  // 最近一次后台健康探测
+  status?: 'success' | 'error' | 'unknown';
+  latency_ms?: number | null;
+  checked_at?: string | null;
+  error?: string | null;
 }
 
 interface ChatMessage {
@@ -17,6 +22,26 @@ interface ChatRequest {
   message: string;
   conversation_id?: string;
   model_name?: string;
+  prompt_name?: string;
+  include_timings?: boolean;
+}
+
+interface PromptInfo {
+  name: string;
+  title: string;
+  version?: string;
+  language?: string;
+  sha256: string;
+  modified: string;
+  token_counts: Record<string, number | null>;
+}
+
+interface PromptUsage {
+  llm_calls: number;
+  prompt_tokens: number;
+  cached_prompt_tokens: number;
+  uncached_prompt_tokens: number;
+  completion_tokens: number;
 }
 
 interface ChatResponse {
@@ -24,6 +49,8 @@ interface ChatResponse {
   conversation_id: string;
   model_used: string;
   timestamp: string;
+  usage?: PromptUsage;
+  timings?: Record<string, number>;
 }
 
 class ApiService {
@@ -98,6 +125,11 @@ class ApiService {
     return this.request<ModelConfig[]>('/models');
   }
 
+  // 获取可用提示词
+  async getPrompts(): Promise<PromptInfo[]> {
+    return this.request<PromptInfo[]>('/prompts');
+  }
+
   // 发送聊天消息
   async sendMessage(request: ChatRequest): Promise<ChatResponse> {
     return this.request<ChatResponse>('/chat', {
@@ -124,11 +156,11 @@ class ApiService {
   }
 
   // 测试模型
-  async testModel(modelName: string): Promise<any> {
-    return this.request<any>(`/test-model/${modelName}`);
+  async testModel(modelName: string, refresh = false): Promise<any> {
+    return this.request<any>(`/test-model/${modelName}${refresh ? '?refresh=true' : ''}`);
   }
 }
 
 // 导出单例实例
 export const apiService = new ApiService();
-export type { ModelConfig, ChatMessage, ChatRequest, ChatResponse };
+export type { ModelConfig, ChatMessage, ChatRequest, ChatResponse, PromptInfo, PromptUsage };
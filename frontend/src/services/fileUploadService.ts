@@ -6,6 +6,61 @@ export interface UploadResponse {
   file_id: number
   filename: string
   size: number
+  sha256?: string
+}
+
+export interface UploadSession {
+  upload_id: string
+  filename: string
+  size: number
+  part_size: number
+  parts: number
+  received: number[]
+}
+
+export type UploadProgressCallback = (progress: number) => void
+
+// Files above this size go through the resumable chunked upload
+const CHUNKED_UPLOAD_THRESHOLD = 16 * 1024 * 1024
+const UPLOAD_PART_SIZE = 8 * 1024 * 1024
+const UPLOAD_PARALLEL_PARTS = 4
+const UPLOAD_PART_RETRIES = 3
+// Upload sessions by file, so a retried or reloaded upload resumes instead of restarting
+const UPLOAD_SESSIONS_KEY = 'infopop-upload-sessions'
+
+async function ensureOk(response: Response): Promise<Response> {
+  if (!response.ok) {
+    const error = await response.json().catch(() => ({}))
+    throw new Error(error.detail || `HTTP ${response.status}: ${response.statusText}`)
+  }
+  return response
+}
+
+async function sha256Hex(data: ArrayBuffer): Promise<string> {
+  const digest = await crypto.subtle.digest('SHA-256', data)
+  return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('')
+}
+
+function fileKey(file: File): string {
+  return `${file.name}:${file.size}:${file.lastModified}`
+}
+
+function loadSessionIds(): Record<string, string> {
+  try {
+    return JSON.parse(localStorage.getItem(UPLOAD_SESSIONS_KEY) || '{}')
+  } catch {
+    return {}
+  }
+}
+
+function saveSessionId(file: File, uploadId: string | null) {
+  const sessions = loadSessionIds()
+  if (uploadId) {
+    sessions[fileKey(file)] = uploadId
+  } else {
+    delete sessions[fileKey(file)]
+  }
+  localStorage.setItem(UPLOAD_SESSIONS_KEY, JSON.stringify(sessions))
 }
 
 export interface DocumentInfo {
@@ -16,7 +71,11 @@ export interface DocumentInfo {
 
 export class FileUploadService {
   
-  static async uploadFile(file: File): Promise<UploadResponse> {
+  static async uploadFile(file: File, onProgress?: UploadProgressCallback): Promise<UploadResponse> {
+    if (file.size > CHUNKED_UPLOAD_THRESHOLD) {
+      return await this.uploadFileChunked(file, onProgress)
+    }
+
     const formData = new FormData()
     formData.append('file', file)
     
@@ -32,6 +91,77 @@ export class FileUploadService {
     
     return await response.json()
   }
+
+  // Resumable upload: parts are sent in parallel with their sha256; an
+  // interrupted upload of the same file continues with the missing parts
+  static async uploadFileChunked(file: File, onProgress?: UploadProgressCallback): Promise<UploadResponse> {
+    const session = await this.resumeOrCreateUpload(file)
+    saveSessionId(file, session.upload_id)
+
+    const received = new Set(session.received)
+    const pending = Array.from({ length: session.parts }, (_, part) => part).filter(part => !received.has(part))
+    let uploadedBytes = session.received.reduce(
+      (total, part) => total + Math.min(session.part_size, session.size - part * session.part_size), 0
+    )
+    const report = () => onProgress?.(session.size ? Math.round(uploadedBytes / session.size * 99) : 99)
+    report()
+
+    const worker = async () => {
+      let part: number | undefined
+      while ((part = pending.shift()) !== undefined) {
+        const data = await file.slice(part * session.part_size, (part + 1) * session.part_size).arrayBuffer()
+        await this.uploadPart(session.upload_id, part, data)
+        uploadedBytes += data.byteLength
+        report()
+      }
+    }
+    await Promise.all(Array.from({ length: UPLOAD_PARALLEL_PARTS }, worker))
+
+    // The server hashes the assembled file and indexes it
+    const response = await ensureOk(await fetch(`${API_BASE_URL}/uploads/${session.upload_id}/complete`, {
+      method: 'POST'
+    }))
+    saveSessionId(file, null)
+    onProgress?.(100)
+    return await response.json()
+  }
+
+  static async resumeOrCreateUpload(file: File): Promise<UploadSession> {
+    const uploadId = loadSessionIds()[fileKey(file)]
+    if (uploadId) {
+      const response = await fetch(`${API_BASE_URL}/uploads/${uploadId}`)
+      if (response.ok) {
+        return await response.json()
+      }
+      // Expired or completed: start over
+      saveSessionId(file, null)
+    }
+    const response = await ensureOk(await fetch(`${API_BASE_URL}/uploads`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ filename: file.name, size: file.size, part_size: UPLOAD_PART_SIZE })
+    }))
+    return await response.json()
+  }
+
+  static async uploadPart(uploadId: string, part: number, data: ArrayBuffer): Promise<void> {
+    const checksum = await sha256Hex(data)
+    for (let attempt = 1; ; attempt++) {
+      try {
+        await ensureOk(await fetch(`${API_BASE_URL}/uploads/${uploadId}/parts/${part}`, {
+          method: 'PUT',
+          headers: { 'X-Part-SHA256': checksum },
+          body: data
+        }))
+        return
+      } catch (error) {
+        if (attempt >= UPLOAD_PART_RETRIES) {
+          throw error
+        }
+        await new Promise(resolve => setTimeout(resolve, 500 * attempt))
+      }
+    }
+  }
   
   static async getDocuments(): Promise<DocumentInfo[]> {
     const response = await fetch(`${API_BASE_URL}/documents`)